@@ -0,0 +1,53 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from salary_processor import TimesheetEmployeeProcessor
+
+def generate_timesheets(rows: int, employees: int = 200000, days: int = 365, seed: int = 0) -> pd.DataFrame:
+    """Generate random timesheet data with duplicate (employee_id, date) records.
+
+    Args:
+        rows: Number of timesheet rows.
+        employees: Number of distinct employee IDs.
+        days: Number of distinct dates, starting at 2019-01-01.
+        seed: Seed of the random generator.
+
+    Returns:
+        pd.DataFrame: Timesheet data with timesheet_id, employee_id and date columns.
+    """
+    generator = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'timesheet_id': generator.permutation(rows).astype(np.int64),
+        'employee_id': generator.integers(1, employees + 1, rows, dtype=np.int64),
+        'date': np.datetime64('2019-01-01', 'ns') + generator.integers(0, days, rows).astype('timedelta64[D]'),
+    })
+
+def benchmark(rows: int) -> dict:
+    """Time both deduplication engines on generated timesheet data and check they keep the same rows.
+
+    Args:
+        rows: Number of timesheet rows.
+
+    Returns:
+        dict: Rows, seconds per engine and speedup of the sort engine.
+    """
+    data = generate_timesheets(rows)
+    seconds, results = {}, {}
+    for engine in ('groupby', 'sort'):
+        start = time.perf_counter()
+        results[engine] = TimesheetEmployeeProcessor(data, copy=False)\
+            .remove_duplicate_data(partitioning_keys=['employee_id', 'date'], ordering_key='timesheet_id', engine=engine)\
+            .get_data()
+        seconds[engine] = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(results['groupby'], results['sort'])
+    return {'rows': rows, **seconds, 'speedup': seconds['groupby'] / seconds['sort']}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark deduplication engines of remove_duplicate_data.')
+    parser.add_argument('rows', type=int, nargs='*', default=[10000000, 100000000], help='Number of rows per run.')
+    for rows in parser.parse_args().rows:
+        result = benchmark(rows)
+        print(f"{result['rows']:>12,} rows: groupby {result['groupby']:.2f}s, sort {result['sort']:.2f}s, speedup {result['speedup']:.1f}x")
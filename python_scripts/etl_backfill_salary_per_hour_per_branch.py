@@ -0,0 +1,86 @@
+import argparse
+import pandas as pd
+from datetime import datetime, timedelta
+from typing import Callable
+from sqlalchemy.exc import SQLAlchemyError
+
+from salary_processor import (
+    TimesheetEmployeeProcessor, EMPLOYEE_SCHEMA, TIMESHEET_SCHEMA,
+    backfill_by_month, generate_increment_data_query, load_data_to_table,
+)
+
+# Employee and Timesheet CSV Pathfile
+employee_pathfile = '../data/employees.csv'
+timesheet_pathfile = '../data/timesheets.csv'
+
+# Directory for columnar cache of CSV files
+cache_dirpath = '../data/.cache'
+
+# Timesheet date processed by the daily run, its month is left to the daily run
+process_date = (datetime.today() - timedelta(days=1)).date()
+
+def calculate_month(timesheets: pd.DataFrame, employees: pd.DataFrame) -> pd.DataFrame:
+    """Calculate salary per hour for each branch of the timesheets of a month, run in worker process.
+
+    Args:
+        timesheets: Timesheet rows of the month.
+        employees: Deduplicated employee data, shared by all months.
+
+    Returns:
+        pd.DataFrame: Year, month, branch_id and salary_per_hour.
+    """
+    return TimesheetEmployeeProcessor(timesheets, copy=False, work_time_unit='second')\
+        .remove_duplicate_data(partitioning_keys=['employee_id', 'date'], ordering_key='timesheet_id')\
+        .merge_data(employees, left_on='employee_id', right_on='employe_id', engine='lookup')\
+        .filter_valid_data()\
+        .aggregate_salary_per_hour()\
+        .select_fields(['year', 'month', 'branch_id', 'salary_per_hour'])\
+        .get_data()
+
+def run(start: str = None, end: str = None, workers: int = None, load: Callable[[str], None] = load_data_to_table) -> pd.DataFrame:
+    """Backfill salary per hour of past months, every (year, month) is calculated in parallel by a process pool.
+
+    The month of the daily run is left to the daily run, which keeps its month-to-date state.
+
+    Args:
+        start: First month, e.g. '2019-08'. If not set, the first month of the timesheets.
+        end: Last month, e.g. '2020-12'. If not set, the month before the month of the daily run.
+        workers: Number of worker processes. If not set, the number of CPUs is used.
+        load: Function executing the query in the database.
+
+    Returns:
+        pd.DataFrame: The loaded salary per hour data.
+    """
+    # Retrieve and clean employee data once, it is shared read-only with the workers
+    employee_data = TimesheetEmployeeProcessor()\
+        .load_data_from_csv(employee_pathfile, schema=EMPLOYEE_SCHEMA, cache_dir=cache_dirpath)\
+        .compact_dtypes()\
+        .remove_duplicate_data(partitioning_keys=['employe_id', 'branch_id'], ordering_key='salary', ascending_order=False)\
+        .get_data()
+
+    timesheet_data = TimesheetEmployeeProcessor()\
+        .load_data_from_csv(timesheet_pathfile, schema=TIMESHEET_SCHEMA, cache_dir=cache_dirpath)\
+        .compact_dtypes()\
+        .get_data()
+
+    start = pd.Period(start or timesheet_data['date'].min(), freq='M')
+    end = pd.Period(end, freq='M') if end else pd.Period(process_date, freq='M') - 1
+    months = [(period.year, period.month) for period in pd.period_range(start, end, freq='M')]
+    salary_per_hour_data = backfill_by_month(timesheet_data, employee_data, calculate_month, months=months, workers=workers)
+
+    # Loading data into table, replacing the rows of the backfilled months
+    if len(salary_per_hour_data):
+        load(generate_increment_data_query(salary_per_hour_data, replace=True))
+    return salary_per_hour_data
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill salary per hour per branch of past months in parallel.')
+    parser.add_argument('--start', help='First month, e.g. 2019-08. If not set, the first month of the timesheets.')
+    parser.add_argument('--end', help='Last month, e.g. 2020-12. If not set, the month before the month of the daily run.')
+    parser.add_argument('--workers', type=int, help='Number of worker processes. If not set, the number of CPUs.')
+    args = parser.parse_args()
+
+    try:
+        run(args.start, args.end, args.workers)
+    except SQLAlchemyError as err:
+        print('Error', err.__cause__)
@@ -0,0 +1,81 @@
+import pandas as pd
+from typing import Callable
+from sqlalchemy.exc import SQLAlchemyError
+
+from salary_processor import (
+    TimesheetEmployeeProcessor, EMPLOYEE_SCHEMA, TIMESHEET_SCHEMA,
+    drop_month_state, last_folded_date, generate_delete_data_query, generate_increment_data_query, load_data_to_table,
+)
+
+# Employee and Timesheet CSV Pathfile
+employee_pathfile = '../data/employees.csv'
+timesheet_pathfile = '../data/timesheets.csv'
+
+# Directory for columnar cache of CSV files
+cache_dirpath = '../data/.cache'
+
+# SQLite month-to-date state of work seconds and salaries, folded by every daily run
+month_state_pathfile = '../data/.state/month_to_date.sqlite'
+
+# SQLite fingerprints of the input rows of every (year, month, branch_id) partition written by earlier runs
+partition_fingerprint_pathfile = '../data/.state/partition_fingerprints.sqlite'
+
+def run(load: Callable[[str], None] = load_data_to_table) -> pd.DataFrame:
+    """Recompute only partitions whose rows changed since the last run, e.g. by late timesheets or corrected salaries.
+
+    Run it after the daily run, the month-to-date state of recomputed months is replaced by their recomputed totals.
+    Only dates already folded by the daily run are recomputed, so the daily run does not fold later dates twice.
+    The fingerprints are only saved once `load` succeeds.
+
+    Args:
+        load: Function executing the query in the database.
+
+    Returns:
+        pd.DataFrame: The loaded salary per hour data of the changed partitions, or None if no date was folded yet.
+    """
+    folded_until = last_folded_date(month_state_pathfile)
+    if folded_until is None:
+        print('No date was folded by the daily run yet')
+        return None
+
+    # Retrieve and clean employee data
+    employee_processor = TimesheetEmployeeProcessor(lazy=True)\
+        .load_data_from_csv(employee_pathfile, schema=EMPLOYEE_SCHEMA, cache_dir=cache_dirpath)\
+        .compact_dtypes()\
+        .remove_duplicate_data(partitioning_keys=['employe_id', 'branch_id'], ordering_key='salary', ascending_order=False)
+
+    # Clean all timesheet data, join it with employee data and calculate salary per hour of the changed partitions only
+    processor = TimesheetEmployeeProcessor(lazy=True, work_time_unit='second')\
+        .load_data_from_csv(timesheet_pathfile, schema=TIMESHEET_SCHEMA, cache_dir=cache_dirpath)\
+        .compact_dtypes()\
+        .remove_duplicate_data(partitioning_keys=['employee_id', 'date'], ordering_key='timesheet_id')\
+        .filter_timesheets_until(folded_until)\
+        .merge_data(employee_processor, left_on='employee_id', right_on='employe_id', engine='lookup')\
+        .filter_valid_data()\
+        .filter_changed_partitions(partition_fingerprint_pathfile)\
+        .aggregate_salary_per_hour(month_state=month_state_pathfile, replace_month_state=True)\
+        .select_fields(['year', 'month', 'branch_id', 'salary_per_hour'])
+    salary_per_hour_data = processor.get_data()
+
+    # Rewrite the changed partitions, and delete partitions without rows anymore
+    changes = processor.partition_changes['changes']
+    removed = changes.loc[changes['status'] == 'removed']
+    queries = []
+    if len(removed):
+        queries.append(generate_delete_data_query(removed))
+    if len(salary_per_hour_data):
+        queries.append(generate_increment_data_query(salary_per_hour_data, replace=True))
+
+    if queries:
+        load('; '.join(queries))
+
+        # Save fingerprints only once the partitions are written, so a failed write is recomputed by the next run
+        drop_month_state(removed, month_state_pathfile)
+        processor.save_partition_fingerprints()
+    return salary_per_hour_data
+
+if __name__ == '__main__':
+    try:
+        run()
+    except SQLAlchemyError as err:
+        print('Error', err.__cause__)
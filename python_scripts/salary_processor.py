@@ -0,0 +1,3743 @@
+import pandas as pd
+import numpy as np
+from typing import Union, List, Callable, Iterator
+from sqlalchemy import create_engine, text
+import os
+import io
+import json
+import glob
+import pickle
+import sqlite3
+import shutil
+import hashlib
+import tempfile
+import inspect
+import copy
+import functools
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # Columnar cache is disabled if pyarrow is not installed
+    pa = pq = None
+
+# Declared schemas for reading CSV files with typed columns.
+# `date` columns are parsed into datetime64 and `time` columns (HH:MM:SS) into seconds since midnight.
+EMPLOYEE_SCHEMA = {
+    'employe_id': 'int64',
+    'branch_id': 'int64',
+    'salary': 'int64',
+    'join_date': 'date',
+    'resign_date': 'date',
+}
+TIMESHEET_SCHEMA = {
+    'timesheet_id': 'int64',
+    'employee_id': 'int64',
+    'date': 'date',
+    'checkin': 'time',
+    'checkout': 'time',
+}
+
+# Columns read by the filter steps of a lazy plan, a filter is pushed below steps not touching these columns
+PLAN_FILTER_COLUMNS = {
+    'filter_timesheets_by_date': {'date'},
+    'filter_timesheets_until': {'date'},
+    'filter_valid_data': {'date', 'resign_date'},
+    'filter_partitions': {'date', 'branch_id'},
+}
+
+# Input and output columns of the aggregation steps of a lazy plan
+PLAN_AGGREGATE_COLUMNS = {
+    'sum_work_hour': ({'date', 'branch_id', 'work_hour'}, ['year', 'month', 'branch_id', 'total_work_hour']),
+    'get_salary_per_employee': ({'date', 'branch_id', 'employee_id', 'salary'}, ['year', 'month', 'branch_id', 'employee_id', 'salary_per_month']),
+    'sum_salary_per_branch': ({'year', 'month', 'branch_id', 'salary_per_month'}, ['year', 'month', 'branch_id', 'total_salary']),
+    'aggregate_salary_per_hour': (
+        {'date', 'branch_id', 'employee_id', 'salary', 'checkin', 'checkout'},
+        ['year', 'month', 'branch_id', 'total_work_hour', 'total_salary', 'salary_per_hour'],
+    ),
+}
+
+# Loaders of a lazy plan that can read only a subset of columns and only the rows of a date
+PLAN_PRUNABLE_LOADERS = ('load_data_from_csv', 'load_data_from_partitions')
+
+# Number of spill files every level of out-of-core deduplication hash-partitions rows into
+SPILL_FANOUT = 64
+
+# Keys of the group index shared by the aggregation methods, most significant first. `date` groups by year and month
+GROUP_INDEX_KEYS = ['date', 'branch_id', 'employee_id']
+
+# Columns of the cleaned employee timesheet rows feeding the salary per hour of a (year, month, branch_id) partition
+PARTITION_FINGERPRINT_COLUMNS = ['employee_id', 'date', 'checkin', 'checkout', 'salary']
+
+# Number of group indexes cached per processor
+GROUP_INDEX_CACHE_SIZE = 4
+
+# Compact dtype plan used by `TimesheetEmployeeProcessor.compact_dtypes`.
+# IDs are narrowed to int32, `branch_id` is categorical and time columns are nullable int32 seconds since midnight.
+COMPACT_DTYPE_PLAN = {
+    'timesheet_id': 'int32',
+    'employee_id': 'int32',
+    'employe_id': 'int32',
+    'branch_id': 'category',
+    'checkin': 'Int32',
+    'checkout': 'Int32',
+}
+
+def _read_csv_options(schema: dict = None) -> dict:
+    """Build `pd.read_csv` options for a declared schema.
+
+    Args:
+        schema: Declared column types. E.g. `TIMESHEET_SCHEMA`.
+
+    Returns:
+        dict: Keyword arguments for `pd.read_csv`.
+    """
+    if schema is None:
+        return {}
+
+    # Date and time columns are read as string and converted in `apply_schema`
+    dtype = {
+        column: str if column_type in ('date', 'time') else column_type
+        for column, column_type in schema.items()
+    }
+    return {'dtype': dtype}
+
+def _fixed_width_digits(texts: np.ndarray, width: int, separators: dict) -> tuple:
+    """Decode fixed-width strings into digits with NumPy.
+
+    Args:
+        texts: Unicode array of strings.
+        width: Expected length of every string.
+        separators: Expected separator character per position. E.g. {2: ':', 5: ':'}.
+
+    Returns:
+        tuple: Digits per position as int array of shape (len(texts), width), and mask of strings matching the format.
+    """
+    valid = np.char.str_len(texts) == width
+    try:
+        raw = texts.astype(f'S{width}')
+    except UnicodeEncodeError:
+        return np.zeros((len(texts), width), dtype=np.int64), np.zeros(len(texts), dtype=bool)
+
+    digits = np.frombuffer(raw.tobytes(), dtype=np.uint8).reshape(-1, width).astype(np.int64) - ord('0')
+    for position in range(width):
+        if position in separators:
+            valid &= digits[:, position] == ord(separators[position]) - ord('0')
+        else:
+            valid &= (digits[:, position] >= 0) & (digits[:, position] <= 9)
+    return digits, valid
+
+def _parse_unique_values(values: pd.Series, parse: Callable[[np.ndarray], np.ndarray], missing_value) -> np.ndarray:
+    """Parse only unique values of a column, then map them back through their codes.
+
+    Args:
+        values: Column to be parsed.
+        parse: Function that parses an array of unique values.
+        missing_value: Value for missing values.
+
+    Returns:
+        np.ndarray: Parsed value of every row.
+    """
+    codes, uniques = pd.factorize(values)
+    parsed = parse(np.asarray(uniques, dtype=object))
+    return np.append(parsed, np.array([missing_value], dtype=parsed.dtype))[codes]
+
+def parse_time_seconds(values: pd.Series) -> pd.Series:
+    """Parse HH:MM:SS values into nullable int32 seconds since midnight.
+
+    Values not matching HH:MM:SS are parsed with `pd.to_timedelta`, invalid values become missing.
+
+    Args:
+        values: Time values as strings, or seconds since midnight.
+
+    Returns:
+        pd.Series: Seconds since midnight as Int32.
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype('Int32')
+
+    def parse(uniques: np.ndarray) -> np.ndarray:
+        digits, valid = _fixed_width_digits(uniques.astype(str), 8, {2: ':', 5: ':'})
+        seconds = (digits[:, 0] * 10 + digits[:, 1]) * 3600 + (digits[:, 3] * 10 + digits[:, 4]) * 60 + digits[:, 6] * 10 + digits[:, 7]
+        valid &= (digits[:, 3] < 6) & (digits[:, 6] < 6)
+        seconds = np.where(valid, seconds, np.nan)
+        if not valid.all():
+            seconds[~valid] = pd.to_timedelta(pd.Series(uniques[~valid]), errors='coerce').dt.total_seconds().to_numpy()
+        return seconds
+
+    seconds = _parse_unique_values(values, parse, np.nan)
+    return pd.Series(seconds, index=values.index, name=values.name).astype('Int32')
+
+def parse_dates(values: pd.Series) -> pd.Series:
+    """Parse YYYY-MM-DD values into datetime64.
+
+    Values not matching YYYY-MM-DD, or with a year outside 1678-2261, are parsed one by one with `pd.to_datetime`.
+    Invalid values and dates outside the datetime64[ns] range become NaT.
+
+    Args:
+        values: Date values as strings, or datetime values.
+
+    Returns:
+        pd.Series: Dates as datetime64.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+
+    def parse(uniques: np.ndarray) -> np.ndarray:
+        digits, valid = _fixed_width_digits(uniques.astype(str), 10, {4: '-', 7: '-'})
+        year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+        month = digits[:, 5] * 10 + digits[:, 6]
+        day = digits[:, 8] * 10 + digits[:, 9]
+        valid &= (month >= 1) & (month <= 12) & (day >= 1)
+
+        # Years outside datetime64[ns] would wrap around, they are left to the fallback
+        valid &= (year >= 1678) & (year <= 2261)
+
+        # Build dates from months since epoch plus days, then drop days overflowing into the next month
+        months = np.where(valid, (year - 1970) * 12 + month - 1, 0).astype('datetime64[M]')
+        dates = months.astype('datetime64[D]') + np.where(valid, day - 1, 0).astype('timedelta64[D]')
+        valid &= dates.astype('datetime64[M]') == months
+        dates = np.where(valid, dates, np.datetime64('NaT')).astype('datetime64[ns]')
+        if not valid.all():
+            fallback = pd.to_datetime(pd.Series(uniques[~valid]), format='mixed', errors='coerce')
+            fallback = fallback.where(fallback.between(pd.Timestamp.min, pd.Timestamp.max))
+            dates[~valid] = fallback.to_numpy(dtype='datetime64[ns]')
+        return dates
+
+    dates = _parse_unique_values(values, parse, np.datetime64('NaT'))
+    return pd.Series(dates, index=values.index, name=values.name)
+
+def work_seconds(checkin: pd.Series, checkout: pd.Series) -> np.ndarray:
+    """Calculate the work time of every row in whole seconds.
+
+    Work time is 0 if checkin is greater than checkout or one of them is missing.
+
+    Args:
+        checkin: Checkin as integer seconds since midnight.
+        checkout: Checkout as integer seconds since midnight.
+
+    Returns:
+        np.ndarray: Work time as int64 seconds.
+    """
+    missing = checkin.isna().to_numpy() | checkout.isna().to_numpy()
+    seconds = checkout.to_numpy(dtype=np.int64, na_value=0) - checkin.to_numpy(dtype=np.int64, na_value=0)
+    seconds[missing | (seconds < 0)] = 0
+    return seconds
+
+def salary_per_hour(total_salary: pd.Series, total_work_time: pd.Series, unit: str = 'hour') -> np.ndarray:
+    """Divide total salary by total work time and round it into 2 decimal, 0 if there is no work time.
+
+    Args:
+        total_salary: Total salary.
+        total_work_time: Total work time in `unit`.
+        unit: 'hour' for float hours, or 'second' for integer seconds, which are divided only once here.
+
+    Returns:
+        np.ndarray: Salary per hour.
+    """
+    if unit == 'second':
+        hourly = total_salary * 3600 / total_work_time
+    else:
+        hourly = total_salary / total_work_time
+    return np.where(total_work_time == 0, 0, np.round(hourly, 2))
+
+def apply_schema(df: pd.DataFrame, schema: dict = None) -> pd.DataFrame:
+    """Convert `date` and `time` columns of a dataframe based on declared schema.
+
+    Args:
+        df: Dataframe read with `_read_csv_options(schema)`.
+        schema: Declared column types. E.g. `TIMESHEET_SCHEMA`.
+
+    Returns:
+        pd.DataFrame: Dataframe with typed columns.
+    """
+    if schema is None:
+        return df
+
+    for column, column_type in schema.items():
+        if column not in df.columns:
+            continue
+        if column_type == 'date':
+            df[column] = parse_dates(df[column])
+        elif column_type == 'time':
+            df[column] = parse_time_seconds(df[column])
+    return df
+
+def concat_data(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate dataframes, keeping columns categorical even if their categories differ.
+
+    Args:
+        frames: Dataframes to be concatenated.
+
+    Returns:
+        pd.DataFrame: The concatenated dataframe.
+    """
+    frames = list(frames)
+    if not frames:
+        return pd.DataFrame()
+
+    data = pd.concat(frames, ignore_index=True)
+    for column in data.columns:
+        if isinstance(frames[0][column].dtype, pd.CategoricalDtype) and not isinstance(data[column].dtype, pd.CategoricalDtype):
+            data[column] = data[column].astype('category')
+    return data
+
+def _compact_column(values: pd.Series, dtype: str = None) -> pd.Series:
+    """Convert a column into its compact dtype.
+
+    Integer columns are only narrowed if every value fits, and string columns
+    without a planned dtype are stored as Arrow-backed strings.
+
+    Args:
+        values: Column to be converted.
+        dtype: Planned dtype of the column. E.g. 'int32', 'Int32' or 'category'.
+
+    Returns:
+        pd.Series: The converted column.
+    """
+    if dtype is None:
+        if values.dtype == object or (isinstance(values.dtype, pd.StringDtype) and values.dtype.storage != 'pyarrow'):
+            return values.astype(pd.StringDtype('pyarrow') if pa is not None else 'string')
+        return values
+
+    if dtype == 'category':
+        return values.astype('category')
+
+    if dtype in ('Int32', 'Int64'):
+        # Nullable integer columns hold seconds since midnight
+        values = parse_time_seconds(values)
+
+    limits = np.iinfo(pd.api.types.pandas_dtype(dtype).type)
+    if len(values) and (values.min() < limits.min or values.max() > limits.max):
+        return values
+    return values.astype(dtype)
+
+def read_csv(pathfile: str, delimiter: str = ',', schema: dict = None, chunksize: int = None, columns: List[str] = None) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """Read CSV file with typed columns based on declared schema.
+
+    Args:
+        pathfile: Pathfile for CSV file.
+        delimiter: Delimiter for reading CSV file.
+        schema: Declared column types. E.g. `TIMESHEET_SCHEMA`.
+        chunksize: Number of rows per chunk. If set, an iterator of chunks is returned.
+        columns: Only read these columns. If not set, all columns are read.
+
+    Returns:
+        Union[pd.DataFrame, Iterator[pd.DataFrame]]: The typed dataframe, or iterator of typed chunks.
+    """
+    read_options = _read_csv_options(schema)
+    if columns is not None:
+        read_options['usecols'] = columns
+        if 'dtype' in read_options:
+            read_options['dtype'] = {column: dtype for column, dtype in read_options['dtype'].items() if column in columns}
+    if chunksize is None:
+        return apply_schema(pd.read_csv(pathfile, delimiter=delimiter, **read_options), schema)
+
+    reader = pd.read_csv(pathfile, delimiter=delimiter, chunksize=chunksize, **read_options)
+    return (apply_schema(chunk, schema) for chunk in reader)
+
+def _hash_file(pathfile: str, block_size: int = 1 << 20) -> str:
+    """Calculate content hash of a file.
+
+    Args:
+        pathfile: Pathfile to be hashed.
+        block_size: Number of bytes read for every update.
+
+    Returns:
+        str: Hex digest of the file content.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(pathfile, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _source_metadata(pathfile: str, delimiter: str, schema: dict) -> dict:
+    """Describe a CSV file and how it is read, for detecting changes of the source.
+
+    Args:
+        pathfile: Pathfile for CSV file.
+        delimiter: Delimiter for reading CSV file.
+        schema: Declared column types. E.g. `TIMESHEET_SCHEMA`.
+
+    Returns:
+        dict: Source pathfile, read options, size and mtime of the CSV file.
+    """
+    stat = os.stat(pathfile)
+    return {
+        'source': os.path.abspath(pathfile),
+        'delimiter': delimiter,
+        'schema': schema,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+    }
+
+def _get_columnar_cache(pathfile: str, delimiter: str, schema: dict, cache_dir: str) -> Union[str, None]:
+    """Get Parquet cache of a CSV file, (re)building it if the CSV file has changed.
+
+    The cache is valid while the CSV file keeps the same size and mtime. If only the mtime
+    has changed, the content hash decides whether the cache can still be used.
+
+    Args:
+        pathfile: Pathfile for CSV file.
+        delimiter: Delimiter for reading CSV file.
+        schema: Declared column types. E.g. `TIMESHEET_SCHEMA`.
+        cache_dir: Directory for the Parquet files and their metadata.
+
+    Returns:
+        Union[str, None]: Pathfile of the Parquet cache, or None if pyarrow is not installed.
+    """
+    if pq is None:
+        return None
+
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_name = os.path.splitext(os.path.basename(pathfile))[0]
+    cache_pathfile = os.path.join(cache_dir, cache_name + '.parquet')
+    metadata_pathfile = cache_pathfile + '.json'
+
+    metadata = _source_metadata(pathfile, delimiter, schema)
+
+    # Check the existing cache, compare size and mtime first and only hash the file when the mtime changed
+    if os.path.exists(cache_pathfile) and os.path.exists(metadata_pathfile):
+        with open(metadata_pathfile) as file:
+            cached_metadata = json.load(file)
+        content_hash = cached_metadata.pop('hash', None)
+        if cached_metadata == metadata:
+            return cache_pathfile
+
+        same_source = all(cached_metadata.get(key) == metadata[key] for key in ('source', 'delimiter', 'schema', 'size'))
+        if same_source and content_hash == _hash_file(pathfile):
+            metadata['hash'] = content_hash
+            with open(metadata_pathfile, 'w') as file:
+                json.dump(metadata, file)
+            return cache_pathfile
+
+    # Build the cache chunk by chunk into a temporary file, then replace the old cache
+    temp_pathfile = cache_pathfile + '.tmp'
+    writer = None
+    try:
+        for chunk in read_csv(pathfile, delimiter=delimiter, schema=schema, chunksize=1000000):
+            table = pa.Table.from_pandas(chunk, schema=writer.schema if writer else None, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(temp_pathfile, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        # Empty CSV file, there is nothing to be cached
+        return None
+    os.replace(temp_pathfile, cache_pathfile)
+
+    metadata['hash'] = _hash_file(pathfile)
+    with open(metadata_pathfile, 'w') as file:
+        json.dump(metadata, file)
+    return cache_pathfile
+
+def read_columnar(pathfile: str, chunksize: int = None, columns: List[str] = None) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """Read Parquet file written by the columnar cache.
+
+    Args:
+        pathfile: Pathfile for Parquet file.
+        chunksize: Number of rows per chunk. If set, an iterator of chunks is returned.
+        columns: Only read these columns. If not set, all columns are read.
+
+    Returns:
+        Union[pd.DataFrame, Iterator[pd.DataFrame]]: The dataframe, or iterator of chunks.
+    """
+    if chunksize is None:
+        return pq.read_table(pathfile, columns=columns).to_pandas()
+    return (batch.to_pandas() for batch in pq.ParquetFile(pathfile).iter_batches(batch_size=chunksize, columns=columns))
+
+def _partition_dir(store_dir: str, date) -> str:
+    """Get hive-style partition directory of a date.
+
+    Args:
+        store_dir: Root directory of the partitioned store.
+        date: Date of the partition. E.g. '2020-01-01'.
+
+    Returns:
+        str: Partition directory. E.g. '<store_dir>/year=2020/month=1/date=2020-01-01'.
+    """
+    date = pd.Timestamp(date)
+    return os.path.join(store_dir, f'year={date.year}', f'month={date.month}', f"date={date.strftime('%Y-%m-%d')}")
+
+def build_partition_store(pathfile: str, store_dir: str, delimiter: str = ',', schema: dict = TIMESHEET_SCHEMA, chunksize: int = 1000000) -> None:
+    """Write timesheet CSV into a `year=/month=/date=` partitioned Parquet store.
+
+    Rows appended to the CSV since the last build are added into the store as new part files.
+    If the CSV was truncated or rewritten, the whole store is rebuilt.
+
+    Args:
+        pathfile: Pathfile for timesheet CSV file.
+        store_dir: Root directory of the partitioned store.
+        delimiter: Delimiter for reading CSV file.
+        schema: Declared column types, must declare `date` column as date.
+        chunksize: Number of rows read from the CSV file at once.
+    """
+    if pq is None:
+        raise ImportError('pyarrow is required for the partitioned timesheet store')
+
+    # Continue from the checkpoint of the last build if it was read with the same options
+    checkpoint = None
+    metadata_pathfile = os.path.join(store_dir, '_source.json')
+    if os.path.exists(metadata_pathfile):
+        with open(metadata_pathfile) as file:
+            metadata = json.load(file)
+        if metadata['delimiter'] == delimiter and metadata['schema'] == schema:
+            checkpoint = metadata.get('checkpoint')
+
+    data, checkpoint = read_appended_csv(pathfile, checkpoint, delimiter=delimiter, schema=schema, chunksize=chunksize)
+    if not checkpoint['full_rescan'] and checkpoint['start_offset'] == checkpoint['offset']:
+        return
+
+    # A full rescan is written into a temporary store, appended rows are written into the existing store
+    if checkpoint['full_rescan']:
+        target_dir = store_dir.rstrip(os.sep) + '.tmp'
+        if os.path.exists(target_dir):
+            shutil.rmtree(target_dir)
+        os.makedirs(target_dir)
+    else:
+        target_dir = store_dir
+
+    # Write every date of every chunk as its own part file, named by the byte offset where the rows start
+    schema_pathfile = os.path.join(target_dir, '_common_metadata')
+    table_schema = pq.read_schema(schema_pathfile) if os.path.exists(schema_pathfile) else None
+    for chunk_number, chunk in enumerate(data):
+        for date, rows in chunk.groupby('date', sort=False):
+            table = pa.Table.from_pandas(rows, schema=table_schema, preserve_index=False)
+            table_schema = table.schema
+            partition_dir = _partition_dir(target_dir, date)
+            os.makedirs(partition_dir, exist_ok=True)
+            pq.write_table(table, os.path.join(partition_dir, f"part-{checkpoint['start_offset']:012d}-{chunk_number:05d}.parquet"))
+
+    # Keep the schema for reading partitions that do not exist
+    if table_schema is not None and not os.path.exists(schema_pathfile):
+        pq.write_metadata(table_schema, schema_pathfile)
+    with open(os.path.join(target_dir, '_source.json'), 'w') as file:
+        json.dump({'delimiter': delimiter, 'schema': schema, 'checkpoint': checkpoint}, file)
+
+    # Replace the old store with the rebuilt one
+    if checkpoint['full_rescan']:
+        if os.path.exists(store_dir):
+            shutil.rmtree(store_dir)
+        os.replace(target_dir, store_dir)
+
+def _as_dates(date) -> List[pd.Timestamp]:
+    """Convert a date, or a set or range of dates, into sorted unique dates.
+
+    Args:
+        date: Date, or list, set or range of dates. E.g. '2020-01-01', ['2020-01-01', '2020-01-03']
+            or `pd.date_range('2020-01-01', '2020-01-07')`.
+
+    Returns:
+        List[pd.Timestamp]: Sorted unique dates at midnight.
+    """
+    if isinstance(date, (list, tuple, set, frozenset, pd.Index, np.ndarray, pd.Series)):
+        return sorted({pd.Timestamp(value).normalize() for value in date})
+    return [pd.Timestamp(date).normalize()]
+
+def read_partitions(store_dir: str, date=None, chunksize: int = None, columns: List[str] = None) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """Read partitioned timesheet store, only opening the partitions of `date` if it is set.
+
+    Args:
+        store_dir: Root directory of the partitioned store.
+        date: Date, or set or range of dates, of the partitions to be read. E.g. '2020-01-01'. If not set, all partitions are read.
+        chunksize: Number of rows per chunk. If set, an iterator of chunks is returned.
+        columns: Only read these columns. If not set, all columns are read.
+
+    Returns:
+        Union[pd.DataFrame, Iterator[pd.DataFrame]]: The dataframe, or iterator of chunks.
+    """
+    if pq is None:
+        raise ImportError('pyarrow is required for the partitioned timesheet store')
+
+    # Prune partitions by date, the date predicate is resolved into one directory per date
+    if date is None:
+        pathfiles = sorted(glob.glob(os.path.join(store_dir, 'year=*', 'month=*', 'date=*', '*.parquet')))
+    else:
+        pathfiles = [pathfile for value in _as_dates(date) for pathfile in sorted(glob.glob(os.path.join(_partition_dir(store_dir, value), '*.parquet')))]
+
+    if not pathfiles:
+        empty_data = pq.read_schema(os.path.join(store_dir, '_common_metadata')).empty_table().to_pandas()
+        if columns is not None:
+            empty_data = empty_data[columns]
+        return empty_data if chunksize is None else iter([empty_data])
+
+    if chunksize is None:
+        return pd.concat([read_columnar(pathfile, columns=columns) for pathfile in pathfiles], ignore_index=True)
+    return (chunk for pathfile in pathfiles for chunk in read_columnar(pathfile, chunksize=chunksize, columns=columns))
+
+def filter_by_date(df: pd.DataFrame, date, date_column: str = 'date') -> pd.DataFrame:
+    """Filter rows of a dataframe by date.
+
+    Args:
+        df: Dataframe to be filtered.
+        date: Date value, or set or range of date values, for filtering data. E.g. '2020-01-01'.
+        date_column: Name of the date column.
+
+    Returns:
+        pd.DataFrame: Rows having the date.
+    """
+    dates = _as_dates(date)
+
+    # Compare with the same type as the date column, typed column is datetime and untyped column is string
+    if not pd.api.types.is_datetime64_any_dtype(df[date_column]):
+        dates = [value.strftime('%Y-%m-%d') for value in dates]
+    if len(dates) == 1:
+        return df.loc[df[date_column] == dates[0]]
+    return df.loc[df[date_column].isin(dates)]
+
+def _read_header(pathfile: str) -> bytes:
+    """Read header line of a CSV file, including its line break.
+
+    Args:
+        pathfile: Pathfile for CSV file.
+
+    Returns:
+        bytes: Header line of the CSV file.
+    """
+    with open(pathfile, 'rb') as file:
+        return file.readline()
+
+def _hash_bytes_before(pathfile: str, offset: int, size: int = 4096) -> str:
+    """Calculate hash of the bytes just before `offset`, for detecting rewritten files.
+
+    Args:
+        pathfile: Pathfile to be hashed.
+        offset: End offset of the hashed bytes.
+        size: Maximum number of hashed bytes.
+
+    Returns:
+        str: Hex digest of the bytes.
+    """
+    with open(pathfile, 'rb') as file:
+        file.seek(max(offset - size, 0))
+        return hashlib.blake2b(file.read(offset - max(offset - size, 0)), digest_size=20).hexdigest()
+
+def _read_byte_range(pathfile: str, start: int, end: int) -> bytes:
+    """Read [start, end) bytes of a file.
+
+    Args:
+        pathfile: Pathfile to be read.
+        start: Start offset.
+        end: End offset.
+
+    Returns:
+        bytes: The bytes of the range.
+    """
+    with open(pathfile, 'rb') as file:
+        file.seek(start)
+        return file.read(end - start)
+
+def build_date_index(pathfile: str, delimiter: str = ',', date_column: str = 'date', max_gap: int = 65536, block_size: int = 1 << 24) -> dict:
+    """Build or extend sparse date index of a CSV file, saved as `<pathfile>.dateidx.json` sidecar.
+
+    The index maps every date value to the byte ranges holding its rows. Ranges of the same date
+    separated by at most `max_gap` bytes are merged, so a range may also hold rows of other dates.
+    If rows were only appended since the index was saved, only the appended bytes are scanned,
+    otherwise the index is rebuilt from the beginning of the file. A last row without line break is
+    indexed in the returned index, but not saved, so it is scanned again once it may be complete.
+
+    Args:
+        pathfile: Pathfile for CSV file.
+        delimiter: Delimiter for reading CSV file.
+        date_column: Name of the date column.
+        max_gap: Maximum number of bytes between two ranges of the same date to be merged.
+        block_size: Number of bytes read from the CSV file at once.
+
+    Returns:
+        dict: The date index, with date values in `dates` mapped to lists of [start, end) byte ranges.
+    """
+    index_pathfile = pathfile + '.dateidx.json'
+    header = _read_header(pathfile)
+    size = os.path.getsize(pathfile)
+
+    index = None
+    if os.path.exists(index_pathfile):
+        with open(index_pathfile) as file:
+            index = json.load(file)
+        # Only extend the index if the indexed part of the file is unchanged
+        unchanged = index['header'] == header.decode() and index['delimiter'] == delimiter \
+            and index['date_column'] == date_column and index['max_gap'] == max_gap and index['offset'] <= size \
+            and index['tail_hash'] == _hash_bytes_before(pathfile, index['offset'])
+        if not unchanged:
+            index = None
+        elif index['offset'] == size:
+            return index
+
+    if index is None:
+        index = {
+            'header': header.decode(), 'delimiter': delimiter, 'date_column': date_column,
+            'max_gap': max_gap, 'offset': len(header), 'dates': {},
+        }
+
+    # Position of date field in every line
+    date_position = next(
+        position for position, column in enumerate(header.decode().rstrip('\r\n').split(delimiter))
+        if column.strip('"') == date_column
+    )
+    separator = delimiter.encode()
+    dates = index['dates']
+
+    def add_line(line: bytes, start: int, end: int) -> None:
+        fields = line.split(separator, date_position + 1)
+        if not line.strip() or len(fields) <= date_position:
+            return
+        date = fields[date_position].strip().strip(b'"').decode()
+
+        # Extend the last range of the date if the row is close to it, otherwise start a new range
+        ranges = dates.setdefault(date, [])
+        if ranges and start - ranges[-1][1] <= max_gap:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+
+    with open(pathfile, 'rb') as file:
+        file.seek(index['offset'])
+        offset = index['offset']
+        remaining = b''
+        while True:
+            block = file.read(block_size)
+            if not block:
+                break
+            block = remaining + block
+
+            # Only index complete lines, the rest is carried over into the next block
+            last_line_break = block.rfind(b'\n')
+            if last_line_break < 0:
+                remaining = block
+                continue
+            remaining = block[last_line_break + 1:]
+
+            for line in block[:last_line_break + 1].splitlines(keepends=True):
+                start, offset = offset, offset + len(line)
+                add_line(line, start, offset)
+
+    index['offset'] = offset
+    index['tail_hash'] = _hash_bytes_before(pathfile, offset)
+    with open(index_pathfile, 'w') as file:
+        json.dump(index, file)
+
+    # The last row is complete at the end of the file, but it may still be appended to
+    add_line(remaining, offset, offset + len(remaining))
+    return index
+
+def read_csv_by_date(pathfile: str, date, delimiter: str = ',', schema: dict = None, chunksize: int = None, columns: List[str] = None) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """Read only the rows of `date` from CSV file, by seeking to the byte ranges in its date index.
+
+    Rows of other dates inside the byte ranges are filtered out after parsing. The byte ranges
+    of several dates are read in file order, overlapping ranges only once.
+
+    Args:
+        pathfile: Pathfile for CSV file.
+        date: Date, or set or range of dates, of the rows to be read. E.g. '2020-01-01'.
+        delimiter: Delimiter for reading CSV file.
+        schema: Declared column types. E.g. `TIMESHEET_SCHEMA`.
+        chunksize: Number of rows per chunk. If set, an iterator of chunks is returned.
+        columns: Only return these columns. If not set, all columns are returned.
+
+    Returns:
+        Union[pd.DataFrame, Iterator[pd.DataFrame]]: The typed dataframe, or iterator of typed chunks.
+    """
+    index = build_date_index(pathfile, delimiter=delimiter)
+    ranges = []
+    for start, end in sorted(tuple(byte_range) for value in _as_dates(date) for byte_range in index['dates'].get(value.strftime('%Y-%m-%d'), [])):
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+
+    # Collect the header and the rows of the date into one buffer
+    buffer = io.BytesIO()
+    buffer.write(index['header'].encode())
+    with open(pathfile, 'rb') as file:
+        for start, end in ranges:
+            file.seek(start)
+            buffer.write(file.read(end - start))
+    buffer.seek(0)
+
+    # The date column is always read for filtering rows of other dates
+    read_columns = None if columns is None else list(dict.fromkeys(columns + [index['date_column']]))
+    data = read_csv(buffer, delimiter=delimiter, schema=schema, chunksize=chunksize, columns=read_columns)
+
+    def filter_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+        chunk = filter_by_date(chunk, date, date_column=index['date_column'])
+        return chunk if columns is None else chunk[columns]
+
+    if chunksize is None:
+        return filter_chunk(data)
+    return (filter_chunk(chunk) for chunk in data)
+
+class _ByteRangeReader(io.RawIOBase):
+    """Stream of `prefix` followed by the [start, end) bytes of a file, e.g. a CSV header and the appended rows."""
+    def __init__(self, pathfile: str, start: int, end: int, prefix: bytes = b'') -> None:
+        self.file = open(pathfile, 'rb')
+        self.file.seek(start)
+        self.remaining = end - start
+        self.prefix = prefix
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self.prefix:
+            size = min(len(buffer), len(self.prefix))
+            buffer[:size] = self.prefix[:size]
+            self.prefix = self.prefix[size:]
+            return size
+        size = self.file.readinto(memoryview(buffer)[:min(len(buffer), self.remaining)])
+        self.remaining -= size
+        return size
+
+    def close(self) -> None:
+        self.file.close()
+        super().close()
+
+def _count_lines(pathfile: str, start: int, end: int, block_size: int = 1 << 24) -> int:
+    """Count line breaks in [start, end) bytes of a file, reading it block by block.
+
+    Args:
+        pathfile: Pathfile to be read.
+        start: Start offset.
+        end: End offset.
+        block_size: Number of bytes read at once.
+
+    Returns:
+        int: Number of line breaks.
+    """
+    count = 0
+    with open(pathfile, 'rb') as file:
+        file.seek(start)
+        while start < end:
+            block = file.read(min(block_size, end - start))
+            if not block:
+                break
+            count += block.count(b'\n')
+            start += len(block)
+    return count
+
+def read_appended_csv(pathfile: str, checkpoint: dict = None, delimiter: str = ',', schema: dict = None, chunksize: int = None) -> tuple:
+    """Read only the rows appended to a CSV file after `checkpoint`.
+
+    The checkpoint keeps the byte offset and row count already processed, with the header and
+    the bytes before the offset for detecting a truncated or rewritten file. In that case, or if
+    there is no checkpoint, the whole file is read again. Rows are streamed from the file, so with
+    `chunksize` only a chunk of rows is in memory at once.
+
+    A last row without line break is read as a complete row. If more bytes are appended to that row
+    afterwards, the file counts as rewritten.
+
+    Args:
+        pathfile: Pathfile for CSV file.
+        checkpoint: Checkpoint returned by the previous read. If not set, the whole file is read.
+        delimiter: Delimiter for reading CSV file.
+        schema: Declared column types. E.g. `TIMESHEET_SCHEMA`.
+        chunksize: Number of rows per chunk. If set, an iterator of chunks is returned.
+
+    Returns:
+        tuple: The typed dataframe (or iterator of typed chunks) and the checkpoint after reading it.
+    """
+    header = _read_header(pathfile)
+    size = os.path.getsize(pathfile)
+
+    full_rescan = checkpoint is None \
+        or checkpoint['header'] != header.decode() \
+        or checkpoint['offset'] > size \
+        or checkpoint['tail_hash'] != _hash_bytes_before(pathfile, checkpoint['offset']) \
+        or (checkpoint.get('unterminated', False) and _read_byte_range(pathfile, checkpoint['offset'], checkpoint['offset'] + 1) not in (b'', b'\n', b'\r'))
+    if full_rescan:
+        checkpoint = {'header': header.decode(), 'offset': len(header), 'rows': 0}
+
+    # Every line break ends a row, and so does the end of the file after a last row without line break.
+    # A line break appended to such a row ends the row counted by the previous read
+    was_unterminated = not full_rescan and checkpoint.get('unterminated', False)
+    unterminated, rows = was_unterminated, 0
+    if size > checkpoint['offset']:
+        unterminated = _read_byte_range(pathfile, size - 1, size) != b'\n'
+        rows = _count_lines(pathfile, checkpoint['offset'], size) + unterminated - was_unterminated
+    new_checkpoint = {
+        'header': header.decode(),
+        'start_offset': checkpoint['offset'],
+        'offset': size,
+        'rows': checkpoint['rows'] + rows,
+        'tail_hash': _hash_bytes_before(pathfile, size),
+        'unterminated': unterminated,
+        'full_rescan': full_rescan,
+    }
+
+    def open_stream() -> io.BufferedReader:
+        return io.BufferedReader(_ByteRangeReader(pathfile, checkpoint['offset'], size, prefix=header), buffer_size=1 << 20)
+
+    if chunksize is None:
+        with open_stream() as stream:
+            return read_csv(stream, delimiter=delimiter, schema=schema), new_checkpoint
+
+    def read_chunks() -> Iterator[pd.DataFrame]:
+        with open_stream() as stream:
+            yield from read_csv(stream, delimiter=delimiter, schema=schema, chunksize=chunksize)
+    return read_chunks(), new_checkpoint
+
+def _split_byte_ranges(pathfile: str, start: int, end: int, parts: int) -> List[tuple]:
+    """Split bytes of a file into ranges that start and end at line breaks.
+
+    Args:
+        pathfile: Pathfile to be split.
+        start: Start offset of the first range, must be at the beginning of a line.
+        end: End offset of the last range.
+        parts: Number of ranges.
+
+    Returns:
+        List[tuple]: Non-empty [start, end) byte ranges.
+    """
+    boundaries = [start]
+    with open(pathfile, 'rb') as file:
+        for part in range(1, parts):
+            # Move every boundary forward to the beginning of the next line
+            file.seek(max(start + (end - start) * part // parts, boundaries[-1]))
+            file.readline()
+            boundaries.append(min(file.tell(), end))
+    boundaries.append(end)
+    return [(range_start, range_end) for range_start, range_end in zip(boundaries, boundaries[1:]) if range_start < range_end]
+
+def _count_rows_in_range(task: tuple) -> int:
+    """Count CSV rows in a byte range, run in worker process.
+
+    Args:
+        task: Pathfile, start and end offset of the range.
+
+    Returns:
+        int: Number of non-empty lines in the range.
+    """
+    data = _read_byte_range(*task)
+
+    # Blank lines are skipped by the CSV parser, so they are only looked for if there may be one
+    if b'\n\n' in data or b'\n\r\n' in data or data.startswith((b'\n', b'\r\n')):
+        return sum(1 for line in data.splitlines() if line.strip())
+    return data.count(b'\n') + (0 if data.endswith(b'\n') else 1)
+
+def _parse_range_into_columns(task: tuple) -> None:
+    """Parse CSV rows in a byte range and write them into shared column files, run in worker process.
+
+    Args:
+        task: Pathfile, header, start and end offset of the range, first row and number of rows,
+            delimiter, schema and column layout of `read_csv_parallel`.
+    """
+    pathfile, header, start, end, row_offset, rows, delimiter, schema, layout = task
+    data = read_csv(io.BytesIO(header + _read_byte_range(pathfile, start, end)), delimiter=delimiter, schema=schema)
+    if len(data) != rows:
+        raise ValueError(f'Expected {rows} rows in bytes {start}-{end} of {pathfile}, parsed {len(data)}')
+    if rows == 0:
+        return
+
+    for column, (values_pathfile, dtype, mask_pathfile) in layout.items():
+        values = np.memmap(values_pathfile, dtype=dtype, mode='r+', offset=row_offset * np.dtype(dtype).itemsize, shape=(rows,))
+        array = data[column].array
+        if mask_pathfile is None:
+            values[:] = data[column].to_numpy(dtype=dtype)
+        else:
+            # Nullable integer column is written as values and missing-value mask
+            mask = np.memmap(mask_pathfile, dtype=np.bool_, mode='r+', offset=row_offset, shape=(rows,))
+            values[:] = array.to_numpy(dtype=dtype, na_value=0)
+            mask[:] = array.isna()
+            mask.flush()
+        values.flush()
+
+def _parse_range(task: tuple) -> pd.DataFrame:
+    """Parse CSV rows in a byte range, run in worker process.
+
+    Args:
+        task: Pathfile, header, start and end offset of the range, delimiter and schema.
+
+    Returns:
+        pd.DataFrame: The typed dataframe of the range.
+    """
+    pathfile, header, start, end, delimiter, schema = task
+    return read_csv(io.BytesIO(header + _read_byte_range(pathfile, start, end)), delimiter=delimiter, schema=schema)
+
+def read_csv_parallel(pathfile: str, delimiter: str = ',', schema: dict = None, workers: int = None) -> pd.DataFrame:
+    """Read CSV file by parsing line-aligned byte ranges in a process pool.
+
+    If the schema declares every column with a fixed-width type, workers write their rows directly into
+    memory-mapped column files at their row offset and the result wraps these columns without concatenating.
+    Otherwise, the parsed ranges are concatenated, and the whole file is parsed at once if the types inferred
+    for the ranges can not be reconciled. Quoted values must not contain line breaks.
+
+    Args:
+        pathfile: Pathfile for CSV file.
+        delimiter: Delimiter for reading CSV file.
+        schema: Declared column types. E.g. `TIMESHEET_SCHEMA`.
+        workers: Number of worker processes. If not set, the number of CPUs is used.
+
+    Returns:
+        pd.DataFrame: The typed dataframe.
+    """
+    workers = workers or os.cpu_count()
+    header = _read_header(pathfile)
+    ranges = _split_byte_ranges(pathfile, len(header), os.path.getsize(pathfile), workers * 4)
+
+    # Get column types from the first rows, they only hold for the whole file if the schema declares every column
+    sample = _read_byte_range(pathfile, len(header), len(header) + 65536)
+    sample = read_csv(io.BytesIO(header + sample[:sample.rfind(b'\n') + 1]), delimiter=delimiter, schema=schema)
+    fixed_width = schema is not None and set(sample.columns) <= set(schema) and all(
+        isinstance(dtype, (pd.Int32Dtype, pd.Int64Dtype)) or (isinstance(dtype, np.dtype) and dtype.kind in 'iufbM')
+        for dtype in sample.dtypes
+    )
+
+    if not ranges:
+        return sample
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if not fixed_width:
+            tasks = [(pathfile, header, start, end, delimiter, schema) for start, end in ranges]
+            frames = list(pool.map(_parse_range, tasks))
+
+            # Types inferred per range may differ, e.g. integers with a missing value in a later range.
+            # Numeric types are widened by `pd.concat`, other mismatches are left to parsing the whole file
+            for column in frames[0].columns:
+                dtypes = {frame[column].dtype for frame in frames}
+                if len(dtypes) > 1 and not all(isinstance(dtype, np.dtype) and dtype.kind in 'iuf' for dtype in dtypes):
+                    return read_csv(pathfile, delimiter=delimiter, schema=schema)
+            return pd.concat(frames, ignore_index=True)
+
+        # Count rows of every range to know where its rows are written
+        rows = list(pool.map(_count_rows_in_range, [(pathfile, start, end) for start, end in ranges]))
+        row_offsets = np.concatenate([[0], np.cumsum(rows)]).tolist()
+        total_rows = row_offsets[-1]
+
+        # Allocate a memory-mapped file for every column (and missing-value mask of nullable integer columns)
+        column_dir = tempfile.mkdtemp(dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+        try:
+            layout = {}
+            for position, (column, dtype) in enumerate(sample.dtypes.items()):
+                values_dtype = dtype.numpy_dtype if isinstance(dtype, (pd.Int32Dtype, pd.Int64Dtype)) else dtype
+                values_pathfile = os.path.join(column_dir, f'{position}.values')
+                np.memmap(values_pathfile, dtype=values_dtype, mode='w+', shape=(max(total_rows, 1),)).flush()
+                mask_pathfile = None
+                if isinstance(dtype, (pd.Int32Dtype, pd.Int64Dtype)):
+                    mask_pathfile = os.path.join(column_dir, f'{position}.mask')
+                    np.memmap(mask_pathfile, dtype=np.bool_, mode='w+', shape=(max(total_rows, 1),)).flush()
+                layout[column] = (values_pathfile, values_dtype.str, mask_pathfile)
+
+            list(pool.map(_parse_range_into_columns, [
+                (pathfile, header, start, end, row_offset, range_rows, delimiter, schema, layout)
+                for (start, end), row_offset, range_rows in zip(ranges, row_offsets, rows)
+            ]))
+
+            # Wrap the column files as the result, the mappings stay valid after the files are removed
+            columns = {}
+            for column, (values_pathfile, dtype, mask_pathfile) in layout.items():
+                values = np.memmap(values_pathfile, dtype=dtype, mode='r+', shape=(max(total_rows, 1),))[:total_rows].view(np.ndarray)
+                if mask_pathfile is None:
+                    columns[column] = values
+                else:
+                    mask = np.memmap(mask_pathfile, dtype=np.bool_, mode='r+', shape=(max(total_rows, 1),))[:total_rows].view(np.ndarray)
+                    columns[column] = pd.arrays.IntegerArray(values, mask)
+            return pd.DataFrame(columns, copy=False)
+        finally:
+            shutil.rmtree(column_dir, ignore_errors=True)
+
+# Month-ordered rows, dimension and pipeline shared with backfill worker processes, set by the pool initializer
+_backfill_shared = None
+
+def _init_backfill_worker(shared: tuple) -> None:
+    """Keep the rows, dimension and pipeline of `backfill_by_month` in the worker process.
+
+    Args:
+        shared: Month-ordered rows, dimension and pipeline.
+    """
+    global _backfill_shared
+    _backfill_shared = shared
+
+def _backfill_month(task: tuple) -> pd.DataFrame:
+    """Run the backfill pipeline on the rows of a month, run in worker process.
+
+    Args:
+        task: First and end position of the month rows in the month-ordered rows.
+
+    Returns:
+        pd.DataFrame: Result of the pipeline.
+    """
+    rows, dimension, pipeline = _backfill_shared
+    start, end = task
+    return pipeline(rows.iloc[start:end], dimension)
+
+def backfill_by_month(data: pd.DataFrame, dimension: pd.DataFrame, pipeline: Callable, months: List[tuple] = None, workers: int = None) -> pd.DataFrame:
+    """Run a pipeline on the rows of every (year, month) partition in a process pool and merge the results.
+
+    Rows are ordered by month once, and the rows of a month are a slice of them. The rows, the dimension
+    and the pipeline are handed to the worker processes by the pool initializer, so with the fork start method
+    they are shared copy-on-write instead of being pickled for every month, and only results are sent back.
+    The most recent months are scheduled first.
+
+    Args:
+        data: Fact rows with typed `date`. E.g. timesheets.
+        dimension: Read-only dimension data joined by the pipeline. E.g. deduplicated employees.
+        pipeline: Module-level function of the month rows and the dimension, returning the month result.
+        months: (year, month) partitions to be processed. If not set, every month of `data`.
+        workers: Number of worker processes. If not set, the number of CPUs is used.
+
+    Returns:
+        pd.DataFrame: Results of the months concatenated in month order.
+    """
+    dates = data['date']
+    codes = (dates.dt.year * 12 + dates.dt.month - 1).to_numpy(dtype=np.int64, na_value=-1)
+    if months is not None:
+        keep = np.isin(codes, [year * 12 + month - 1 for year, month in months])
+        data, codes = data.loc[keep], codes[keep]
+
+    # Order rows by month once, unless they already are
+    if len(codes) and (np.diff(codes) < 0).any():
+        order = np.argsort(codes, kind='stable')
+        data, codes = data.take(order), codes[order]
+    month_codes, starts = np.unique(codes, return_index=True)
+    ends = np.append(starts[1:], len(codes))
+    tasks = [(code, (start, end)) for code, start, end in zip(month_codes.tolist(), starts.tolist(), ends.tolist()) if code >= 0]
+    if not tasks:
+        return pipeline(data.iloc[:0], dimension)
+
+    # Fork shares the rows and dimension with the workers, other start methods pickle them once per worker
+    context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+    tasks.sort(reverse=True)
+    with ProcessPoolExecutor(
+        max_workers=min(workers or os.cpu_count(), len(tasks)), mp_context=context,
+        initializer=_init_backfill_worker, initargs=((data, dimension, pipeline),)
+    ) as pool:
+        results = dict(zip([code for code, _ in tasks], pool.map(_backfill_month, [task for _, task in tasks])))
+    return concat_data([results[code] for code in sorted(results)])
+
+def _encode_key(values: pd.Series) -> tuple:
+    """Encode a key column into int64 codes following the sort order of its values.
+
+    Integer and date columns are shifted by their minimum (dates counted in days if they are all at midnight),
+    categorical columns use their category codes and other columns are factorized.
+
+    Args:
+        values: Key column.
+
+    Returns:
+        tuple: Codes of every row (-1 for missing values) and number of possible codes.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(dtype=np.int64), max(len(values.cat.categories), 1)
+
+    missing = values.isna().to_numpy()
+    if pd.api.types.is_integer_dtype(values) or pd.api.types.is_datetime64_any_dtype(values):
+        if pd.api.types.is_datetime64_any_dtype(values):
+            ints = values.to_numpy(dtype='datetime64[ns]').view(np.int64)
+            day = np.int64(86400 * 10**9)
+            if not (ints[~missing] % day).any():
+                ints = ints // day
+        else:
+            ints = values.to_numpy(dtype=np.int64, na_value=0)
+
+        present = ints[~missing]
+        if not len(present):
+            return np.full(len(values), -1, dtype=np.int64), 1
+        low, high = int(present.min()), int(present.max())
+        if high - low < 2**62:
+            codes = ints - low
+            codes[missing] = -1
+            return codes, high - low + 1
+
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes.astype(np.int64), max(len(uniques), 1)
+
+def remove_duplicates_sorted(df: pd.DataFrame, partitioning_keys: Union[str, List[str]], ordering_key: str, ascending_order: bool = True) -> pd.DataFrame:
+    """Keep the first row of every partition ordered by `ordering_key`, using one sort over encoded keys.
+
+    The partitioning keys and the ordering key are packed into one int64 key. The row position is
+    packed too if it fits, so a plain `np.sort` of the packed values gives the rows in order.
+    Otherwise the packed key is argsorted and ties are won by the lowest position, and if even the
+    keys do not fit into int64, the encoded columns are sorted with `np.lexsort`.
+
+    The result is the same as `groupby(partitioning_keys)[ordering_key].idxmin()` (or `idxmax()`):
+    partitions in key order, ties won by the first row and rows with missing keys dropped.
+    A partition with only missing ordering values keeps its first row instead of raising.
+
+    Args:
+        df: Dataframe to be deduplicated.
+        partitioning_keys: Key for partitioning rank data. E.g. 'field1' or ['field1', 'field2'].
+        ordering_key: Key for ordering rank data. E.g. 'field1'.
+        ascending_order: Keep the row with the lowest `ordering_key`. If False, the row with the highest is kept.
+
+    Returns:
+        pd.DataFrame: One row per partition, with a new range index.
+    """
+    encoded = [_encode_key(df[key]) for key in _as_columns(partitioning_keys)]
+    valid = np.ones(len(df), dtype=bool)
+    for codes, _ in encoded:
+        valid &= codes >= 0
+    positions = np.arange(len(df)) if valid.all() else np.flatnonzero(valid)
+    if not len(positions):
+        return df.iloc[:0].reset_index(drop=True)
+    encoded = [(codes[positions], cardinality) for codes, cardinality in encoded]
+
+    # Ordering codes sort in the requested order, missing values last
+    ordering, ordering_cardinality = _encode_key(df[ordering_key])
+    ordering = ordering[positions]
+    if not ascending_order:
+        ordering = np.where(ordering < 0, -1, ordering_cardinality - 1 - ordering)
+    ordering[ordering < 0] = ordering_cardinality
+    encoded.append((ordering, ordering_cardinality + 1))
+
+    cardinality = np.prod([float(column_cardinality) for _, column_cardinality in encoded])
+    if cardinality >= 2**62:
+        # Sort every encoded column separately, the stable sort keeps ties in row order
+        order = np.lexsort([codes for codes, _ in encoded[::-1]])
+        same_partition = np.zeros(len(order), dtype=bool)
+        same_partition[1:] = True
+        for codes, _ in encoded[:-1]:
+            sorted_codes = codes[order]
+            same_partition[1:] &= sorted_codes[1:] == sorted_codes[:-1]
+        return df.take(positions[order[~same_partition]]).reset_index(drop=True)
+
+    # Pack the codes into one int64 key, the first key being the most significant
+    packed = np.zeros(len(positions), dtype=np.int64)
+    for codes, column_cardinality in encoded:
+        packed = packed * column_cardinality + codes
+
+    if cardinality * len(positions) < 2**62:
+        # Add the row position as least significant part, so sorting the values orders ties by row
+        values = np.sort(packed * len(positions) + np.arange(len(positions)))
+        packed, winners = np.divmod(values, len(positions))
+        partitions = packed // (ordering_cardinality + 1)
+        first = np.ones(len(partitions), dtype=bool)
+        first[1:] = partitions[1:] != partitions[:-1]
+        return df.take(positions[winners[first]]).reset_index(drop=True)
+
+    # Ties of the packed key are won by the lowest position of their run
+    order = np.argsort(packed)
+    sorted_packed = packed[order]
+    run_starts = np.flatnonzero(np.concatenate([[True], sorted_packed[1:] != sorted_packed[:-1]]))
+    winners = np.minimum.reduceat(order, run_starts)
+    partitions = sorted_packed[run_starts] // (ordering_cardinality + 1)
+    first = np.ones(len(partitions), dtype=bool)
+    first[1:] = partitions[1:] != partitions[:-1]
+    return df.take(positions[winners[first]]).reset_index(drop=True)
+
+def _dense_key_codes(values: pd.Series, limit: int) -> tuple:
+    """Encode a group key into dense int64 codes following the sort order of its values.
+
+    Integer columns are shifted by their minimum while their range is within `limit`,
+    categorical columns use their category codes and other columns are factorized.
+
+    Args:
+        values: Key column.
+        limit: Maximum number of codes of a shifted integer column.
+
+    Returns:
+        tuple: Codes of every row (-1 for missing values) and number of possible codes.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(dtype=np.int64, copy=True), max(len(values.cat.categories), 1)
+
+    if isinstance(values.dtype, np.dtype) and values.dtype.kind in 'iu':
+        ints = values.to_numpy()
+        low, high = int(ints.min()), int(ints.max())
+        if high - low < limit:
+            codes = ints.astype(np.int64)
+            codes -= low
+            return codes, high - low + 1
+
+    return _factorize_codes(values)
+
+def _factorize_codes(values) -> tuple:
+    """Encode values into codes of their distinct values, in sort order.
+
+    Args:
+        values: Column or array of values.
+
+    Returns:
+        tuple: Codes of every row (-1 for missing values) and number of distinct values.
+    """
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes.astype(np.int64, copy=False), max(len(uniques), 1)
+
+def _pack_group_codes(df: pd.DataFrame, keys: List[str], limit: int) -> tuple:
+    """Pack the codes of group keys into one int64 group code, in the sort order of the keys.
+
+    Key codes are multiplied out, the first key being the most significant. While the product of the
+    key cardinalities exceeds `limit`, e.g. a sparse branch_id, the codes packed so far and the next
+    key codes are factorized, so the code space only holds the combinations present in `df`.
+
+    Args:
+        df: Dataframe having the key columns.
+        keys: Group keys.
+        limit: Maximum number of possible group codes.
+
+    Returns:
+        tuple: Group code of every row with all keys present, number of possible group codes,
+            and positions of those rows in `df` (None if every row has all keys).
+    """
+    key_codes = [_dense_key_codes(df[key], limit) for key in keys]
+
+    # Rows with missing keys are not grouped
+    valid = None
+    for codes, _ in key_codes:
+        if codes.min() < 0:
+            valid = codes >= 0 if valid is None else valid & (codes >= 0)
+    positions = None
+    if valid is not None:
+        positions = np.flatnonzero(valid)
+        key_codes = [(codes[positions], cardinality) for codes, cardinality in key_codes]
+
+    packed, cardinality = key_codes[0]
+    for codes, key_cardinality in key_codes[1:]:
+        if cardinality * key_cardinality > limit:
+            packed, cardinality = _factorize_codes(packed)
+            if cardinality * key_cardinality > limit:
+                codes, key_cardinality = _factorize_codes(codes)
+        packed = packed * key_cardinality + codes
+        cardinality *= key_cardinality
+    if cardinality > limit:
+        packed, cardinality = _factorize_codes(packed)
+    return packed, cardinality, positions
+
+def _dense_aggregate(df: pd.DataFrame, keys: List[str], aggregations: dict) -> Union[pd.DataFrame, None]:
+    """Aggregate numeric columns over dense integer group codes, with `np.bincount` and `np.maximum.at`.
+
+    Args:
+        df: Dataframe to be aggregated.
+        keys: Group keys.
+        aggregations: Output column mapped to (input column, 'sum' or 'max').
+
+    Returns:
+        Union[pd.DataFrame, None]: Same result as `groupby(keys, as_index=False, observed=True).agg(**aggregations)`,
+            or None if a column is not supported.
+    """
+    for column, func in aggregations.values():
+        if func not in ('sum', 'max') or not isinstance(df[column].dtype, np.dtype) or df[column].dtype.kind not in 'iuf':
+            return None
+    if not len(df):
+        return None
+
+    packed, cardinality, positions = _pack_group_codes(df, keys, max(4 * len(df), 1 << 16))
+    groups = np.flatnonzero(np.bincount(packed, minlength=cardinality))
+
+    # Key values of every group are taken from any of its rows, keeping the key dtypes
+    rows = np.empty(cardinality, dtype=np.int64)
+    rows[packed] = np.arange(len(packed)) if positions is None else positions
+    result = {key: df[key].array.take(rows[groups]) for key in keys}
+
+    for name, (column, func) in aggregations.items():
+        values = df[column].to_numpy()
+        result[name] = _aggregate_codes(packed, cardinality, groups, values if positions is None else values[positions], func)
+    return pd.DataFrame(result)
+
+def _aggregate_codes(packed: np.ndarray, cardinality: int, groups: np.ndarray, values: np.ndarray, func: str) -> np.ndarray:
+    """Sum or max numeric values per group code, with `np.bincount` and `np.maximum.at`.
+
+    Args:
+        packed: Group code of every row.
+        cardinality: Number of possible group codes.
+        groups: Group codes to be returned, in output order.
+        values: Numeric values of every row.
+        func: 'sum' or 'max', with `groupby` semantics for missing values and dtypes.
+
+    Returns:
+        np.ndarray: Aggregated value of every group in `groups`.
+    """
+    has_nan = values.dtype.kind == 'f' and np.isnan(values).any()
+    if func == 'sum' and values.dtype.kind == 'f':
+        return np.bincount(packed, weights=np.where(np.isnan(values), 0, values) if has_nan else values, minlength=cardinality)[groups]
+
+    if func == 'sum':
+        # Integer sums go through float64 weights only while they are exact, and keep the dtype like `groupby`
+        if not len(values) or max(abs(int(values.min())), abs(int(values.max()))) * len(values) < 2**53:
+            sums = np.bincount(packed, weights=values, minlength=cardinality)
+        else:
+            sums = np.zeros(cardinality, dtype=np.uint64 if values.dtype.kind == 'u' else np.int64)
+            np.add.at(sums, packed, values)
+        return sums[groups].astype(values.dtype)
+
+    if values.dtype.kind == 'f':
+        # Missing values are skipped, a group of only missing values has a missing maximum
+        maxima = np.full(cardinality, -np.inf)
+        np.fmax.at(maxima, packed, values)
+        if has_nan:
+            present = np.bincount(packed[~np.isnan(values)], minlength=cardinality)
+            maxima = np.where(present > 0, maxima, np.nan)
+        return maxima[groups]
+
+    maxima = np.full(cardinality, np.iinfo(values.dtype).min, dtype=values.dtype)
+    np.maximum.at(maxima, packed, values)
+    return maxima[groups]
+
+def group_aggregate(df: pd.DataFrame, keys: List[str], aggregations: dict, engine: str = 'auto') -> pd.DataFrame:
+    """Aggregate columns grouped by `keys`.
+
+    Args:
+        df: Dataframe to be aggregated.
+        keys: Group keys. E.g. ['year', 'month', 'branch_id'].
+        aggregations: Output column mapped to (input column, function). E.g. {'work_hour': ('work_hour', 'sum')}.
+        engine: 'auto' for `_dense_aggregate` over dense group codes, falling back to `groupby` for columns it does
+            not support, or 'hash' for always using `groupby`.
+
+    Returns:
+        pd.DataFrame: One row per group in key order, with the key columns and the aggregated columns.
+    """
+    if engine not in ('auto', 'hash'):
+        raise ValueError(f"Unknown aggregation engine '{engine}', expected 'auto' or 'hash'")
+
+    if engine == 'auto':
+        result = _dense_aggregate(df, keys, aggregations)
+        if result is not None:
+            return result
+    return df.groupby(keys, as_index=False, observed=True).agg(**aggregations)
+
+def _column_fingerprint(df: pd.DataFrame, columns: List[str]) -> tuple:
+    """Identify the memory holding columns of a dataframe, for checking whether cached codes still describe them.
+
+    Args:
+        df: Dataframe having the columns.
+        columns: Columns to be identified.
+
+    Returns:
+        tuple: Dtype, and address, shape and strides of every buffer, of every column.
+    """
+    return tuple(
+        (column, df[column].dtype, tuple((buffer.__array_interface__['data'][0], buffer.shape, buffer.strides) for buffer in _column_buffers(df[column])))
+        for column in columns
+    )
+
+def build_group_index(df: pd.DataFrame, keys: List[str]) -> Union[dict, None]:
+    """Encode group keys of every row into one dense group code, for reuse by several aggregations.
+
+    The `date` key is encoded as its month, so it groups by year and month without extracting them.
+    A key whose range would make the code space too large, e.g. a sparse branch_id or employee_id, is
+    factorized into codes of its distinct values. Aggregations grouped by the first keys divide the code
+    by the cardinality of the other keys.
+
+    Args:
+        df: Dataframe to be aggregated.
+        keys: Group keys, most significant first. E.g. ['date', 'branch_id', 'employee_id'].
+
+    Returns:
+        Union[dict, None]: The group index, or None if the distinct key combinations are too many for dense codes.
+    """
+    limit = max(4 * len(df), 1 << 16)
+    packed, cardinality, valid, levels = None, 1, None, []
+    for key in keys:
+        if key == 'date':
+            months = df[key].to_numpy(dtype='datetime64[M]')
+            missing = np.isnat(months)
+            months = months.view(np.int64)
+            low = int(months[~missing].min()) if not missing.all() else 0
+            codes = np.where(missing, -1, months - low)
+            key_cardinality = int(codes.max()) + 1 if len(codes) else 1
+            decode = lambda codes, low=low: {
+                'year': ((codes + low) // 12 + 1970).astype(np.int32),
+                'month': ((codes + low) % 12 + 1).astype(np.int32),
+            }
+        else:
+            codes, key_cardinality = _dense_key_codes(df[key], limit)
+            if cardinality * key_cardinality > limit:
+                codes, key_cardinality = _factorize_codes(df[key])
+
+            # Key values are taken from any row of every code, keeping the key dtype
+            present = np.flatnonzero(codes >= 0)
+            rows = np.zeros(key_cardinality, dtype=np.int64)
+            rows[codes[present]] = present
+            decode = lambda codes, key=key, values=df[key].array, rows=rows: {key: values.take(rows[codes])}
+
+        cardinality *= max(key_cardinality, 1)
+        if cardinality > limit:
+            return None
+        if len(codes) and codes.min() < 0:
+            valid = codes >= 0 if valid is None else valid & (codes >= 0)
+        if packed is None:
+            packed = codes.astype(np.int64, copy=True)
+        else:
+            packed *= max(key_cardinality, 1)
+            packed += codes
+        levels.append((key, max(key_cardinality, 1), decode))
+
+    # The buffers are kept alive, so their addresses can not be reused by other columns while the index is cached
+    return {
+        'keys': list(keys),
+        'columns': list(keys),
+        'fingerprint': _column_fingerprint(df, keys),
+        'buffers': [buffer for key in keys for buffer in _column_buffers(df[key])],
+        'codes': packed if valid is None else packed[valid],
+        'valid': valid,
+        'levels': levels,
+    }
+
+def aggregate_group_index(df: pd.DataFrame, index: dict, keys: List[str], aggregations: dict) -> tuple:
+    """Aggregate numeric columns grouped by the first keys of a group index.
+
+    Args:
+        df: Dataframe the group index was built for.
+        index: Group index from `build_group_index`.
+        keys: First keys of the group index. E.g. ['date', 'branch_id'].
+        aggregations: Output column mapped to (input column, 'sum' or 'max').
+
+    Returns:
+        tuple: Dataframe with the decoded key columns (`date` as year and month) and the aggregated columns
+            in key order, and the group code of every output row.
+    """
+    levels = index['levels'][:len(keys)]
+    divisor = int(np.prod([cardinality for _, cardinality, _ in index['levels'][len(keys):]], dtype=np.float64))
+    cardinality = int(np.prod([cardinality for _, cardinality, _ in levels], dtype=np.float64))
+    packed = index['codes'] // divisor if divisor > 1 else index['codes']
+    groups = np.flatnonzero(np.bincount(packed, minlength=cardinality))
+
+    # Key values of every group are decoded from the digits of its group code
+    decoded = []
+    remaining = groups
+    for _, key_cardinality, decode in reversed(levels):
+        remaining, codes = np.divmod(remaining, key_cardinality)
+        decoded.append(decode(codes))
+    result = {column: values for columns in reversed(decoded) for column, values in columns.items()}
+
+    for name, (column, func) in aggregations.items():
+        values = df[column].to_numpy()
+        if index['valid'] is not None:
+            values = values[index['valid']]
+        result[name] = _aggregate_codes(packed, cardinality, groups, values, func)
+    return pd.DataFrame(result), groups
+
+def _result_group_index(result: pd.DataFrame, index: dict, keys: List[str], groups: np.ndarray) -> dict:
+    """Describe the rows of an aggregation result as group index, so following aggregations reuse its group codes.
+
+    Args:
+        result: Result of `aggregate_group_index`.
+        index: Group index the result was aggregated from.
+        keys: Keys the result was grouped by.
+        groups: Group code of every result row.
+
+    Returns:
+        dict: Group index of the result, with `date` replaced by its year and month columns.
+    """
+    columns = [column for key in keys for column in (['year', 'month'] if key == 'date' else [key])]
+    return {
+        'keys': list(keys),
+        'columns': columns,
+        'fingerprint': _column_fingerprint(result, columns),
+        'buffers': [buffer for column in columns for buffer in _column_buffers(result[column])],
+        'codes': groups,
+        'valid': None,
+        'levels': index['levels'][:len(keys)],
+    }
+
+def _hash_keys(df: pd.DataFrame, keys: List[str]) -> np.ndarray:
+    """Hash key columns of every row, equal for equal values regardless of column names, integer dtypes and date units.
+
+    Args:
+        df: Dataframe having the key columns.
+        keys: Key columns.
+
+    Returns:
+        np.ndarray: 64-bit hash of every row.
+    """
+    columns = {}
+    for position, key in enumerate(keys):
+        values = df[key]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(values.cat.categories.dtype)
+        if pd.api.types.is_integer_dtype(values):
+            values = values.astype('Int64')
+        elif pd.api.types.is_datetime64_any_dtype(values):
+            values = values.astype('datetime64[ns]')
+        columns[position] = values
+    return pd.util.hash_pandas_object(pd.DataFrame(columns), index=False).to_numpy()
+
+def _spill_buckets(chunks: Iterator[pd.DataFrame], partitioning_keys: List[str], prefix: str, level: int) -> dict:
+    """Hash-partition rows on their partitioning keys into `SPILL_FANOUT` spill files.
+
+    Every level uses other digits of the same 64-bit key hash, so a bucket spilled again
+    is split into new buckets instead of keeping all its rows together.
+
+    Args:
+        chunks: Chunks of rows to be spilled.
+        partitioning_keys: Columns the rows are hash-partitioned on.
+        prefix: Pathfile prefix of the spill files, the bucket number is appended to it.
+        level: Partitioning level, starting at 0.
+
+    Returns:
+        dict: Pathfile and in-memory bytes of every non-empty bucket, by bucket number.
+    """
+    pathfiles = [f'{prefix}-{bucket:03d}.pkl' for bucket in range(SPILL_FANOUT)]
+    sizes = [0] * SPILL_FANOUT
+    files = {}
+    try:
+        for chunk in chunks:
+            hashes = _hash_keys(chunk, partitioning_keys)
+            buckets = (hashes // np.uint64(SPILL_FANOUT ** level)) % np.uint64(SPILL_FANOUT)
+            for bucket, rows in chunk.groupby(buckets, sort=False):
+                if bucket not in files:
+                    files[bucket] = open(pathfiles[bucket], 'wb')
+                pickle.dump(rows, files[bucket], protocol=pickle.HIGHEST_PROTOCOL)
+                sizes[bucket] += int(rows.memory_usage(index=True, deep=True).sum())
+    finally:
+        for file in files.values():
+            file.close()
+    return {int(bucket): (pathfiles[bucket], sizes[bucket]) for bucket in sorted(files)}
+
+def _read_spill_file(pathfile: str) -> Iterator[pd.DataFrame]:
+    """Read back the chunks written into a spill file.
+
+    Args:
+        pathfile: Pathfile of the spill file.
+
+    Returns:
+        Iterator[pd.DataFrame]: Chunks in the order they were spilled.
+    """
+    with open(pathfile, 'rb') as file:
+        while True:
+            try:
+                yield pickle.load(file)
+            except EOFError:
+                return
+
+def remove_duplicates_out_of_core(chunks: Iterator[pd.DataFrame], partitioning_keys: Union[str, List[str]], deduplicate: Callable[[pd.DataFrame], pd.DataFrame], memory_budget: int, spill_dir: str = None) -> Iterator[pd.DataFrame]:
+    """Remove duplicate rows of data larger than memory, by hash-partitioning them into spill files.
+
+    Every chunk is deduplicated on its own and spilled into buckets by the hash of its partitioning
+    keys, so all rows of a partition land in the same bucket. Every bucket within `memory_budget`
+    is then loaded and deduplicated independently, bigger buckets are spilled again one level deeper.
+    Rows are yielded bucket by bucket, not in key order.
+
+    Args:
+        chunks: Chunks of rows to be deduplicated.
+        partitioning_keys: Key for partitioning rank data. E.g. 'field1' or ['field1', 'field2'].
+        deduplicate: Function keeping one row per partition of a dataframe.
+        memory_budget: Maximum in-memory bytes of a bucket loaded at once.
+        spill_dir: Parent directory for the spill files. If not set, the system temporary directory is used.
+
+    Returns:
+        Iterator[pd.DataFrame]: Deduplicated rows, one chunk per bucket.
+    """
+    partitioning_keys = _as_columns(partitioning_keys)
+    work_dir = tempfile.mkdtemp(prefix='dedup-spill-', dir=spill_dir)
+    try:
+        buckets = _spill_buckets((deduplicate(chunk) for chunk in chunks), partitioning_keys, os.path.join(work_dir, 'bucket'), 0)
+        pending = [(pathfile, size, 0) for pathfile, size in buckets.values()]
+        while pending:
+            pathfile, size, level = pending.pop()
+
+            # A bucket over budget is split further, unless the hash has no digits left for another level
+            if size > memory_budget and SPILL_FANOUT ** (level + 2) <= 2**64:
+                buckets = _spill_buckets(_read_spill_file(pathfile), partitioning_keys, pathfile[:-len('.pkl')], level + 1)
+                pending.extend((bucket_pathfile, bucket_size, level + 1) for bucket_pathfile, bucket_size in buckets.values())
+            else:
+                data = deduplicate(concat_data(_read_spill_file(pathfile)))
+                if len(data):
+                    yield data
+            os.remove(pathfile)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def grace_hash_join(left_chunks: Iterator[pd.DataFrame], right_chunks: Iterator[pd.DataFrame], on: Union[str, List[str]] = None, left_on: Union[str, List[str]] = None, right_on: Union[str, List[str]] = None, memory_budget: int = 1 << 30, spill_dir: str = None) -> Iterator[pd.DataFrame]:
+    """Inner join data larger than memory, by hash-partitioning both sides on the join keys into spill files.
+
+    Both sides are spilled into buckets by the hash of their join keys, so matching rows land in
+    buckets of the same number. Bucket by bucket, the right rows are loaded and every spilled chunk of
+    the left rows is joined with them. A right bucket over `memory_budget` is spilled again one level
+    deeper together with its left bucket. The rows are the same as `pd.merge`, yielded bucket by bucket.
+
+    Args:
+        left_chunks: Chunks of the left data. E.g. timesheets.
+        right_chunks: Chunks of the right data, loaded one bucket at a time. E.g. employees.
+        on: Key for joining data, which exists in both data. E.g. 'field1' or ['field1', 'field2'].
+        left_on: Key of the left data for joining data. E.g. 'field1'.
+        right_on: Key of the right data for joining data. E.g. 'field1'.
+        memory_budget: Maximum in-memory bytes of a right bucket loaded at once.
+        spill_dir: Parent directory for the spill files. If not set, the system temporary directory is used.
+
+    Returns:
+        Iterator[pd.DataFrame]: Joined rows, one chunk per spilled left chunk.
+    """
+    left_keys, right_keys = _merge_keys({'on': on, 'left_on': left_on, 'right_on': right_on})
+
+    work_dir = tempfile.mkdtemp(prefix='join-spill-', dir=spill_dir)
+    try:
+        right_buckets = _spill_buckets(right_chunks, right_keys, os.path.join(work_dir, 'right'), 0)
+        left_buckets = _spill_buckets(left_chunks, left_keys, os.path.join(work_dir, 'left'), 0)
+
+        # Left rows of buckets without right rows have no match
+        pending = [(left_buckets[bucket], right_buckets[bucket], 0) for bucket in left_buckets if bucket in right_buckets]
+        while pending:
+            (left_pathfile, _), (right_pathfile, right_size), level = pending.pop()
+            if right_size > memory_budget and SPILL_FANOUT ** (level + 2) <= 2**64:
+                # Split both sides of a right bucket over budget further, with the same bucket numbers
+                right_split = _spill_buckets(_read_spill_file(right_pathfile), right_keys, right_pathfile[:-len('.pkl')], level + 1)
+                left_split = _spill_buckets(_read_spill_file(left_pathfile), left_keys, left_pathfile[:-len('.pkl')], level + 1)
+                pending.extend((left_split[bucket], right_split[bucket], level + 1) for bucket in left_split if bucket in right_split)
+            else:
+                right = concat_data(_read_spill_file(right_pathfile))
+                for chunk in _read_spill_file(left_pathfile):
+                    data = pd.merge(chunk, right, on=on, left_on=left_on, right_on=right_on)
+                    if len(data):
+                        yield data
+            os.remove(left_pathfile)
+            os.remove(right_pathfile)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def _index_values(values: pd.Series) -> list:
+    """Convert a column into values stored in the SQLite dedup index.
+
+    Dates are stored as ISO strings, so they compare in the same order as the dates.
+
+    Args:
+        values: Key or ordering column.
+
+    Returns:
+        list: Python values of every row, None for missing values.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype(values.cat.categories.dtype)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        at_midnight = (values.dropna() == values.dropna().dt.normalize()).all()
+        values = values.dt.strftime('%Y-%m-%d' if at_midnight else '%Y-%m-%dT%H:%M:%S.%f')
+    return values.astype(object).where(values.notna(), None).tolist()
+
+def check_dedup_index(df: pd.DataFrame, index_pathfile: str, partitioning_keys: Union[str, List[str]], ordering_key: str, ascending_order: bool = True, on_superseded: str = 'skip') -> pd.DataFrame:
+    """Check deduplicated rows against the winners of earlier runs, saved in a SQLite dedup index.
+
+    The index keeps the winning `ordering_key` of every partition seen so far. A row is superseded
+    if an earlier run kept a better row of its partition. Otherwise the row is kept and saved as the
+    winner, so a row processed again by a rerun keeps winning. Only the partitions of `df` are looked up.
+
+    Args:
+        df: Dataframe with at most one row per partition.
+        index_pathfile: Pathfile of the SQLite dedup index, created if it does not exist.
+        partitioning_keys: Key for partitioning rank data. E.g. 'field1' or ['field1', 'field2'].
+        ordering_key: Key for ordering rank data. E.g. 'field1'.
+        ascending_order: The lowest `ordering_key` wins. If False, the highest wins.
+        on_superseded: 'skip' for dropping superseded rows, or 'flag' for keeping them with `is_superseded` column.
+
+    Returns:
+        pd.DataFrame: Rows not superseded, or all rows with `is_superseded` column.
+    """
+    partitioning_keys = _as_columns(partitioning_keys)
+    key_columns = [f'key{position}' for position in range(len(partitioning_keys))]
+    keys_sql = ', '.join(key_columns)
+    better = '<' if ascending_order else '>'
+
+    directory = os.path.dirname(index_pathfile)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(index_pathfile)
+    try:
+        with connection:
+            # The index only holds winners of the same ranking it was created for
+            connection.execute('CREATE TABLE IF NOT EXISTS dedup_meta (partitioning_keys TEXT, ordering_key TEXT, ascending_order INTEGER)')
+            meta = (json.dumps(partitioning_keys), ordering_key, int(ascending_order))
+            saved_meta = connection.execute('SELECT partitioning_keys, ordering_key, ascending_order FROM dedup_meta').fetchone()
+            if saved_meta is None:
+                connection.execute('INSERT INTO dedup_meta VALUES (?, ?, ?)', meta)
+            elif tuple(saved_meta) != meta:
+                raise ValueError(f'Dedup index {index_pathfile} was created for {saved_meta}, not {meta}')
+            connection.execute(f'CREATE TABLE IF NOT EXISTS dedup_index ({keys_sql}, ordering, PRIMARY KEY ({keys_sql})) WITHOUT ROWID')
+
+            # Load the partitions of the batch into a temporary table, then look up their winners
+            connection.execute(f'CREATE TEMP TABLE batch (position INTEGER PRIMARY KEY, {keys_sql}, ordering)')
+            rows = zip(range(len(df)), *[_index_values(df[key]) for key in partitioning_keys], _index_values(df[ordering_key]))
+            connection.executemany(f"INSERT INTO batch VALUES ({', '.join(['?'] * (len(key_columns) + 2))})", rows)
+            superseded = np.zeros(len(df), dtype=bool)
+            for position, in connection.execute(f'SELECT batch.position FROM batch JOIN dedup_index USING ({keys_sql}) WHERE dedup_index.ordering {better} batch.ordering'):
+                superseded[position] = True
+
+            # Save the rows beating the winners of earlier runs
+            connection.execute(
+                f'INSERT INTO dedup_index ({keys_sql}, ordering) SELECT {keys_sql}, ordering FROM batch WHERE true '
+                f'ON CONFLICT ({keys_sql}) DO UPDATE SET ordering = excluded.ordering WHERE excluded.ordering {better} dedup_index.ordering'
+            )
+            connection.execute('DROP TABLE batch')
+    finally:
+        connection.close()
+
+    if on_superseded == 'flag':
+        return df.assign(is_superseded=superseded)
+    return df.loc[~superseded]
+
+def fold_month_state(partials: pd.DataFrame, state_pathfile: str, fold_key: str = None, replace: bool = False) -> pd.DataFrame:
+    """Fold work seconds and max salary per employee into the month-to-date state saved in SQLite.
+
+    The state keeps total work seconds and total salary per (year, month, branch_id), and the max salary
+    of every employee in the branch month. Total salary only grows by the raise of an employee max salary,
+    so only the rows of `partials` are read and written. A batch with a `fold_key` folded by an earlier run
+    is not folded again, so a rerun of the same day emits the same month-to-date result.
+
+    Args:
+        partials: Work seconds `work_hour` and max `salary` per year, month, branch_id and employee_id.
+        state_pathfile: Pathfile of the SQLite state, created if it does not exist.
+        fold_key: Key of the folded batch. E.g. the processed date.
+        replace: Drop the state of the branch months in `partials` before folding, for branch months recomputed from all their rows.
+
+    Returns:
+        pd.DataFrame: Month-to-date total_work_hour (seconds), total_salary and salary_per_hour
+            of the branch months in `partials`, in key order.
+    """
+    keys = ['year', 'month', 'branch_id']
+    keys_sql = ', '.join(keys)
+
+    directory = os.path.dirname(state_pathfile)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(state_pathfile)
+    try:
+        with connection:
+            connection.execute(f'CREATE TABLE IF NOT EXISTS month_branch_state ({keys_sql}, total_work_seconds, total_salary, PRIMARY KEY ({keys_sql})) WITHOUT ROWID')
+            connection.execute(f'CREATE TABLE IF NOT EXISTS month_employee_salary ({keys_sql}, employee_id, salary, PRIMARY KEY ({keys_sql}, employee_id)) WITHOUT ROWID')
+            connection.execute('CREATE TABLE IF NOT EXISTS month_state_folds (fold_key TEXT PRIMARY KEY)')
+
+            # Load the batch into a temporary table
+            connection.execute(f'CREATE TEMP TABLE batch ({keys_sql}, employee_id, work_seconds, salary)')
+            rows = zip(*[_index_values(partials[column]) for column in keys + ['employee_id', 'work_hour', 'salary']])
+            connection.executemany('INSERT INTO batch VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+            folded = fold_key is not None and connection.execute('SELECT 1 FROM month_state_folds WHERE fold_key = ?', (fold_key,)).fetchone() is not None
+            if replace and not folded:
+                for table in ('month_branch_state', 'month_employee_salary'):
+                    connection.execute(f'DELETE FROM {table} WHERE ({keys_sql}) IN (SELECT {keys_sql} FROM batch)')
+            if not folded:
+                # Add work seconds, and the raise of every employee max salary, to the totals of the branch months
+                connection.execute(
+                    f'INSERT INTO month_branch_state ({keys_sql}, total_work_seconds, total_salary) '
+                    f'SELECT {keys_sql}, sum(batch.work_seconds), '
+                    f'  coalesce(sum(CASE WHEN state.salary IS NULL THEN batch.salary WHEN batch.salary > state.salary THEN batch.salary - state.salary ELSE 0 END), 0) '
+                    f'FROM batch LEFT JOIN month_employee_salary AS state USING ({keys_sql}, employee_id) GROUP BY {keys_sql} '
+                    f'ON CONFLICT ({keys_sql}) DO UPDATE SET '
+                    f'  total_work_seconds = total_work_seconds + excluded.total_work_seconds, '
+                    f'  total_salary = total_salary + excluded.total_salary'
+                )
+                connection.execute(
+                    f'INSERT INTO month_employee_salary ({keys_sql}, employee_id, salary) '
+                    f'SELECT {keys_sql}, employee_id, salary FROM batch WHERE salary IS NOT NULL '
+                    f'ON CONFLICT ({keys_sql}, employee_id) DO UPDATE SET salary = excluded.salary WHERE excluded.salary > month_employee_salary.salary'
+                )
+                if fold_key is not None:
+                    connection.execute('INSERT INTO month_state_folds VALUES (?)', (fold_key,))
+
+            totals = connection.execute(
+                f'SELECT {keys_sql}, total_work_seconds, total_salary FROM month_branch_state '
+                f'WHERE ({keys_sql}) IN (SELECT {keys_sql} FROM batch) ORDER BY {keys_sql}'
+            ).fetchall()
+            connection.execute('DROP TABLE batch')
+    finally:
+        connection.close()
+
+    result = pd.DataFrame(totals, columns=keys + ['total_work_hour', 'total_salary'])
+    for key in keys:
+        result[key] = result[key].astype(partials[key].dtype)
+    result['total_work_hour'] = result['total_work_hour'].astype(np.int64)
+    result['salary_per_hour'] = salary_per_hour(result['total_salary'], result['total_work_hour'], 'second')
+    return result
+
+def drop_month_state(keys: pd.DataFrame, state_pathfile: str) -> None:
+    """Drop the month-to-date state of branch months, e.g. of branch months without rows anymore.
+
+    Args:
+        keys: Year, month and branch_id of the branch months.
+        state_pathfile: Pathfile of the SQLite state of `fold_month_state`.
+    """
+    if not len(keys) or not os.path.exists(state_pathfile):
+        return
+
+    connection = sqlite3.connect(state_pathfile)
+    try:
+        with connection:
+            rows = list(zip(*[_index_values(keys[key]) for key in ['year', 'month', 'branch_id']]))
+            for table in ('month_branch_state', 'month_employee_salary'):
+                connection.executemany(f'DELETE FROM {table} WHERE year = ? AND month = ? AND branch_id = ?', rows)
+    finally:
+        connection.close()
+
+def save_month_state_loads(fold_keys: List[str], state_pathfile: str) -> None:
+    """Record fold keys whose month-to-date results were loaded into the table.
+
+    Args:
+        fold_keys: Fold keys of `fold_month_state`. E.g. the processed dates.
+        state_pathfile: Pathfile of the SQLite state of `fold_month_state`.
+    """
+    connection = sqlite3.connect(state_pathfile)
+    try:
+        with connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS month_state_loads (fold_key TEXT PRIMARY KEY)')
+            connection.executemany('INSERT OR IGNORE INTO month_state_loads VALUES (?)', [(fold_key,) for fold_key in fold_keys])
+    finally:
+        connection.close()
+
+def _last_state_date(state_pathfile: str, table: str) -> Union[pd.Timestamp, None]:
+    """Get the last date among the fold keys of a table of the month-to-date state.
+
+    Args:
+        state_pathfile: Pathfile of the SQLite state of `fold_month_state`, with dates as fold keys.
+        table: 'month_state_folds' or 'month_state_loads'.
+
+    Returns:
+        Union[pd.Timestamp, None]: The last date, or None if there is none.
+    """
+    last = None
+    if os.path.exists(state_pathfile):
+        connection = sqlite3.connect(state_pathfile)
+        try:
+            if connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone():
+                last = connection.execute(f'SELECT max(fold_key) FROM {table}').fetchone()[0]
+        finally:
+            connection.close()
+
+    last = pd.to_datetime(last, errors='coerce')
+    return None if pd.isna(last) else last
+
+def last_folded_date(state_pathfile: str) -> Union[pd.Timestamp, None]:
+    """Get the last date folded into the month-to-date state.
+
+    Args:
+        state_pathfile: Pathfile of the SQLite state of `fold_month_state`, with dates as fold keys.
+
+    Returns:
+        Union[pd.Timestamp, None]: The last folded date, or None if no date was folded yet.
+    """
+    return _last_state_date(state_pathfile, 'month_state_folds')
+
+def unloaded_dates(state_pathfile: str, until) -> List[pd.Timestamp]:
+    """Get the dates whose results were not loaded yet, from the day after the last loaded date to `until`.
+
+    Used to catch up the days missed by the daily run, e.g. after an outage or a failed load, in one run.
+    A date folded by a run whose load failed is not folded again, its month-to-date results are loaded.
+
+    Args:
+        state_pathfile: Pathfile of the SQLite state of `fold_month_state`, with dates as fold keys.
+        until: Last date to be loaded.
+
+    Returns:
+        List[pd.Timestamp]: Dates to be loaded, only `until` if no date was loaded yet or `until` was already loaded.
+    """
+    until = pd.Timestamp(until).normalize()
+    last = _last_state_date(state_pathfile, 'month_state_loads')
+    if last is None or last >= until:
+        return [until]
+    return list(pd.date_range(last + pd.Timedelta(days=1), until))
+
+def partition_fingerprints(df: pd.DataFrame, columns: List[str] = None, engine: str = 'auto') -> pd.DataFrame:
+    """Fingerprint the input rows of every (year, month, branch_id) partition.
+
+    The fingerprint is the sum of 64-bit row hashes wrapping around, so it does not depend on the order
+    of the rows, and the row count is kept with it.
+
+    Args:
+        df: Cleaned employee timesheet rows with typed `date`.
+        columns: Columns feeding the partition result. If not set, `PARTITION_FINGERPRINT_COLUMNS`.
+        engine: Engine of `group_aggregate`.
+
+    Returns:
+        pd.DataFrame: Year, month, branch_id, rows and fingerprint (as int64) of every partition, in key order.
+    """
+    rows = pd.DataFrame({
+        'year': df['date'].dt.year,
+        'month': df['date'].dt.month,
+        'branch_id': df['branch_id'],
+        'rows': np.ones(len(df), dtype=np.int64),
+        'fingerprint': _hash_keys(df, PARTITION_FINGERPRINT_COLUMNS if columns is None else columns),
+    })
+    fingerprints = group_aggregate(
+        rows, ['year', 'month', 'branch_id'], {'rows': ('rows', 'sum'), 'fingerprint': ('fingerprint', 'sum')}, engine=engine
+    )
+    fingerprints['fingerprint'] = fingerprints['fingerprint'].to_numpy().view(np.int64)
+    return fingerprints
+
+def check_partition_fingerprints(fingerprints: pd.DataFrame, fingerprint_pathfile: str) -> pd.DataFrame:
+    """Compare partition fingerprints with the ones saved by `save_partition_fingerprints`.
+
+    Args:
+        fingerprints: Fingerprints from `partition_fingerprints`.
+        fingerprint_pathfile: Pathfile of the SQLite fingerprints, a missing file has no fingerprints.
+
+    Returns:
+        pd.DataFrame: Year, month, branch_id and status ('new', 'changed' or 'removed') of every partition
+            whose fingerprint changed, in key order.
+    """
+    keys = ['year', 'month', 'branch_id']
+    values = [_index_values(fingerprints[column]) for column in keys + ['rows', 'fingerprint']]
+    saved = {}
+    if os.path.exists(fingerprint_pathfile):
+        connection = sqlite3.connect(fingerprint_pathfile)
+        try:
+            connection.execute('CREATE TABLE IF NOT EXISTS partition_fingerprints (year, month, branch_id, rows, fingerprint, PRIMARY KEY (year, month, branch_id)) WITHOUT ROWID')
+            saved = {tuple(row[:3]): tuple(row[3:]) for row in connection.execute('SELECT year, month, branch_id, rows, fingerprint FROM partition_fingerprints')}
+        finally:
+            connection.close()
+
+    changes = []
+    for year, month, branch_id, rows, fingerprint in zip(*values):
+        saved_fingerprint = saved.pop((year, month, branch_id), None)
+        if saved_fingerprint is None:
+            changes.append((year, month, branch_id, 'new'))
+        elif saved_fingerprint != (rows, fingerprint):
+            changes.append((year, month, branch_id, 'changed'))
+    changes.extend((year, month, branch_id, 'removed') for year, month, branch_id in saved)
+
+    # Removed partitions may have branch_id missing from categories, keys keep the dtype of their values
+    dtypes = {key: fingerprints[key].cat.categories.dtype if isinstance(fingerprints[key].dtype, pd.CategoricalDtype) else fingerprints[key].dtype for key in keys}
+    return pd.DataFrame(changes, columns=keys + ['status']).astype(dtypes).sort_values(keys, ignore_index=True)
+
+def save_partition_fingerprints(fingerprints: pd.DataFrame, changes: pd.DataFrame, fingerprint_pathfile: str) -> None:
+    """Save fingerprints of changed partitions, after their results have been written.
+
+    Args:
+        fingerprints: Fingerprints from `partition_fingerprints`.
+        changes: Changed partitions from `check_partition_fingerprints`.
+        fingerprint_pathfile: Pathfile of the SQLite fingerprints, created if it does not exist.
+    """
+    keys = ['year', 'month', 'branch_id']
+    directory = os.path.dirname(fingerprint_pathfile)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    changed = pd.MultiIndex.from_frame(changes.loc[changes['status'] != 'removed', keys])
+    current = pd.MultiIndex.from_arrays([fingerprints[key].astype(changes[key].dtype) for key in keys])
+    fingerprints = fingerprints.loc[current.isin(changed)]
+    removed = changes.loc[changes['status'] == 'removed']
+
+    connection = sqlite3.connect(fingerprint_pathfile)
+    try:
+        with connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS partition_fingerprints (year, month, branch_id, rows, fingerprint, PRIMARY KEY (year, month, branch_id)) WITHOUT ROWID')
+            connection.executemany(
+                'DELETE FROM partition_fingerprints WHERE year = ? AND month = ? AND branch_id = ?',
+                zip(*[_index_values(removed[key]) for key in keys])
+            )
+            connection.executemany(
+                'INSERT OR REPLACE INTO partition_fingerprints VALUES (?, ?, ?, ?, ?)',
+                zip(*[_index_values(fingerprints[column]) for column in keys + ['rows', 'fingerprint']])
+            )
+    finally:
+        connection.close()
+
+def _snapshot_dates(values: pd.Series) -> pd.Series:
+    """Convert dates of an employee snapshot into datetime64, missing values as NaT."""
+    return pd.to_datetime(values, errors='coerce').astype('datetime64[ns]')
+
+def diff_employee_snapshot(snapshot: pd.DataFrame, snapshot_pathfile: str, employee_key: str = 'employe_id') -> pd.DataFrame:
+    """Diff deduplicated employee data against the snapshot saved by `save_employee_snapshot`.
+
+    Only changes of the columns used by the salary per hour are reported. A branch move is the delete of
+    the old (employee, branch) row and the insert of the new one. Every change comes with the inclusive range
+    of timesheet dates whose results it changes, NaT for an unbounded end:
+
+    - 'insert' and 'delete': every date up to the resign_date of the row.
+    - 'salary': every date up to the later resign_date, the resign_date may be changed too.
+    - 'resign': only the dates between the old and the new resign_date.
+
+    Args:
+        snapshot: Deduplicated employee data with one row per employee and branch_id.
+        snapshot_pathfile: Pathfile of the SQLite snapshot, a missing file has no employees.
+        employee_key: Employee ID column of `snapshot`.
+
+    Returns:
+        pd.DataFrame: Employee_id, branch_id, change, from_date and to_date of every change, in key order.
+    """
+    keys = ['employee_id', 'branch_id']
+    current = pd.DataFrame({
+        'employee_id': snapshot[employee_key].to_numpy().astype('int64'),
+        'branch_id': snapshot['branch_id'].to_numpy().astype('int64'),
+        'salary': snapshot['salary'].to_numpy().astype('float64'),
+        'resign_date': _snapshot_dates(snapshot['resign_date']).to_numpy(),
+    })
+
+    previous = pd.DataFrame(columns=keys + ['salary', 'resign_date'])
+    if os.path.exists(snapshot_pathfile):
+        connection = sqlite3.connect(snapshot_pathfile)
+        try:
+            connection.execute('CREATE TABLE IF NOT EXISTS employee_snapshot (employee_id, branch_id, salary, resign_date, PRIMARY KEY (employee_id, branch_id)) WITHOUT ROWID')
+            previous = pd.DataFrame(connection.execute('SELECT employee_id, branch_id, salary, resign_date FROM employee_snapshot').fetchall(), columns=previous.columns)
+        finally:
+            connection.close()
+    previous = previous.astype({'employee_id': 'int64', 'branch_id': 'int64', 'salary': 'float64'})
+    previous['resign_date'] = _snapshot_dates(previous['resign_date'])
+
+    rows = previous.merge(current, on=keys, how='outer', suffixes=('_old', '_new'), indicator=True)
+    old_resign, new_resign = rows['resign_date_old'], rows['resign_date_new']
+    salary_changed = (rows['salary_old'] != rows['salary_new']) & ~(rows['salary_old'].isna() & rows['salary_new'].isna())
+    resign_changed = (old_resign != new_resign) & ~(old_resign.isna() & new_resign.isna())
+
+    # A missing resign_date is an unbounded end, so it is the later one
+    later_resign = old_resign.where(new_resign.notna() & (old_resign.isna() | (old_resign > new_resign)), new_resign)
+    earlier_resign = old_resign.where(old_resign.notna() & (new_resign.isna() | (old_resign < new_resign)), new_resign)
+
+    change = np.select(
+        [rows['_merge'] == 'right_only', rows['_merge'] == 'left_only', salary_changed, resign_changed],
+        ['insert', 'delete', 'salary', 'resign'], default=''
+    )
+    changes = pd.DataFrame({
+        'employee_id': rows['employee_id'],
+        'branch_id': rows['branch_id'],
+        'change': change,
+        'from_date': (earlier_resign + pd.Timedelta(days=1)).where(change == 'resign', pd.NaT),
+        'to_date': np.select(
+            [change == 'insert', change == 'delete'], [new_resign, old_resign], later_resign
+        ).astype('datetime64[ns]'),
+    })
+    return changes.loc[changes['change'] != ''].sort_values(keys, ignore_index=True)
+
+def save_employee_snapshot(snapshot: pd.DataFrame, changes: pd.DataFrame, snapshot_pathfile: str, employee_key: str = 'employe_id') -> None:
+    """Save the changed employees of a snapshot, after the results made stale by them have been recomputed.
+
+    Args:
+        snapshot: Deduplicated employee data diffed by `diff_employee_snapshot`.
+        changes: Changes from `diff_employee_snapshot`.
+        snapshot_pathfile: Pathfile of the SQLite snapshot, created if it does not exist.
+        employee_key: Employee ID column of `snapshot`.
+    """
+    directory = os.path.dirname(snapshot_pathfile)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    changed = pd.MultiIndex.from_frame(changes[['employee_id', 'branch_id']])
+    rows = snapshot.loc[pd.MultiIndex.from_arrays([snapshot[employee_key].to_numpy().astype('int64'), snapshot['branch_id'].to_numpy().astype('int64')]).isin(changed)]
+    resign_dates = _snapshot_dates(rows['resign_date'])
+    deleted = changes.loc[changes['change'] == 'delete']
+
+    connection = sqlite3.connect(snapshot_pathfile)
+    try:
+        with connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS employee_snapshot (employee_id, branch_id, salary, resign_date, PRIMARY KEY (employee_id, branch_id)) WITHOUT ROWID')
+            connection.executemany(
+                'DELETE FROM employee_snapshot WHERE employee_id = ? AND branch_id = ?',
+                zip(_index_values(deleted['employee_id']), _index_values(deleted['branch_id']))
+            )
+            connection.executemany(
+                'INSERT OR REPLACE INTO employee_snapshot VALUES (?, ?, ?, ?)',
+                zip(_index_values(rows[employee_key]), _index_values(rows['branch_id']), _index_values(rows['salary'].astype('float64')), _index_values(resign_dates))
+            )
+    finally:
+        connection.close()
+
+def stale_employee_months(changes: pd.DataFrame, timesheets: pd.DataFrame) -> pd.DataFrame:
+    """Get the (employee, branch, month) keys whose results are stale after employee changes.
+
+    Args:
+        changes: Changes from `diff_employee_snapshot`.
+        timesheets: Deduplicated timesheets with employee_id and typed date, before joining employee data.
+
+    Returns:
+        pd.DataFrame: Unique employee_id, branch_id, year and month of the timesheets in the date range of a change, in key order.
+    """
+    dates = pd.DataFrame({'employee_id': timesheets['employee_id'].astype('int64'), 'date': timesheets['date']})
+    rows = changes.merge(dates.loc[dates['employee_id'].isin(changes['employee_id'])], on='employee_id')
+    stale = (rows['from_date'].isna() | (rows['date'] >= rows['from_date'])) & (rows['to_date'].isna() | (rows['date'] <= rows['to_date']))
+    rows = rows.loc[stale]
+    keys = pd.DataFrame({
+        'employee_id': rows['employee_id'],
+        'branch_id': rows['branch_id'],
+        'year': rows['date'].dt.year,
+        'month': rows['date'].dt.month,
+    })
+    return keys.drop_duplicates().sort_values(['employee_id', 'branch_id', 'year', 'month'], ignore_index=True)
+
+class GroupIndexCache(list):
+    """Group indexes of a processor, most recently used first.
+
+    Every index is checked against the columns it was built for before it is reused.
+    Indexes are checked by buffer addresses of this process, so a pickled cache, e.g. of a processor sent to
+    a worker process, is empty.
+    """
+    def __reduce__(self) -> tuple:
+        return GroupIndexCache, ()
+
+    def find(self, df: pd.DataFrame, keys: List[str]) -> Union[dict, None]:
+        """Get a cached group index whose first keys are `keys` and whose columns are unchanged in `df`.
+        The index found becomes the most recently used one.
+
+        Args:
+            df: Dataframe to be aggregated.
+            keys: Group keys. E.g. ['date', 'branch_id'].
+
+        Returns:
+            Union[dict, None]: The group index, or None if there is none.
+        """
+        for position, index in enumerate(self):
+            if index['keys'][:len(keys)] == keys and set(index['columns']) <= set(df.columns) \
+                    and index['fingerprint'] == _column_fingerprint(df, index['columns']):
+                self.insert(0, self.pop(position))
+                return index
+        return None
+
+    def add(self, index: dict) -> dict:
+        """Cache a group index, dropping the least recently used one above `GROUP_INDEX_CACHE_SIZE`.
+
+        Args:
+            index: Group index from `build_group_index`.
+
+        Returns:
+            dict: The group index.
+        """
+        self.insert(0, index)
+        del self[GROUP_INDEX_CACHE_SIZE:]
+        return index
+
+# Bytes copied per processor stage, only counted by processors created with `track_copies=True`
+COPY_STATS = Counter()
+
+def enable_copy_on_write() -> None:
+    """Enable pandas Copy-on-Write, so dataframes share memory until one of them is modified.
+
+    Copy-on-Write is always enabled since pandas 3.0.
+    """
+    if int(pd.__version__.split('.')[0]) < 3:
+        pd.set_option('mode.copy_on_write', True)
+
+def _column_buffers(values: pd.Series) -> List[np.ndarray]:
+    """Get memory buffers holding the values of a column.
+
+    Args:
+        values: Column of a dataframe.
+
+    Returns:
+        List[np.ndarray]: Arrays viewing the memory of the column.
+    """
+    array = values.array
+    if isinstance(array, pd.Categorical):
+        return [array.codes]
+
+    # Numpy-backed and masked arrays keep their values (and mask) in numpy arrays
+    buffers = [getattr(array, name) for name in ('_ndarray', '_data', '_mask') if isinstance(getattr(array, name, None), np.ndarray)]
+    if buffers:
+        return buffers
+
+    # Arrow-backed arrays are viewed through their Arrow buffers
+    if hasattr(array, '_pa_array'):
+        return [
+            np.frombuffer(buffer, dtype=np.uint8)
+            for chunk in array._pa_array.chunks for buffer in chunk.buffers()
+            if buffer is not None and buffer.size > 0
+        ]
+    return [np.asarray(array)]
+
+def _copied_bytes(before: dict, after: pd.DataFrame) -> int:
+    """Count bytes of columns that were copied instead of sharing memory with the input.
+
+    Args:
+        before: Memory buffers of every input column, from `_column_buffers`.
+        after: Output dataframe.
+
+    Returns:
+        int: Bytes of output columns not sharing memory with the input column of the same name.
+    """
+    copied = 0
+    for column in after.columns:
+        if column not in before:
+            continue
+        buffers = _column_buffers(after[column])
+        shared = any(np.may_share_memory(buffer, old_buffer) for buffer in buffers for old_buffer in before[column])
+        if not shared:
+            copied += int(after[column].memory_usage(index=False, deep=True))
+    return copied
+
+# Converters into canonical dtype per column kind of the typed-column registry
+CANONICAL_CONVERTERS = {
+    'date': parse_dates,
+    'time': parse_time_seconds,
+}
+
+def _has_canonical_dtype(values: pd.Series, kind: str) -> bool:
+    """Check whether a column already carries the canonical dtype of its kind.
+
+    Args:
+        values: Column to be checked.
+        kind: Column kind. E.g. 'date' or 'time'.
+
+    Returns:
+        bool: True if the column does not need to be converted.
+    """
+    if kind == 'date':
+        return pd.api.types.is_datetime64_any_dtype(values)
+    return pd.api.types.is_integer_dtype(values)
+
+def _plan_step(method: Callable) -> Callable:
+    """Decorate processor method for recording its call into the plan of a lazy processor.
+
+    Args:
+        method: Processor method returning the processor itself.
+
+    Returns:
+        Callable: The method, which only appends `(name, arguments)` to `plan` if the processor is lazy.
+    """
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def step(self, *args, **kwargs):
+        if not self.lazy:
+            return method(self, *args, **kwargs)
+
+        arguments = dict(signature.bind(self, *args, **kwargs).arguments)
+        arguments.pop('self')
+        self.plan.append((method.__name__, arguments))
+        return self
+
+    return step
+
+def _loader_columns(method: str, arguments: dict) -> Union[List[str], None]:
+    """Get columns produced by a loader step of a lazy plan.
+
+    Args:
+        method: Name of the loader method.
+        arguments: Arguments of the loader call.
+
+    Returns:
+        Union[List[str], None]: Column names, or None if they can not be known before loading.
+    """
+    if arguments.get('columns') is not None:
+        return list(arguments['columns'])
+
+    if method in ('load_data_from_csv', 'load_appended_data_from_csv'):
+        delimiter = arguments.get('delimiter', ',')
+        try:
+            header = _read_header(arguments['pathfile']).decode().rstrip('\r\n')
+        except OSError:
+            return None
+        return [column.strip('"') for column in header.split(delimiter)]
+
+    if method == 'load_data_from_partitions' and pq is not None:
+        schema_pathfile = os.path.join(arguments['store_dir'], '_common_metadata')
+        if os.path.exists(schema_pathfile):
+            return pq.read_schema(schema_pathfile).names
+    return None
+
+def _as_columns(columns: Union[str, List[str], None]) -> List[str]:
+    """Normalize a column argument into list of columns.
+
+    Args:
+        columns: Column, list of columns, or None.
+
+    Returns:
+        List[str]: List of columns, empty if `columns` is None.
+    """
+    if columns is None:
+        return []
+    return [columns] if isinstance(columns, str) else list(columns)
+
+def _merge_keys(arguments: dict) -> tuple:
+    """Get join keys of a `merge_data` step as lists of left and right columns.
+
+    Args:
+        arguments: Arguments of the `merge_data` call.
+
+    Returns:
+        tuple: Left key columns and right key columns.
+    """
+    on = _as_columns(arguments.get('on'))
+    return on + _as_columns(arguments.get('left_on')), on + _as_columns(arguments.get('right_on'))
+
+def _merge_columns(left: List[str], right: List[str], arguments: dict) -> List[str]:
+    """Get columns produced by a `merge_data` step, with suffixes of overlapping columns as in `pd.merge`.
+
+    Args:
+        left: Columns of the left data.
+        right: Columns of the right data.
+        arguments: Arguments of the `merge_data` call.
+
+    Returns:
+        List[str]: Columns of the merged data.
+    """
+    on = _as_columns(arguments.get('on'))
+    overlap = (set(left) & set(right)) - set(on)
+    columns = [column + '_x' if column in overlap else column for column in left]
+    columns += [column + '_y' if column in overlap else column for column in right if column not in on]
+    return columns
+
+def build_dimension_index(keys: pd.Series, max_slots: int = 1 << 22, max_slots_per_row: int = 4) -> Union[tuple, None]:
+    """Build direct-address index of dimension rows by their small integer key.
+
+    The index has one slot per key between the lowest and highest key, so gaps between keys cost
+    4 bytes per missing key. It is only built while the key range is within `max_slots` slots, or within
+    `max_slots_per_row` slots per row for big dimensions.
+
+    Args:
+        keys: Key column of the dimension. E.g. `employe_id`.
+        max_slots: Maximum number of slots of the index, regardless of the number of rows.
+        max_slots_per_row: Maximum number of slots per row of the dimension, if above `max_slots`.
+
+    Returns:
+        Union[tuple, None]: Lowest key and row position per key offset (-1 for missing keys),
+            or None if the keys are not unique, not integer or too sparse.
+    """
+    if not pd.api.types.is_integer_dtype(keys) or not len(keys) or keys.hasnans or not keys.is_unique:
+        return None
+
+    values = keys.to_numpy(dtype=np.int64)
+    low, high = int(values.min()), int(values.max())
+    if high - low + 1 > max(max_slots_per_row * len(values), max_slots):
+        return None
+    slots = np.full(high - low + 1, -1, dtype=np.int32 if len(values) < 2**31 else np.int64)
+    slots[values - low] = np.arange(len(values))
+    return low, slots
+
+def lookup_join(left: pd.DataFrame, right: pd.DataFrame, on: str = None, left_on: str = None, right_on: str = None, index: tuple = None) -> pd.DataFrame:
+    """Inner join `left` with a dimension by looking up the row of every key in its direct-address index.
+
+    Rows of `left` without dimension row are dropped in the same pass. The result has the same rows,
+    order and columns as `pd.merge(left, right, how='inner')`. If there is no index or the key is not
+    a single integer column, `pd.merge` is used.
+
+    Args:
+        left: Fact data. E.g. timesheets.
+        right: Dimension data with unique keys. E.g. employees.
+        on: Key for joining data, which exists in both data. E.g. 'field1'.
+        left_on: Key of `left` for joining data. E.g. 'field1'.
+        right_on: Key of `right` for joining data. E.g. 'field1'.
+        index: Index of `right` from `build_dimension_index`.
+
+    Returns:
+        pd.DataFrame: The joined data.
+    """
+    arguments = {'on': on, 'left_on': left_on, 'right_on': right_on}
+    left_keys, right_keys = _merge_keys(arguments)
+    if index is None or len(left_keys) != 1 or not pd.api.types.is_integer_dtype(left[left_keys[0]]):
+        return pd.merge(left, right, on=on, left_on=left_on, right_on=right_on)
+
+    # Row of the dimension for every key, keys outside the index have no row
+    low, slots = index
+    offsets = left[left_keys[0]].to_numpy(dtype=np.int64, na_value=low - 1) - low
+    in_range = (offsets >= 0) & (offsets < len(slots))
+    positions = np.full(len(left), -1, dtype=np.int64)
+    positions[in_range] = slots[offsets[in_range]]
+    matched = np.flatnonzero(positions >= 0)
+    positions = positions[matched]
+
+    # Gather every column by position, without aligning indexes
+    names = _merge_columns(list(left.columns), list(right.columns), arguments)
+    values = [left[column].array.take(matched) for column in left.columns]
+    values += [right[column].array.take(positions) for column in right.columns if column not in _as_columns(on)]
+    return pd.DataFrame(dict(zip(names, values)), copy=False)
+
+def _step_input_columns(method: str, arguments: dict, required: set) -> Union[set, None]:
+    """Get columns a step of a lazy plan reads for producing the `required` columns.
+
+    Args:
+        method: Name of the step method.
+        arguments: Arguments of the step call.
+        required: Columns read by the following steps, or None if all columns are needed.
+
+    Returns:
+        Union[set, None]: Columns needed in the input of the step, or None if all columns are needed.
+    """
+    if method in PLAN_AGGREGATE_COLUMNS:
+        return set(PLAN_AGGREGATE_COLUMNS[method][0])
+    if method == 'select_fields':
+        return set(arguments['fields'])
+    if required is None:
+        return None
+
+    if method in PLAN_FILTER_COLUMNS:
+        return required | PLAN_FILTER_COLUMNS[method]
+    if method == 'compact_dtypes':
+        return set(required)
+    if method == 'remove_duplicate_data':
+        return (required - {'is_superseded'}) | set(_as_columns(arguments['partitioning_keys'])) | {arguments['ordering_key']}
+    if method == 'calculate_work_hour':
+        return (required - {'work_hour'}) | {'checkin', 'checkout'}
+    if method == 'calculate_salary_per_hour':
+        return (required - {'salary_per_hour'}) | {'total_work_hour', 'total_salary'}
+    if method == 'filter_changed_partitions':
+        return required | set(PARTITION_FINGERPRINT_COLUMNS) | {'branch_id'}
+    if method == 'diff_employee_snapshot':
+        return required | {arguments.get('employee_key', 'employe_id'), 'branch_id', 'salary', 'resign_date'}
+    return None
+
+def _filter_commutes(method: str, arguments: dict, columns: set) -> bool:
+    """Check whether a filter reading `columns` gives the same result when applied before a step.
+
+    Args:
+        method: Name of the step method.
+        arguments: Arguments of the step call.
+        columns: Columns read by the filter.
+
+    Returns:
+        bool: True if the filter can be moved below the step.
+    """
+    if method in PLAN_FILTER_COLUMNS or method == 'compact_dtypes':
+        return True
+    if method == 'select_fields':
+        return columns <= set(arguments['fields'])
+    if method == 'calculate_work_hour':
+        return 'work_hour' not in columns
+    if method == 'remove_duplicate_data':
+        # Only filters on the partitioning keys keep or drop whole partitions
+        return columns <= set(_as_columns(arguments['partitioning_keys']))
+    return False
+
+class TimesheetEmployeeProcessor:
+    def __init__(self, df: pd.DataFrame = None, copy: bool = True, track_copies: bool = False, lazy: bool = False, aggregation_engine: str = 'auto', work_time_unit: str = 'hour') -> None:
+        """Create processor for `df`, or an empty processor for loading data.
+
+        Args:
+            df: Existing dataframe to be processed.
+            copy: Deep copy `df`. If False, `df` is shared using pandas Copy-on-Write.
+            track_copies: Count bytes copied by every stage into `COPY_STATS`.
+            lazy: Record chained methods into a plan, which is optimized and run by `get_data`.
+            aggregation_engine: Engine of `group_aggregate` used by the aggregation methods, 'auto' or 'hash'.
+            work_time_unit: Unit of the work hour columns, 'hour' for float hours, or 'second' for int64 seconds,
+                which are summed exactly and only divided into hours by the salary per hour calculation.
+        """
+        # Registry of columns already converted into their canonical dtype, e.g. {'date': 'date'}
+        self.typed_columns = {}
+
+        # Count bytes copied by every stage into `COPY_STATS`
+        self.track_copies = track_copies
+
+        if df is None:
+            # If no existing dataframe to be processed, set to None
+            self.data = None
+        else:
+            if copy:
+                # If there's existing dataframe to be processed, copy the dataframe
+                self.data = df.copy()
+                if track_copies:
+                    COPY_STATS['__init__'] += int(df.memory_usage(index=False, deep=True).sum())
+            else:
+                # Share memory with the dataframe, Copy-on-Write only copies columns once they are modified
+                enable_copy_on_write()
+                self.data = df.copy(deep=False)
+
+            # Continue with the typed-column registry of the stage that produced the dataframe
+            self.typed_columns.update(df.attrs.get('typed_columns', {}))
+
+        # Iterator of dataframe chunks, only set when the data is processed in streaming mode
+        self.chunks = None
+
+        # Checkpoint of rows loaded by `load_appended_data_from_csv`, not saved yet
+        self.checkpoint = None
+
+        # Partition fingerprints checked by `filter_changed_partitions`, not saved yet
+        self.partition_changes = None
+
+        # Employee changes found by `diff_employee_snapshot`, not saved yet
+        self.employee_changes = None
+
+        # Fold keys folded into the month-to-date state by `aggregate_salary_per_hour`, not saved as loaded yet
+        self.month_state_folds = None
+
+        # Memory usage per column before and after `compact_dtypes`
+        self.memory_report = {}
+
+        # Engine of `group_aggregate` used by the aggregation methods
+        self.aggregation_engine = aggregation_engine
+
+        # Unit of work hour columns calculated by this processor, the unit of existing columns is kept in `typed_columns`
+        if work_time_unit not in ('hour', 'second'):
+            raise ValueError(f"Unknown work time unit '{work_time_unit}', expected 'hour' or 'second'")
+        self.work_time_unit = work_time_unit
+
+        # Group indexes shared by the aggregation methods of the processor
+        self.group_indexes = GroupIndexCache()
+
+        # Plan of recorded `(method, arguments)` steps, only used in lazy mode
+        self.lazy = lazy
+        self.plan = []
+        
+    @_plan_step
+    def load_data_from_csv(self, pathfile: str, delimiter: str = ',', schema: dict = None, chunksize: int = None, cache_dir: str = None, date = None, workers: int = None, columns: List[str] = None):
+        """Load data from CSV and set to `data` attribute
+
+        If `chunksize` is set, the CSV is streamed in chunks and every following row-wise method
+        is applied chunk by chunk, so their peak memory depends on the chunk size instead of the file size.
+        Deduplication and aggregations still materialize the combined partial results of all chunks.
+
+        If `cache_dir` is set, the CSV is converted into typed Parquet once and later loads read the
+        Parquet file until the CSV size, mtime or content changes.
+
+        Args:
+            pathfile: Pathfile for CSV file.
+            delimiter: Delimiter for reading CSV file.
+            schema: Declared column types. E.g. `TIMESHEET_SCHEMA`. If not set, column types are inferred.
+            chunksize: Number of rows per chunk for streaming mode. If not set, the whole file is loaded.
+            cache_dir: Directory for the columnar cache. If not set or pyarrow is not installed, the CSV is always parsed.
+            date: Only load rows of this date, or set or range of dates. E.g. '2020-01-01'. The rows are read by seeking with the date index of the CSV.
+            workers: Number of processes for parsing the CSV in parallel, used if the whole file is loaded without cache.
+            columns: Only load these columns. If not set, all columns are loaded.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        cache_pathfile = None
+        if cache_dir is not None and date is None:
+            cache_pathfile = _get_columnar_cache(pathfile, delimiter, schema, cache_dir)
+
+        if date is not None:
+            data = read_csv_by_date(pathfile, date, delimiter=delimiter, schema=schema, chunksize=chunksize, columns=columns)
+        elif cache_pathfile is not None:
+            data = read_columnar(cache_pathfile, chunksize=chunksize, columns=columns)
+        elif workers is not None and chunksize is None:
+            data = read_csv_parallel(pathfile, delimiter=delimiter, schema=schema, workers=workers)
+            if columns is not None:
+                data = data[columns]
+        else:
+            data = read_csv(pathfile, delimiter=delimiter, schema=schema, chunksize=chunksize, columns=columns)
+
+        if chunksize is None:
+            self.data, self.chunks = data, None
+        else:
+            self.data, self.chunks = None, data
+        self._register_schema(schema)
+        return self
+
+    @_plan_step
+    def load_appended_data_from_csv(self, pathfile: str, checkpoint_pathfile: str, delimiter: str = ',', schema: dict = None, chunksize: int = None):
+        """Load only rows appended to CSV since the last saved checkpoint and set to `data` attribute.
+
+        The new checkpoint is kept in `checkpoint` attribute and only written by `save_checkpoint`,
+        so rows are read again if the run fails before they are processed. If the CSV was truncated
+        or rewritten, the whole file is loaded and `checkpoint['full_rescan']` is True.
+
+        Args:
+            pathfile: Pathfile for CSV file.
+            checkpoint_pathfile: Pathfile for checkpoint of the processed byte offset and row count.
+            delimiter: Delimiter for reading CSV file.
+            schema: Declared column types. E.g. `TIMESHEET_SCHEMA`.
+            chunksize: Number of rows per chunk for streaming mode. If not set, the appended rows are loaded at once.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        checkpoint = None
+        if os.path.exists(checkpoint_pathfile):
+            with open(checkpoint_pathfile) as file:
+                checkpoint = json.load(file)
+
+        data, checkpoint = read_appended_csv(pathfile, checkpoint, delimiter=delimiter, schema=schema, chunksize=chunksize)
+        self.checkpoint = dict(checkpoint, pathfile=checkpoint_pathfile)
+        if chunksize is None:
+            self.data, self.chunks = data, None
+        else:
+            self.data, self.chunks = None, data
+        self._register_schema(schema)
+        return self
+
+    def save_checkpoint(self):
+        """Save checkpoint of `load_appended_data_from_csv`, after the loaded rows have been processed.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        checkpoint = dict(self.checkpoint)
+        checkpoint_pathfile = checkpoint.pop('pathfile')
+
+        # Write into a temporary file first, so a failed write keeps the previous checkpoint
+        with open(checkpoint_pathfile + '.tmp', 'w') as file:
+            json.dump(checkpoint, file)
+        os.replace(checkpoint_pathfile + '.tmp', checkpoint_pathfile)
+        return self
+
+    @_plan_step
+    def load_data_from_partitions(self, store_dir: str, date = None, chunksize: int = None, columns: List[str] = None):
+        """Load timesheet data from partitioned store built by `build_partition_store` and set to `data` attribute.
+
+        Args:
+            store_dir: Root directory of the partitioned store.
+            date: Only load the partitions of this date, or set or range of dates. E.g. '2020-01-01'. If not set, all partitions are loaded.
+            chunksize: Number of rows per chunk for streaming mode. If not set, the partitions are loaded at once.
+            columns: Only load these columns. If not set, all columns are loaded.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        data = read_partitions(store_dir, date=date, chunksize=chunksize, columns=columns)
+        if chunksize is None:
+            self.data, self.chunks = data, None
+        else:
+            self.data, self.chunks = None, data
+        return self
+
+    def _register_schema(self, schema: dict = None):
+        """Register date and time columns of a declared schema as typed.
+
+        Args:
+            schema: Declared column types. E.g. `TIMESHEET_SCHEMA`.
+        """
+        for column, column_type in (schema or {}).items():
+            if column_type in CANONICAL_CONVERTERS:
+                self.typed_columns[column] = column_type
+
+    def _ensure_typed(self, df: pd.DataFrame, column: str, kind: str) -> pd.DataFrame:
+        """Convert a column into the canonical dtype of its kind, unless it is already converted.
+
+        Args:
+            df: Dataframe having the column.
+            column: Name of the column.
+            kind: Column kind. E.g. 'date' or 'time'.
+
+        Returns:
+            pd.DataFrame: Dataframe with the converted column.
+        """
+        # The registry is checked against the dtype, so a column replaced by untyped values is converted again
+        if self.typed_columns.get(column) == kind and _has_canonical_dtype(df[column], kind):
+            return df
+
+        if not _has_canonical_dtype(df[column], kind):
+            df[column] = CANONICAL_CONVERTERS[kind](df[column])
+        self.typed_columns[column] = kind
+        return df
+
+    def _work_time_unit(self, df: pd.DataFrame, column: str) -> str:
+        """Get the unit of a work hour column, 'second' if it holds integer seconds.
+
+        The unit is registered in `typed_columns`, which is lost with the `DataFrame.attrs` of data joined
+        by `pd.merge`. An unregistered integer column of a processor in 'second' unit is taken as seconds too.
+
+        Args:
+            df: Dataframe having the column.
+            column: Name of the column. E.g. 'total_work_hour'.
+
+        Returns:
+            str: 'hour' or 'second'.
+        """
+        registered = self.typed_columns.get(column) == 'seconds' or (column not in self.typed_columns and self.work_time_unit == 'second')
+        if registered and _has_canonical_dtype(df[column], 'seconds'):
+            return 'second'
+        return 'hour'
+
+    def _register_work_time(self, columns: List[str], unit: str) -> None:
+        """Register the unit of work hour columns, so following stages and processors divide them correctly.
+
+        Args:
+            columns: Names of the columns. E.g. ['total_work_hour'].
+            unit: 'hour' or 'second'.
+        """
+        for column in columns:
+            if unit == 'second':
+                self.typed_columns[column] = 'seconds'
+            else:
+                self.typed_columns.pop(column, None)
+
+    def is_streaming(self) -> bool:
+        """Check whether the data is processed chunk by chunk.
+
+        Returns:
+            bool: True if the data is stored as iterator of chunks.
+        """
+        return self.chunks is not None
+
+    def _transform(self, func: Callable[[pd.DataFrame], pd.DataFrame], stage: str = None):
+        """Apply row-wise `func` to the stored data, lazily for every chunk in streaming mode.
+
+        Args:
+            func: Function that receives and returns a dataframe.
+            stage: Name of the stage for `COPY_STATS`.
+        """
+        func = self._track_copies(func, stage)
+        if self.is_streaming():
+            chunks = self.chunks
+            self.chunks = (func(chunk) for chunk in chunks)
+        else:
+            self.data = func(self.data)
+
+    def _aggregate(self, func: Callable[[pd.DataFrame], pd.DataFrame], combine: Callable[[pd.DataFrame], pd.DataFrame] = None, stage: str = None):
+        """Aggregate the stored data with `func`.
+
+        In streaming mode `func` is applied for every chunk, then the partial results are
+        combined with `combine` (or `func` if not set) and the processor leaves streaming mode.
+
+        Args:
+            func: Function that receives and returns a dataframe.
+            combine: Function for combining concatenated partial results.
+            stage: Name of the stage for `COPY_STATS`.
+        """
+        func = self._track_copies(func, stage)
+        if self.is_streaming():
+            partials = [func(chunk) for chunk in self.chunks]
+            self.chunks = None
+            self.data = (combine or func)(concat_data(partials))
+        else:
+            self.data = func(self.data)
+
+    def _track_copies(self, func: Callable[[pd.DataFrame], pd.DataFrame], stage: str = None) -> Callable[[pd.DataFrame], pd.DataFrame]:
+        """Wrap `func` for adding bytes it copied into `COPY_STATS`, if copies are tracked.
+
+        Args:
+            func: Function that receives and returns a dataframe.
+            stage: Name of the stage.
+
+        Returns:
+            Callable[[pd.DataFrame], pd.DataFrame]: The wrapped function, or `func` itself if copies are not tracked.
+        """
+        if not self.track_copies or stage is None:
+            return func
+
+        def tracked(df: pd.DataFrame) -> pd.DataFrame:
+            # Keep references of the input buffers, the input may be modified by `func`
+            before = {column: _column_buffers(df[column]) for column in df.columns}
+            result = func(df)
+            COPY_STATS[stage] += _copied_bytes(before, result)
+            return result
+
+        return tracked
+
+    def _group_index(self, df: pd.DataFrame, keys: List[str]) -> Union[dict, None]:
+        """Get the group index of `keys` over `df` from the cache, or build and cache it.
+
+        A new index is built over every `GROUP_INDEX_KEYS` column of `df`, so finer aggregations of the same data reuse it.
+        Chunks are not indexed, their group codes would not be reused.
+
+        Args:
+            df: Dataframe to be aggregated.
+            keys: Group keys, first keys of `GROUP_INDEX_KEYS`. E.g. ['date', 'branch_id'].
+
+        Returns:
+            Union[dict, None]: The group index, or None with the 'hash' engine, in streaming mode or for too many distinct key combinations.
+        """
+        if self.aggregation_engine != 'auto' or self.is_streaming() or not len(df):
+            return None
+
+        index = self.group_indexes.find(df, keys)
+        if index is not None or not set(keys) <= set(df.columns):
+            return index
+
+        available = [key for key in GROUP_INDEX_KEYS if key in df.columns]
+        for index_keys in (available, keys):
+            if index_keys[:len(keys)] == keys:
+                index = build_group_index(df, index_keys)
+                if index is not None:
+                    return self.group_indexes.add(index)
+        return None
+
+    def _indexed_aggregate(self, df: pd.DataFrame, keys: List[str], aggregations: dict, values: pd.DataFrame = None) -> Union[pd.DataFrame, None]:
+        """Aggregate columns grouped by `keys` with the shared group index, caching the group index of the result.
+
+        Args:
+            df: Dataframe to be aggregated.
+            keys: Group keys, first keys of `GROUP_INDEX_KEYS`. E.g. ['date', 'branch_id'].
+            aggregations: Output column mapped to (input column, 'sum' or 'max').
+            values: Dataframe with the input columns, if they are not in `df`. It must have the rows of `df`.
+
+        Returns:
+            Union[pd.DataFrame, None]: Same result as `group_aggregate` with year and month for `date`,
+                or None if there is no group index or a column is not supported.
+        """
+        values = df if values is None else values
+        for column, func in aggregations.values():
+            if func not in ('sum', 'max') or not isinstance(values[column].dtype, np.dtype) or values[column].dtype.kind not in 'iuf':
+                return None
+
+        index = self._group_index(df, keys)
+        if index is None:
+            return None
+
+        result, groups = aggregate_group_index(values, index, keys, aggregations)
+        if len(keys) > 1:
+            self.group_indexes.add(_result_group_index(result, index, keys, groups))
+        return result
+
+    def _plan_columns(self) -> List[Union[List[str], None]]:
+        """Get columns of the stored data and columns produced by every step of the plan.
+
+        Returns:
+            List[Union[List[str], None]]: Columns before the first step followed by columns after every step,
+                None where they can not be known before running the plan.
+        """
+        columns = list(self.data.columns) if self.data is not None and not self.is_streaming() else None
+        plan_columns = [columns]
+        for method, arguments in self.plan:
+            if method.startswith('load_'):
+                columns = _loader_columns(method, arguments)
+            elif method in PLAN_AGGREGATE_COLUMNS:
+                columns = (['date'] if arguments.get('by_date') else []) + list(PLAN_AGGREGATE_COLUMNS[method][1])
+            elif method == 'select_fields':
+                columns = list(arguments['fields'])
+            elif columns is None:
+                pass
+            elif method == '_drop_fields':
+                columns = [column for column in columns if column not in arguments['fields']]
+            elif method in ('calculate_work_hour', 'calculate_salary_per_hour'):
+                added = 'work_hour' if method == 'calculate_work_hour' else 'salary_per_hour'
+                columns = columns + [added] if added not in columns else columns
+            elif method == 'merge_data':
+                other_columns = self._other_columns(arguments['other'])
+                columns = None if other_columns is None else _merge_columns(columns, other_columns, arguments)
+            elif method == 'remove_duplicate_data' and arguments.get('on_superseded') == 'flag' and arguments.get('dedup_index') is not None:
+                columns = columns + ['is_superseded'] if 'is_superseded' not in columns else columns
+            elif method not in PLAN_FILTER_COLUMNS and method not in ('compact_dtypes', 'remove_duplicate_data', 'filter_changed_partitions', 'diff_employee_snapshot'):
+                columns = None
+            plan_columns.append(columns)
+        return plan_columns
+
+    @staticmethod
+    def _other_columns(other) -> Union[List[str], None]:
+        """Get columns of the `other` data of a `merge_data` step.
+
+        Args:
+            other: Dataframe or processor.
+
+        Returns:
+            Union[List[str], None]: Columns of the other data, or None if they can not be known before running its plan.
+        """
+        if isinstance(other, pd.DataFrame):
+            return list(other.columns)
+        if other.lazy and other.plan:
+            return other._plan_columns()[-1]
+        if other.data is not None and not other.is_streaming():
+            return list(other.data.columns)
+        return None
+
+    def _push_down_filters(self):
+        """Move every filter step of the plan below the steps it does not depend on.
+
+        A filter below a `merge_data` step is applied on the side having its columns,
+        and a date filter right above a loader is done by the loader itself.
+        """
+        filters = [step for step in self.plan if step[0] in PLAN_FILTER_COLUMNS]
+        for step in filters:
+            method, arguments = step
+            columns = PLAN_FILTER_COLUMNS[method]
+            position = next(index for index, planned in enumerate(self.plan) if planned is step)
+
+            while position > 0:
+                previous_method, previous_arguments = self.plan[position - 1]
+
+                # Read only the rows of the date, instead of filtering all loaded rows
+                if previous_method in PLAN_PRUNABLE_LOADERS and method == 'filter_timesheets_by_date' and previous_arguments.get('date') is None:
+                    previous_arguments['date'] = arguments['date']
+                    del self.plan[position]
+                    break
+
+                if previous_method == 'merge_data':
+                    left_columns = self._plan_columns()[position - 1]
+                    right_columns = self._other_columns(previous_arguments['other'])
+                    how = previous_arguments.get('how', 'inner')
+                    if left_columns is None or right_columns is None:
+                        break
+
+                    if columns <= set(left_columns) and not columns & set(right_columns) and how in ('inner', 'left'):
+                        # Filter the left data before joining
+                        self.plan[position - 1], self.plan[position] = step, self.plan[position - 1]
+                        position -= 1
+                        continue
+
+                    other = previous_arguments['other']
+                    if columns <= set(right_columns) and not columns & set(left_columns) and how in ('inner', 'right') and isinstance(other, TimesheetEmployeeProcessor) and other.lazy:
+                        # Filter the right data before joining, inside its own plan
+                        other.plan.append((method, dict(arguments)))
+                        del self.plan[position]
+                    break
+
+                if not _filter_commutes(previous_method, previous_arguments, columns):
+                    break
+                self.plan[position - 1], self.plan[position] = step, self.plan[position - 1]
+                position -= 1
+
+    def _prune_columns(self):
+        """Read only columns needed by the plan and drop every column right after its last use.
+
+        The needed columns are collected from the last step backwards, `select_fields` and
+        loader steps are narrowed to them and `_drop_fields` steps are added for the other columns.
+        """
+        # Columns needed after every step, narrowing selects and loaders on the way
+        plan_columns = self._plan_columns()
+        required = None
+        required_after = [None] * len(self.plan)
+        for position in reversed(range(len(self.plan))):
+            method, arguments = self.plan[position]
+            required_after[position] = required
+
+            if method == 'select_fields' and required is not None:
+                arguments['fields'] = [field for field in arguments['fields'] if field in required]
+            elif method in PLAN_PRUNABLE_LOADERS and required is not None and plan_columns[position + 1] is not None:
+                arguments['columns'] = [column for column in plan_columns[position + 1] if column in required]
+
+            if method == 'merge_data':
+                required = self._prune_merge_columns(plan_columns[position], arguments, required)
+            elif method.startswith('load_'):
+                required = None
+            else:
+                required = _step_input_columns(method, arguments, required)
+
+        # Drop columns right after their last use, unless they are selected by the next step anyway
+        plan_columns = self._plan_columns()
+        pruned, dropped = [], set()
+        for position, (method, arguments) in enumerate(self.plan):
+            pruned.append((method, arguments))
+            required, columns = required_after[position], plan_columns[position + 1]
+            if columns is not None:
+                # Columns dropped before stay dropped, unless the step creates them again
+                dropped -= set(columns) - set(plan_columns[position] or [])
+                columns = [column for column in columns if column not in dropped]
+            if required is None or columns is None or method == 'select_fields' \
+                or position + 1 < len(self.plan) and self.plan[position + 1][0] == 'select_fields':
+                continue
+
+            unused = [column for column in columns if column not in required]
+            if unused:
+                pruned.append(('_drop_fields', {'fields': unused}))
+                dropped.update(unused)
+        self.plan = pruned
+
+    def _prune_merge_columns(self, left_columns: Union[List[str], None], arguments: dict, required: Union[set, None]) -> Union[set, None]:
+        """Split columns needed after a `merge_data` step into both of its sides.
+
+        The columns needed from the other data are selected at the end of its plan, if it is lazy.
+
+        Args:
+            left_columns: Columns of the stored data before the `merge_data` step.
+            arguments: Arguments of the `merge_data` call.
+            required: Columns read by the following steps, or None if all columns are needed.
+
+        Returns:
+            Union[set, None]: Columns needed from the stored data, or None if all columns are needed.
+        """
+        right_columns = self._other_columns(arguments['other'])
+        if required is None or left_columns is None or right_columns is None:
+            return None
+
+        left_keys, right_keys = _merge_keys(arguments)
+        left_required = (required & set(left_columns)) | set(left_keys)
+        right_required = (required & set(right_columns)) | set(right_keys)
+
+        # Overlapping columns are kept on both sides, so their suffixes stay the same
+        for column in set(left_columns) & set(right_columns):
+            if column in left_required or column in right_required or {column + '_x', column + '_y'} & required:
+                left_required.add(column)
+                right_required.add(column)
+
+        other = arguments['other']
+        fields = [column for column in right_columns if column in right_required]
+        if isinstance(other, TimesheetEmployeeProcessor) and other.lazy and fields != right_columns:
+            other.plan.append(('select_fields', {'fields': fields}))
+        return left_required
+
+    def _optimize_plan(self):
+        """Optimize the plan by pushing filters down and pruning columns.
+
+        Filters and selects pushed into a lazy processor joined by `merge_data` are added into a copy of it,
+        so the processor itself still gets its whole data for other uses.
+        """
+        for position, (method, arguments) in enumerate(self.plan):
+            other = arguments.get('other') if method == 'merge_data' else None
+            if isinstance(other, TimesheetEmployeeProcessor) and other.lazy:
+                other = copy.copy(other)
+                other.plan = [(step_method, dict(step_arguments)) for step_method, step_arguments in other.plan]
+                other.typed_columns = dict(other.typed_columns)
+                self.plan[position] = (method, dict(arguments, other=other))
+        self._push_down_filters()
+        self._prune_columns()
+
+    def _execute_plan(self):
+        """Optimize and run the recorded plan, if the processor is lazy."""
+        if not self.lazy or not self.plan:
+            return
+
+        self._optimize_plan()
+        executor = TimesheetEmployeeProcessor(
+            self.data, copy=False, track_copies=self.track_copies, aggregation_engine=self.aggregation_engine,
+            work_time_unit=self.work_time_unit
+        )
+        executor.chunks, executor.typed_columns, executor.memory_report = self.chunks, self.typed_columns, self.memory_report
+        executor.group_indexes = self.group_indexes
+
+        # Release every step once it is run, so data referenced by its arguments can be freed
+        plan, self.plan, self.data, self.chunks = self.plan, [], None, None
+        while plan:
+            method, arguments = plan.pop(0)
+            getattr(executor, method)(**arguments)
+
+        self.data, self.chunks, self.checkpoint = executor.data, executor.chunks, executor.checkpoint
+        self.partition_changes, self.employee_changes = executor.partition_changes, executor.employee_changes
+        self.month_state_folds = executor.month_state_folds
+
+    def explain(self) -> str:
+        """Describe the optimized plan of a lazy processor.
+
+        Returns:
+            str: One line per step, with the plan of a lazy `merge_data` side indented below it.
+        """
+        self._optimize_plan()
+        lines = []
+        for method, arguments in self.plan:
+            rendered = []
+            for name, value in arguments.items():
+                if isinstance(value, TimesheetEmployeeProcessor):
+                    value = 'TimesheetEmployeeProcessor(lazy=True)' if value.lazy and value.plan else 'TimesheetEmployeeProcessor()'
+                elif isinstance(value, pd.DataFrame):
+                    value = f'DataFrame({len(value)} rows)'
+                else:
+                    value = repr(value)
+                rendered.append(f'{name}={value}')
+            lines.append(f"{method}({', '.join(rendered)})")
+
+            other = arguments.get('other')
+            if isinstance(other, TimesheetEmployeeProcessor) and other.lazy and other.plan:
+                lines.extend('    ' + line for line in other.explain().splitlines())
+        return '\n'.join(lines)
+
+    def iter_chunks(self) -> Iterator[pd.DataFrame]:
+        """Iterate the stored data chunk by chunk.
+
+        Returns:
+            Iterator[pd.DataFrame]: Chunks of the stored data, or the whole data as one chunk if not in streaming mode.
+        """
+        self._execute_plan()
+        if self.is_streaming():
+            chunks, self.chunks = self.chunks, None
+            yield from chunks
+        elif self.data is not None:
+            yield self.data
+
+    @_plan_step
+    def compact_dtypes(self, plan: dict = None):
+        """Convert stored data into compact dtypes and record bytes saved per column.
+
+        Args:
+            plan: Compact dtype per column. If not set, `COMPACT_DTYPE_PLAN` is used.
+                Remaining string columns are converted into Arrow-backed strings.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        plan = COMPACT_DTYPE_PLAN if plan is None else plan
+
+        def compact(df: pd.DataFrame) -> pd.DataFrame:
+            df = df.copy(deep=False)
+            for column in df.columns:
+                before = df[column]
+                df[column] = _compact_column(before, plan.get(column))
+
+                # Add memory usage of the column, summed over all chunks in streaming mode
+                report = self.memory_report.setdefault(column, {'bytes_before': 0, 'bytes_after': 0})
+                report['dtype_before'] = str(before.dtype)
+                report['dtype_after'] = str(df[column].dtype)
+                report['bytes_before'] += before.memory_usage(index=False, deep=True)
+                report['bytes_after'] += df[column].memory_usage(index=False, deep=True)
+            return df
+
+        self._transform(compact, stage='compact_dtypes')
+        return self
+
+    def get_memory_report(self) -> pd.DataFrame:
+        """Retrieve memory usage per column before and after `compact_dtypes`.
+
+        In streaming mode, the report only covers the chunks processed so far.
+
+        Returns:
+            pd.DataFrame: Dtype and bytes before and after conversion, and bytes saved per column.
+        """
+        self._execute_plan()
+        report = pd.DataFrame.from_dict(self.memory_report, orient='index', columns=['dtype_before', 'dtype_after', 'bytes_before', 'bytes_after'])
+        report['bytes_saved'] = report['bytes_before'] - report['bytes_after']
+        return report.rename_axis('column').reset_index()
+
+    @_plan_step
+    def remove_duplicate_data(self, partitioning_keys: Union[str, List[str]], ordering_key: str, ascending_order: bool = True, engine: str = 'sort', memory_budget: int = None, spill_dir: str = None, dedup_index: str = None, on_superseded: str = 'skip'):
+        """Remove duplicate data using rank that partitioned by `patitioning_keys`
+        and ordered by `ordering_key`
+
+        If `memory_budget` is set, the data is deduplicated out of core by `remove_duplicates_out_of_core`
+        and the processor continues in streaming mode with one chunk per spilled bucket.
+
+        If `dedup_index` is set, the remaining rows are also checked against the rows kept by
+        earlier runs with `check_dedup_index`, so late duplicates of already loaded partitions are caught.
+
+        Args:
+            partitioning_keys: Key for partitioning rank data. E.g. 'field1' or ['field1', 'field2'].
+            ordering_key: Key for ordering rank data. E.g. 'field1;.
+            ascending_order: Ranking data using ascending ordering.
+            engine: 'sort' for one sort over encoded keys with `remove_duplicates_sorted`,
+                or 'groupby' for `idxmin`/`idxmax` over a groupby. Both give the same rows.
+            memory_budget: Maximum bytes of spilled rows deduplicated at once. If not set, the data is deduplicated in memory.
+            spill_dir: Parent directory for the spill files of out-of-core mode. If not set, the system temporary directory is used.
+            dedup_index: Pathfile of the SQLite index of rows kept by earlier runs. If not set, only the stored data is deduplicated.
+            on_superseded: 'skip' for dropping rows superseded by earlier runs, or 'flag' for keeping them with `is_superseded` column.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        if engine not in ('sort', 'groupby'):
+            raise ValueError(f"Unknown deduplication engine '{engine}', expected 'sort' or 'groupby'")
+        if on_superseded not in ('skip', 'flag'):
+            raise ValueError(f"Unknown on_superseded '{on_superseded}', expected 'skip' or 'flag'")
+
+        def remove_duplicate(df: pd.DataFrame) -> pd.DataFrame:
+            if engine == 'sort':
+                return remove_duplicates_sorted(df, partitioning_keys, ordering_key, ascending_order)
+
+            idx = df.groupby(partitioning_keys, observed=True)[ordering_key]
+            
+            if ascending_order: idx = idx.idxmin()
+            else: idx = idx.idxmax()
+            
+            # Set data based on the previous index
+            return df.loc[idx].reset_index(drop=True)
+
+        if memory_budget is not None:
+            chunks = self.chunks if self.is_streaming() else iter([self.data])
+            deduplicate = self._track_copies(remove_duplicate, 'remove_duplicate_data')
+            self.data, self.chunks = None, remove_duplicates_out_of_core(chunks, partitioning_keys, deduplicate, memory_budget, spill_dir=spill_dir)
+        else:
+            # In streaming mode, duplicates are removed inside every chunk first and
+            # the remaining records of all chunks are concatenated and ranked again
+            self._aggregate(remove_duplicate, stage='remove_duplicate_data')
+
+        if dedup_index is not None:
+            self._transform(
+                lambda df: check_dedup_index(df, dedup_index, partitioning_keys, ordering_key, ascending_order, on_superseded),
+                stage='check_dedup_index'
+            )
+        return self
+    
+    @_plan_step
+    def filter_timesheets_by_date(self, date:str):
+        """Filtering data by `date` param
+
+        Several dates are filtered in one pass, e.g. for catching up days missed by the daily run.
+
+        Args:
+            date: Date value, or set or range of date values, for filtering data. E.g. '2020-01-01',
+                ['2020-01-01', '2020-01-03'] or `pd.date_range('2020-01-01', '2020-01-07')`.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        self._transform(lambda df: filter_by_date(df, date), stage='filter_timesheets_by_date')
+        return self
+
+    @_plan_step
+    def filter_timesheets_until(self, date):
+        """Filtering data up to `date` param, including it.
+
+        Args:
+            date: Last date value for filtering data. E.g. '2020-01-01'.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        def until(df: pd.DataFrame) -> pd.DataFrame:
+            # Compare with the same type as the date column, typed column is datetime and untyped column is string
+            last = pd.Timestamp(date).normalize()
+            if not pd.api.types.is_datetime64_any_dtype(df['date']):
+                last = last.strftime('%Y-%m-%d')
+            return df.loc[df['date'] <= last]
+
+        self._transform(until, stage='filter_timesheets_until')
+        return self
+    
+    def get_data(self) -> pd.DataFrame:
+        """Retrieve the current data stored in the instance.
+
+        In streaming mode, the remaining chunks are concatenated into one dataframe.
+        In lazy mode, the recorded plan is optimized and run first.
+
+        Returns:
+            pd.DataFrame: THe current data stored in the instance.
+        """
+        self._execute_plan()
+        if self.is_streaming():
+            self._aggregate(lambda df: df)
+
+        # Keep the typed-column registry with the data for the next processor
+        if self.data is not None:
+            self.data.attrs['typed_columns'] = dict(self.typed_columns)
+        return self.data
+    
+    @_plan_step
+    def filter_valid_data(self):
+        """Filtering for only valid data.
+        
+        This method filtering invalid data which have `date` value greater than `resign_date`.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        def filter_valid(df: pd.DataFrame) -> pd.DataFrame:
+            # Change date and resign_date into datetime
+            df = self._ensure_typed(df, 'date', 'date')
+            df = self._ensure_typed(df, 'resign_date', 'date')
+
+            # Filter only valid data, timesheet date <= resign_date and resign_date is null
+            return df[
+                (df['date'] <= df['resign_date']) | 
+                df['resign_date'].isna()
+            ]
+
+        self._transform(filter_valid, stage='filter_valid_data')
+        return self
+
+    @_plan_step
+    def filter_changed_partitions(self, fingerprint_pathfile: str):
+        """Filtering for only rows of (year, month, branch_id) partitions whose input rows changed since the last run.
+
+        Partitions are fingerprinted by `partition_fingerprints` and compared with the saved fingerprints.
+        The fingerprints and the changed partitions are kept in `partition_changes` attribute and only written
+        by `save_partition_fingerprints`, so partitions are recomputed again if the run fails before their results are written.
+
+        Args:
+            fingerprint_pathfile: Pathfile of the SQLite partition fingerprints.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        def filter_changed(df: pd.DataFrame) -> pd.DataFrame:
+            # Fingerprint every partition and keep the rows of new and changed partitions
+            df = self._ensure_typed(df, 'date', 'date')
+            fingerprints = partition_fingerprints(df, engine=self.aggregation_engine)
+            changes = check_partition_fingerprints(fingerprints, fingerprint_pathfile)
+            self.partition_changes = {'fingerprints': fingerprints, 'changes': changes, 'pathfile': fingerprint_pathfile}
+
+            changed = pd.MultiIndex.from_frame(changes.loc[changes['status'] != 'removed', ['year', 'month', 'branch_id']])
+            partitions = pd.MultiIndex.from_arrays([df['date'].dt.year, df['date'].dt.month, df['branch_id'].astype(changes['branch_id'].dtype)])
+            return df.loc[partitions.isin(changed)]
+
+        # Every partition is fingerprinted from all its rows, chunks are concatenated first
+        if self.is_streaming():
+            self._aggregate(lambda df: df)
+        self._aggregate(filter_changed, stage='filter_changed_partitions')
+        return self
+
+    @_plan_step
+    def filter_partitions(self, keys: pd.DataFrame):
+        """Filtering for only rows of the (year, month, branch_id) partitions in `keys`.
+
+        Args:
+            keys: Dataframe with year, month and branch_id of the partitions. E.g. of `stale_employee_months`.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        partitions = pd.MultiIndex.from_arrays([keys[key].to_numpy() for key in ['year', 'month', 'branch_id']])
+
+        def filter_keys(df: pd.DataFrame) -> pd.DataFrame:
+            # Keep rows whose year and month of date and branch_id are in the partitions
+            df = self._ensure_typed(df, 'date', 'date')
+            rows = pd.MultiIndex.from_arrays([df['date'].dt.year.to_numpy(), df['date'].dt.month.to_numpy(), df['branch_id'].to_numpy()])
+            return df.loc[rows.isin(partitions)]
+
+        self._transform(filter_keys, stage='filter_partitions')
+        return self
+
+    @_plan_step
+    def diff_employee_snapshot(self, snapshot_pathfile: str, employee_key: str = 'employe_id'):
+        """Diff the stored employee data against the snapshot of the last run, keeping the data as it is.
+
+        The changes from `diff_employee_snapshot` are kept in `employee_changes` attribute and the snapshot is only
+        written by `save_employee_snapshot`, so changes are found again if the run fails before their results are recomputed.
+
+        Args:
+            snapshot_pathfile: Pathfile of the SQLite employee snapshot.
+            employee_key: Employee ID column of the stored data.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        def diff(df: pd.DataFrame) -> pd.DataFrame:
+            changes = diff_employee_snapshot(df, snapshot_pathfile, employee_key)
+            self.employee_changes = {'snapshot': df, 'changes': changes, 'pathfile': snapshot_pathfile, 'employee_key': employee_key}
+            return df
+
+        # The whole snapshot is diffed at once, chunks are concatenated first
+        if self.is_streaming():
+            self._aggregate(lambda df: df)
+        self._aggregate(diff, stage='diff_employee_snapshot')
+        return self
+
+    def save_employee_snapshot(self):
+        """Save the employee snapshot diffed by `diff_employee_snapshot`, after the stale results have been recomputed.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        changes = self.employee_changes
+        save_employee_snapshot(changes['snapshot'], changes['changes'], changes['pathfile'], changes['employee_key'])
+        return self
+
+    def save_partition_fingerprints(self):
+        """Save fingerprints checked by `filter_changed_partitions`, after the results of the changed partitions have been written.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        save_partition_fingerprints(self.partition_changes['fingerprints'], self.partition_changes['changes'], self.partition_changes['pathfile'])
+        return self
+
+    def save_month_state_loads(self, fold_keys: List[str] = None):
+        """Record the fold keys of `aggregate_salary_per_hour` as loaded, after their results have been written.
+
+        Args:
+            fold_keys: Fold keys to be recorded, e.g. every processed date including dates without timesheets.
+                If not set, the keys folded by `aggregate_salary_per_hour`.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        if fold_keys is None:
+            fold_keys = self.month_state_folds['fold_keys']
+        save_month_state_loads(fold_keys, self.month_state_folds['pathfile'])
+        return self
+    
+    @_plan_step
+    def select_fields(self, fields: list[str]):
+        """Selecting `fields` in stored data.
+
+        Args:
+            fields: List of field that want to be selected. E.g. ['field1', 'field2', 'field3'].
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        self._transform(lambda df: df[fields], stage='select_fields')
+        return self
+
+    def _drop_fields(self, fields: List[str]):
+        """Drop `fields` not read anymore by the following steps of an optimized plan.
+
+        Args:
+            fields: List of field that want to be dropped. E.g. ['field1', 'field2'].
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        self._transform(lambda df: df.drop(columns=fields), stage='drop_fields')
+        return self
+
+    @_plan_step
+    def merge_data(self, other, on: Union[str, List[str]] = None, left_on: Union[str, List[str]] = None, right_on: Union[str, List[str]] = None, how: str = 'inner', engine: str = 'hash', memory_budget: int = None, spill_dir: str = None):
+        """Join stored data with `other` data.
+
+        In streaming mode, every chunk is joined with the whole `other` data.
+
+        With `engine='lookup'`, an inner join with a dimension keyed by small dense integers is done by
+        `lookup_join`, indexing the `other` rows by key once instead of hashing both sides for every join.
+        It falls back to `pd.merge` if the `other` keys are not unique, not integer or too sparse.
+
+        With `engine='grace'`, an inner join of data larger than memory is done by `grace_hash_join`, reading
+        the `other` processor chunk by chunk. The processor continues in streaming mode with the joined chunks.
+
+        Args:
+            other: Dataframe, or processor whose data is retrieved with `get_data`.
+            on: Key for joining data, which exists in both data. E.g. 'field1' or ['field1', 'field2'].
+            left_on: Key of the stored data for joining data. E.g. 'field1'.
+            right_on: Key of the `other` data for joining data. E.g. 'field1'.
+            how: Type of join. E.g. 'inner' or 'left'.
+            engine: 'hash' for `pd.merge`, 'lookup' for direct-address lookup of `other` rows, or 'grace' for
+                joining spilled buckets of both sides. 'lookup' and 'grace' only support inner join.
+            memory_budget: Maximum bytes of `other` rows joined at once by the 'grace' engine.
+            spill_dir: Parent directory for the spill files of the 'grace' engine. If not set, the system temporary directory is used.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        if engine not in ('hash', 'lookup', 'grace'):
+            raise ValueError(f"Unknown join engine '{engine}', expected 'hash', 'lookup' or 'grace'")
+        if engine != 'hash' and how != 'inner':
+            raise ValueError(f"Join engine '{engine}' only supports inner join, not '{how}'")
+
+        if engine == 'grace':
+            # Neither side is loaded at once, both are spilled chunk by chunk
+            if isinstance(other, TimesheetEmployeeProcessor):
+                right_chunks = other.iter_chunks()
+                self.typed_columns.update(other.typed_columns)
+            else:
+                right_chunks = iter([other])
+                self.typed_columns.update(other.attrs.get('typed_columns', {}))
+            left_chunks = self.chunks if self.is_streaming() else iter([self.data])
+            self.data, self.chunks = None, grace_hash_join(
+                left_chunks, right_chunks, on=on, left_on=left_on, right_on=right_on,
+                memory_budget=memory_budget if memory_budget is not None else 1 << 30, spill_dir=spill_dir
+            )
+            return self
+
+        if isinstance(other, TimesheetEmployeeProcessor):
+            other = other.get_data()
+
+        # Continue with the typed-column registry of the other data
+        self.typed_columns.update(other.attrs.get('typed_columns', {}))
+
+        # Rows of the other data missing in a chunk can only be found after all chunks are joined
+        if how not in ('inner', 'left') and self.is_streaming():
+            self._aggregate(lambda df: df)
+
+        if engine == 'lookup':
+            # Index the dimension once, every chunk looks up its rows in the same index
+            _, right_keys = _merge_keys({'on': on, 'left_on': left_on, 'right_on': right_on})
+            index = build_dimension_index(other[right_keys[0]]) if len(right_keys) == 1 else None
+            self._transform(lambda df: lookup_join(df, other, on=on, left_on=left_on, right_on=right_on, index=index), stage='merge_data')
+            return self
+
+        self._transform(lambda df: pd.merge(df, other, on=on, left_on=left_on, right_on=right_on, how=how), stage='merge_data')
+        return self
+    
+    @_plan_step
+    def calculate_work_hour(self):
+        """Calculating work hour for every timesheet data.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        def work_hour(df: pd.DataFrame) -> pd.DataFrame:
+            # Convert checkin and checkout data into seconds since midnight
+            df = self._ensure_typed(df, 'checkin', 'time')
+            df = self._ensure_typed(df, 'checkout', 'time')
+
+            # Set work_hour to 0 if checkin greated that checkout or one of them is null
+            # If checkin <= checkout, substract checkout and checkin in seconds value, converted into hour value in 'hour' unit
+            seconds = work_seconds(df['checkin'], df['checkout'])
+            df['work_hour'] = seconds if self.work_time_unit == 'second' else seconds / 3600
+            return df
+
+        self._transform(work_hour, stage='calculate_work_hour')
+        self._register_work_time(['work_hour'], self.work_time_unit)
+        return self
+
+    @_plan_step
+    def sum_work_hour(self):
+        """Calculating total work hour groupped by year, month and branch_id.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        def sum_per_branch(df: pd.DataFrame) -> pd.DataFrame:
+            # Sum the work hour grouped by year, month, and branch_id
+            return group_aggregate(df, ['year', 'month', 'branch_id'], {'work_hour': ('work_hour', 'sum')}, engine=self.aggregation_engine)
+
+        def sum_chunk(df: pd.DataFrame) -> pd.DataFrame:
+            # Convert date value into datetime, then sum with the shared group index if there is one
+            df = self._ensure_typed(df, 'date', 'date')
+            result = self._indexed_aggregate(df, ['date', 'branch_id'], {'work_hour': ('work_hour', 'sum')})
+            if result is not None:
+                return result
+
+            # Extract year and month value from date
+            df['year'] = df['date'].dt.year
+            df['month'] = df['date'].dt.month
+            return sum_per_branch(df)
+
+        self._aggregate(sum_chunk, combine=sum_per_branch, stage='sum_work_hour')
+
+        # Rename the aggregated work_hour column, integer seconds are summed exactly
+        unit = self._work_time_unit(self.data, 'work_hour')
+        self.data.rename(columns={'work_hour': 'total_work_hour'}, inplace=True)
+        self._register_work_time(['total_work_hour'], unit)
+        return self
+    
+    @_plan_step
+    def get_salary_per_employee(self):
+        """Get max salary per employee groupped by year, month, branch_id and employee_id.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        def max_per_employee(df: pd.DataFrame) -> pd.DataFrame:
+            # Max salary grouped by year, month, branch_id and employee_id
+            return group_aggregate(df, ['year', 'month', 'branch_id', 'employee_id'], {'salary': ('salary', 'max')}, engine=self.aggregation_engine)
+
+        def max_chunk(df: pd.DataFrame) -> pd.DataFrame:
+            # Convert date value into datetime, then max with the shared group index if there is one
+            df = self._ensure_typed(df, 'date', 'date')
+            result = self._indexed_aggregate(df, ['date', 'branch_id', 'employee_id'], {'salary': ('salary', 'max')})
+            if result is not None:
+                return result
+
+            # Extract year and month value from date
+            df['year'] = df['date'].dt.year
+            df['month'] = df['date'].dt.month
+            return max_per_employee(df)
+
+        self._aggregate(max_chunk, combine=max_per_employee, stage='get_salary_per_employee')
+            
+        # Rename aggregated salary column
+        self.data.rename(columns={'salary': 'salary_per_month'}, inplace=True)
+        return self
+    
+    @_plan_step
+    def sum_salary_per_branch(self):
+        """Calculating total salary groupped by year, month and branch_id.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        def sum_per_branch(df: pd.DataFrame) -> pd.DataFrame:
+            # Sum salary_per_month grouped by year, month and branch_id, reusing the group index of `get_salary_per_employee`
+            aggregations = {'salary_per_month': ('salary_per_month', 'sum')}
+            result = self._indexed_aggregate(df, ['date', 'branch_id'], aggregations)
+            if result is not None:
+                return result
+            return group_aggregate(df, ['year', 'month', 'branch_id'], aggregations, engine=self.aggregation_engine)
+
+        self._aggregate(sum_per_branch, stage='sum_salary_per_branch')
+
+        # Rename aggregated salary_per_month column
+        self.data.rename(columns={'salary_per_month': 'total_salary'}, inplace=True)
+        return self
+
+    @_plan_step
+    def calculate_salary_per_hour(self):
+        """Calculating salary per hour for each branch. Groupped by year, month and branch_id.
+        If total_work_hour in a branch = 0, than salary per hour is 0.
+        Result of dividing total salary and total work hour will be rounded to 2 decimal.
+        Total work hour in integer seconds is divided into hours here, in the same division.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        def divide(df: pd.DataFrame) -> pd.DataFrame:
+            # Set salary per hour to 0 if work hour is 0,
+            # if salary is not 0, divide total salary and total work hour and round it into 2 decimal
+            df['salary_per_hour'] = salary_per_hour(df['total_salary'], df['total_work_hour'], self._work_time_unit(df, 'total_work_hour'))
+            return df
+
+        self._transform(divide, stage='calculate_salary_per_hour')
+        return self
+
+    @_plan_step
+    def aggregate_salary_per_hour(self, month_state: str = None, fold_key: str = None, replace_month_state: bool = False, by_date: bool = False):
+        """Calculating total work hour, total salary and salary per hour groupped by year, month and branch_id in one scan.
+
+        This gives the same result as `calculate_work_hour().sum_work_hour()` joined with
+        `get_salary_per_employee().sum_salary_per_branch()` and `calculate_salary_per_hour()`,
+        without the intermediate dataframes and the join. Every row is aggregated once into work hour
+        and max salary per employee, which are then summed per branch. With 'second' work time unit,
+        total_work_hour is int64 seconds.
+
+        With `month_state`, the per-employee results are folded into the month-to-date state by `fold_month_state`,
+        and the month-to-date totals of the branch months are returned instead of the totals of the data alone.
+
+        With `by_date`, the date is a group key too, so data of several days is aggregated in one scan into
+        one result per day. With `month_state`, every day is folded in date order with its date as fold key,
+        like one daily run per day, and the month-to-date totals after every day are returned.
+
+        The folded keys are kept in `month_state_folds` attribute, and only recorded as loaded by `save_month_state_loads`.
+
+        Args:
+            month_state: Pathfile of the SQLite month-to-date state. Requires 'second' work time unit.
+            fold_key: Key of the folded data, a key folded by an earlier run is not folded again. E.g. the processed date.
+                Not used with `by_date`.
+            replace_month_state: Replace the state of the branch months instead of folding into it, for data holding all their rows.
+            by_date: Group by date too, the result has a date column.
+
+        Returns:
+            TimesheetEmployeeProcessor: The instance of the DataProcessor (self), allowing for method chaining.
+        """
+        # With `by_date`, every day is grouped separately
+        days = ['date'] if by_date else []
+
+        def per_employee(df: pd.DataFrame) -> pd.DataFrame:
+            # Sum work hour and max salary grouped by year, month, branch_id and employee_id
+            return group_aggregate(
+                df, days + ['year', 'month', 'branch_id', 'employee_id'],
+                {'work_hour': ('work_hour', 'sum'), 'salary': ('salary', 'max')}, engine=self.aggregation_engine
+            )
+
+        def employee_chunk(df: pd.DataFrame) -> pd.DataFrame:
+            # Convert date, checkin and checkout into their canonical types
+            df = self._ensure_typed(df, 'date', 'date')
+            df = self._ensure_typed(df, 'checkin', 'time')
+            df = self._ensure_typed(df, 'checkout', 'time')
+
+            # Work hour is 0 if checkin is greater than checkout or one of them is null
+            work_hour = work_seconds(df['checkin'], df['checkout'])
+            if self.work_time_unit == 'hour':
+                work_hour = work_hour / 3600
+
+            # The shared group index groups by month, so it is only used without `by_date`
+            if not by_date:
+                result = self._indexed_aggregate(
+                    df, ['date', 'branch_id', 'employee_id'], {'work_hour': ('work_hour', 'sum'), 'salary': ('salary', 'max')},
+                    values=pd.DataFrame({'work_hour': work_hour, 'salary': df['salary']})
+                )
+                if result is not None:
+                    return result
+
+            rows = pd.DataFrame({
+                **({'date': df['date']} if by_date else {}),
+                'year': df['date'].dt.year,
+                'month': df['date'].dt.month,
+                'branch_id': df['branch_id'],
+                'employee_id': df['employee_id'],
+                'work_hour': work_hour,
+                'salary': df['salary'],
+            })
+            return per_employee(rows)
+
+        def per_branch(df: pd.DataFrame) -> pd.DataFrame:
+            # Sum work hour and salary of the employees grouped by year, month and branch_id,
+            # reusing the group index of the per-employee result
+            aggregations = {'total_work_hour': ('work_hour', 'sum'), 'total_salary': ('salary', 'sum')}
+            result = None if by_date else self._indexed_aggregate(df, ['date', 'branch_id'], aggregations)
+            df = result if result is not None else group_aggregate(df, days + ['year', 'month', 'branch_id'], aggregations, engine=self.aggregation_engine)
+
+            # Set salary per hour to 0 if work hour is 0, else round total salary per total work hour into 2 decimal
+            df['salary_per_hour'] = salary_per_hour(df['total_salary'], df['total_work_hour'], self.work_time_unit)
+            return df
+
+        def fold_days(df: pd.DataFrame) -> pd.DataFrame:
+            # Fold every day in date order with its date as fold key, so each day is folded once like by a daily run
+            results = []
+            for date, partials in df.groupby('date', sort=True):
+                self.month_state_folds['fold_keys'].append(date.strftime('%Y-%m-%d'))
+                results.append(fold_month_state(partials, month_state, date.strftime('%Y-%m-%d')).assign(date=date))
+            results = results or [fold_month_state(df, month_state).assign(date=df['date'].iloc[:0])]
+            result = concat_data(results)
+            return result[['date'] + [column for column in result.columns if column != 'date']]
+
+        if month_state is not None and self.work_time_unit != 'second':
+            raise ValueError("Month-to-date state keeps work seconds, it requires work_time_unit='second'")
+        if by_date and replace_month_state:
+            raise ValueError('Month-to-date state of several days can only be folded, not replaced')
+
+        if month_state is not None:
+            self.month_state_folds = {'pathfile': month_state, 'fold_keys': [] if by_date or fold_key is None else [fold_key]}
+
+        # In streaming mode, the per-employee results of every chunk are combined before summing them per branch
+        self._aggregate(employee_chunk, combine=per_employee, stage='aggregate_salary_per_hour')
+        if month_state is None:
+            self._transform(per_branch, stage='aggregate_salary_per_hour')
+        elif by_date:
+            self._transform(fold_days, stage='aggregate_salary_per_hour')
+        else:
+            self._transform(lambda df: fold_month_state(df, month_state, fold_key, replace=replace_month_state), stage='aggregate_salary_per_hour')
+        self._register_work_time(['total_work_hour'], self.work_time_unit)
+        return self
+
+def generate_increment_data_query(records: pd.DataFrame, replace: bool = False) -> str:
+    """Generate query for increment data in branch_hourly_salary table.
+
+    Args:
+        records: Salary per hour dataframe.
+        replace: Delete the rows of the same year, month and branch_id first, for records holding month-to-date values.
+
+    Returns:
+        str: Query string for increment data in branch_hourly_salary table.
+    """
+    query = generate_delete_data_query(records) + '; ' if replace and len(records) else ''
+    query += "INSERT INTO branch_hourly_salary (year, month, branch_id, salary_per_hour) VALUES "
+    data_values = []
+    for _, data in records.iterrows():
+        data_values.append(f"({int(data['year'])}, {int(data['month'])}, {int(data['branch_id'])}, {data['salary_per_hour']})")
+    query += ', '.join(data_values)
+    return query
+
+def generate_delete_data_query(keys: pd.DataFrame) -> str:
+    """Generate query for deleting rows of year, month and branch_id in branch_hourly_salary table.
+
+    Args:
+        keys: Dataframe with year, month and branch_id.
+
+    Returns:
+        str: Query string for deleting the rows in branch_hourly_salary table.
+    """
+    data_values = [f"({int(data['year'])}, {int(data['month'])}, {int(data['branch_id'])})" for _, data in keys.iterrows()]
+    return f"DELETE FROM branch_hourly_salary WHERE (year, month, branch_id) IN ({', '.join(data_values)})"
+
+def load_data_to_table(query: str) -> None:
+    """Execute query in the database configured by the DB_* environment variables, e.g. from `.env` file.
+
+    Args:
+        query: Query string. E.g. from `generate_increment_data_query`.
+    """
+    load_dotenv()
+    db_engine = create_engine('postgresql+psycopg2://' + 
+                            os.getenv('DB_USERNAME') +':' + 
+                            os.getenv('DB_PASSWORD') + '@' +
+                            os.getenv('DB_HOST') + ':' +
+                            os.getenv('DB_PORT') + '/' +
+                            os.getenv('DB_NAME'));
+
+    # Commit the query before returning, so callers only save their state once the data is loaded
+    with db_engine.begin() as db_connection:
+        db_connection.execute(text(query))
@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT_DIRPATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIRPATH = os.path.join(ROOT_DIRPATH, 'data')
+sys.path.insert(0, os.path.join(ROOT_DIRPATH, 'python_scripts'))
+
+import etl_backfill_salary_per_hour_per_branch
+import etl_daily_calculate_salary_per_hour_per_branch
+import etl_recompute_changed_salary_per_hour_per_branch
+from salary_processor import EMPLOYEE_SCHEMA, TIMESHEET_SCHEMA, TimesheetEmployeeProcessor
+
+STATE_TABLES = ['month_branch_state', 'month_employee_salary', 'month_state_folds', 'month_state_loads']
+
+def patch_paths(module, tmp_path, monkeypatch):
+    """Keep the caches and state of an ETL script module in `tmp_path`, reading the repository CSV files."""
+    for name in list(vars(module)):
+        if name.endswith(('_pathfile', '_dirpath')):
+            monkeypatch.setattr(module, name, os.path.join(tmp_path, name))
+    monkeypatch.setattr(module, 'employee_pathfile', os.path.join(DATA_DIRPATH, 'employees.csv'))
+    monkeypatch.setattr(module, 'timesheet_pathfile', os.path.join(DATA_DIRPATH, 'timesheets.csv'))
+    return module
+
+@pytest.fixture
+def daily(tmp_path, monkeypatch):
+    """Daily ETL script module, with its caches and state kept in `tmp_path`."""
+    return patch_paths(etl_daily_calculate_salary_per_hour_per_branch, tmp_path, monkeypatch)
+
+@pytest.fixture
+def recompute(tmp_path, monkeypatch):
+    """Recompute ETL script module, with its caches and state kept in `tmp_path` like the daily script."""
+    return patch_paths(etl_recompute_changed_salary_per_hour_per_branch, tmp_path, monkeypatch)
+
+@pytest.fixture
+def backfill(tmp_path, monkeypatch):
+    """Backfill ETL script module, with its cache kept in `tmp_path` like the daily script."""
+    return patch_paths(etl_backfill_salary_per_hour_per_branch, tmp_path, monkeypatch)
+
+@pytest.fixture
+def reference():
+    """Function calculating salary per hour per branch month from all timesheets up to a date, without any state."""
+    def calculate(until, employee_pathfile: str = os.path.join(DATA_DIRPATH, 'employees.csv'),
+                  timesheet_pathfile: str = os.path.join(DATA_DIRPATH, 'timesheets.csv')) -> pd.DataFrame:
+        employees = TimesheetEmployeeProcessor()\
+            .load_data_from_csv(employee_pathfile, schema=EMPLOYEE_SCHEMA)\
+            .remove_duplicate_data(partitioning_keys=['employe_id', 'branch_id'], ordering_key='salary', ascending_order=False)\
+            .get_data()
+        timesheets = TimesheetEmployeeProcessor()\
+            .load_data_from_csv(timesheet_pathfile, schema=TIMESHEET_SCHEMA)\
+            .remove_duplicate_data(partitioning_keys=['employee_id', 'date'], ordering_key='timesheet_id')\
+            .get_data()
+        return TimesheetEmployeeProcessor(timesheets.loc[timesheets['date'] <= pd.Timestamp(until)], work_time_unit='second')\
+            .merge_data(employees, left_on='employee_id', right_on='employe_id')\
+            .filter_valid_data()\
+            .aggregate_salary_per_hour()\
+            .select_fields(['year', 'month', 'branch_id', 'salary_per_hour'])\
+            .get_data()
+    return calculate
+
+@pytest.fixture
+def read_state():
+    """Function reading the tables of a SQLite month-to-date state, in key order."""
+    def read(state_pathfile: str) -> dict:
+        connection = sqlite3.connect(state_pathfile)
+        try:
+            return {
+                table: pd.read_sql(f'SELECT * FROM {table}', connection).pipe(lambda df: df.sort_values(list(df.columns), ignore_index=True))
+                for table in STATE_TABLES
+            }
+        finally:
+            connection.close()
+    return read
+
+@pytest.fixture
+def assert_matches_reference():
+    """Function asserting every branch month of a result has the salary per hour of the reference."""
+    def check(result: pd.DataFrame, expected: pd.DataFrame) -> None:
+        keys = ['year', 'month', 'branch_id']
+        rows = result.astype({key: 'int64' for key in keys}).merge(
+            expected.astype({key: 'int64' for key in keys}), on=keys, how='left', suffixes=('', '_expected')
+        )
+        assert len(rows) == len(result)
+        pd.testing.assert_series_equal(rows['salary_per_hour'], rows['salary_per_hour_expected'], check_names=False, check_dtype=False)
+    return check
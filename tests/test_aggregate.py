@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import salary_processor
+from salary_processor import EMPLOYEE_SCHEMA, TIMESHEET_SCHEMA, TimesheetEmployeeProcessor
+
+DATA_DIRPATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+def employee_timesheet_data(chunksize: int = None) -> TimesheetEmployeeProcessor:
+    employees = TimesheetEmployeeProcessor()\
+        .load_data_from_csv(os.path.join(DATA_DIRPATH, 'employees.csv'), schema=EMPLOYEE_SCHEMA)\
+        .remove_duplicate_data(partitioning_keys=['employe_id', 'branch_id'], ordering_key='salary', ascending_order=False)\
+        .get_data()
+    return TimesheetEmployeeProcessor()\
+        .load_data_from_csv(os.path.join(DATA_DIRPATH, 'timesheets.csv'), schema=TIMESHEET_SCHEMA, chunksize=chunksize)\
+        .remove_duplicate_data(partitioning_keys=['employee_id', 'date'], ordering_key='timesheet_id')\
+        .merge_data(employees, left_on='employee_id', right_on='employe_id')\
+        .filter_valid_data()
+
+def staged_salary_per_hour() -> pd.DataFrame:
+    data = employee_timesheet_data().get_data()
+    work_hour = TimesheetEmployeeProcessor(data).calculate_work_hour().sum_work_hour().get_data()
+    salary = TimesheetEmployeeProcessor(data).get_salary_per_employee().sum_salary_per_branch().get_data()
+    return TimesheetEmployeeProcessor(pd.merge(work_hour, salary, on=['year', 'month', 'branch_id']))\
+        .calculate_salary_per_hour()\
+        .select_fields(['year', 'month', 'branch_id', 'total_work_hour', 'total_salary', 'salary_per_hour'])\
+        .get_data()
+
+@pytest.mark.parametrize('chunksize', [None, 5000])
+def test_fused_aggregation_matches_staged_steps(chunksize):
+    result = employee_timesheet_data(chunksize)\
+        .aggregate_salary_per_hour()\
+        .select_fields(['year', 'month', 'branch_id', 'total_work_hour', 'total_salary', 'salary_per_hour'])\
+        .get_data()
+
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), staged_salary_per_hour(), check_dtype=False)
+
+def random_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    branch_ids = np.concatenate([[1, 12722], rng.choice(np.arange(2, 12722), 14, replace=False)])
+    work_hour = rng.random(rows) * 10
+    work_hour[rng.random(rows) < 0.05] = np.nan
+    return pd.DataFrame({
+        'year': rng.integers(2018, 2021, rows).astype('int32'),
+        'month': rng.integers(1, 13, rows).astype('int32'),
+        'branch_id': rng.choice(branch_ids, rows).astype('int64'),
+        'employee_id': rng.integers(1, 400000, rows),
+        'work_hour': work_hour,
+        'salary': rng.integers(1000000, 10000000, rows),
+    })
+
+@pytest.mark.parametrize('keys, aggregations', [
+    (['year', 'month', 'branch_id'], {'total_work_hour': ('work_hour', 'sum'), 'total_salary': ('salary', 'sum')}),
+    (['year', 'month', 'branch_id', 'employee_id'], {'work_hour': ('work_hour', 'max'), 'salary': ('salary', 'max')}),
+])
+def test_dense_aggregation_matches_groupby_on_sparse_keys(keys, aggregations):
+    # branch_id spans 1..12722 with 16 distinct values, so the year * month * branch_id range is factorized
+    df = random_frame(20000)
+
+    result = salary_processor._dense_aggregate(df, keys, aggregations)
+
+    assert result is not None
+    pd.testing.assert_frame_equal(result, df.groupby(keys, as_index=False, observed=True).agg(**aggregations))
+
+def test_dense_aggregation_matches_groupby_with_categorical_and_missing_keys():
+    df = random_frame(5000, seed=1)
+    df['branch_id'] = df['branch_id'].astype('category')
+    df['employee_id'] = df['employee_id'].where(df['employee_id'] % 7 != 0).astype('Float64').astype('float64')
+    keys = ['year', 'month', 'branch_id', 'employee_id']
+    aggregations = {'work_hour': ('work_hour', 'sum'), 'salary': ('salary', 'max')}
+
+    result = salary_processor.group_aggregate(df, keys, aggregations)
+
+    pd.testing.assert_frame_equal(result, df.groupby(keys, as_index=False, observed=True).agg(**aggregations))
+
+def sparse_branch_data() -> pd.DataFrame:
+    # Spread the branch IDs of the sample data over 1..12722
+    data = employee_timesheet_data().get_data()
+    branch_ids = np.sort(data['branch_id'].unique())
+    sparse_ids = np.linspace(1, 12722, len(branch_ids)).astype('int64')
+    return data.assign(branch_id=data['branch_id'].map(dict(zip(branch_ids, sparse_ids))).astype('int64'))
+
+def test_group_index_is_built_for_sparse_int64_branch_ids():
+    data = sparse_branch_data()
+
+    index = salary_processor.build_group_index(data, ['date', 'branch_id', 'employee_id'])
+
+    assert index is not None
+    assert [cardinality for _, cardinality, _ in index['levels']][1:] == [data['branch_id'].nunique(), data['employee_id'].nunique()]
+
+@pytest.mark.parametrize('method', ['aggregate_salary_per_hour', 'staged'])
+def test_group_index_aggregations_match_groupby(method):
+    data = sparse_branch_data()
+
+    def run(aggregation_engine: str) -> tuple:
+        processor = TimesheetEmployeeProcessor(data, aggregation_engine=aggregation_engine)
+        if method == 'aggregate_salary_per_hour':
+            return processor.aggregate_salary_per_hour().get_data(), processor
+        work_hour = processor.calculate_work_hour().sum_work_hour().get_data()
+        salary = TimesheetEmployeeProcessor(data, aggregation_engine=aggregation_engine).get_salary_per_employee().sum_salary_per_branch().get_data()
+        return pd.merge(work_hour, salary, on=['year', 'month', 'branch_id']), processor
+
+    result, processor = run('auto')
+    expected, _ = run('hash')
+
+    pd.testing.assert_frame_equal(result, expected)
+
+    # The group indexes stay on the processor instead of travelling with the data
+    assert len(processor.group_indexes) > 0
+    assert 'group_indexes' not in result.attrs
+
+def test_group_index_is_reused_by_coarser_aggregations(monkeypatch):
+    builds = []
+    build_group_index = salary_processor.build_group_index
+    monkeypatch.setattr(salary_processor, 'build_group_index', lambda *args: builds.append(args[1]) or build_group_index(*args))
+
+    TimesheetEmployeeProcessor(sparse_branch_data()).get_salary_per_employee().sum_salary_per_branch().get_data()
+
+    # The branch sums reuse the group codes of the per-employee result
+    assert builds == [['date', 'branch_id', 'employee_id']]
@@ -0,0 +1,180 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+from sqlalchemy.exc import SQLAlchemyError
+
+def test_daily_fold_matches_reference(daily, reference, assert_matches_reference):
+    loads = []
+
+    first = daily.run(pd.Timestamp('2019-10-01').date(), loads.append)
+    second = daily.run(pd.Timestamp('2019-10-02').date(), loads.append)
+
+    # The first run recomputes every month of the new employees, the second folds only its date
+    assert len(loads) == 2
+    assert set(first['month']) == {8, 9, 10}
+    assert set(second['month']) == {10}
+    assert_matches_reference(first, reference('2019-10-01'))
+    assert_matches_reference(second, reference('2019-10-02'))
+
+def test_daily_rerun_is_idempotent(daily, read_state):
+    loads = []
+
+    daily.run(pd.Timestamp('2019-10-01').date(), loads.append)
+    first = daily.run(pd.Timestamp('2019-10-02').date(), loads.append)
+    state = read_state(daily.month_state_pathfile)
+    rerun = daily.run(pd.Timestamp('2019-10-02').date(), loads.append)
+
+    pd.testing.assert_frame_equal(rerun, first)
+    assert loads[-1] == loads[-2]
+    for table, rows in read_state(daily.month_state_pathfile).items():
+        pd.testing.assert_frame_equal(rows, state[table], obj=table)
+
+def test_daily_catch_up_matches_sequential_runs(daily, tmp_path, monkeypatch, read_state, reference, assert_matches_reference):
+    loads = []
+
+    daily.run(pd.Timestamp('2019-10-01').date(), loads.append)
+    caught_up = daily.run(pd.Timestamp('2019-10-08').date(), loads.append)
+    caught_up_state = read_state(daily.month_state_pathfile)
+
+    for name in ('timesheet_dedup_index_pathfile', 'timesheet_checkpoint_pathfile', 'month_state_pathfile', 'employee_snapshot_pathfile'):
+        monkeypatch.setattr(daily, name, os.path.join(tmp_path, 'sequential', name))
+    for date in pd.date_range('2019-10-01', '2019-10-08'):
+        daily.run(date.date(), loads.append)
+
+    assert_matches_reference(caught_up, reference('2019-10-08'))
+    for table, rows in read_state(daily.month_state_pathfile).items():
+        pd.testing.assert_frame_equal(rows, caught_up_state[table], obj=table)
+
+def test_daily_failed_load_is_caught_up(daily, read_state, reference, assert_matches_reference):
+    loads = []
+
+    def fail(query: str) -> None:
+        raise SQLAlchemyError('connection lost')
+
+    daily.run(pd.Timestamp('2019-10-01').date(), loads.append)
+    with pytest.raises(SQLAlchemyError):
+        daily.run(pd.Timestamp('2019-10-02').date(), fail)
+    result = daily.run(pd.Timestamp('2019-10-03').date(), loads.append)
+
+    # The date folded by the failed run is not folded twice, and is loaded by the next run
+    assert_matches_reference(result, reference('2019-10-03'))
+    state = read_state(daily.month_state_pathfile)
+    assert list(state['month_state_loads']['fold_key']) == list(state['month_state_folds']['fold_key'])
+    assert list(state['month_state_loads']['fold_key'].str[:10]) == ['2019-10-01', '2019-10-02', '2019-10-03']
+
+def test_daily_recomputes_months_of_late_winning_rows(daily, tmp_path, monkeypatch, reference, assert_matches_reference):
+    timesheet_pathfile = os.path.join(tmp_path, 'timesheets.csv')
+    shutil.copyfile(daily.timesheet_pathfile, timesheet_pathfile)
+    monkeypatch.setattr(daily, 'timesheet_pathfile', timesheet_pathfile)
+    employee_id = pd.read_csv(timesheet_pathfile).query("date == '2019-10-01'")['employee_id'].iloc[0]
+    loads = []
+
+    daily.run(pd.Timestamp('2019-10-01').date(), loads.append)
+
+    # A late duplicate losing to the folded row of its day is skipped
+    with open(timesheet_pathfile, 'a') as file:
+        file.write(f'99999999,{employee_id},2019-10-01,"07:00:00","21:00:00"\n')
+    result = daily.run(pd.Timestamp('2019-10-02').date(), loads.append)
+    assert_matches_reference(result, reference('2019-10-02', timesheet_pathfile=timesheet_pathfile))
+
+    # A late duplicate winning over the folded row replaces it in the month-to-date state of its month
+    with open(timesheet_pathfile, 'a') as file:
+        file.write(f'1,{employee_id},2019-10-01,"07:00:00","21:00:00"\n')
+    result = daily.run(pd.Timestamp('2019-10-03').date(), loads.append)
+    expected = reference('2019-10-03', timesheet_pathfile=timesheet_pathfile)
+    assert not expected.equals(reference('2019-10-03'))
+    assert_matches_reference(result, expected)
+    branch_ids = pd.read_csv(daily.employee_pathfile).query('employe_id == @employee_id')['branch_id']
+    assert set(branch_ids) <= set(result.loc[result['month'] == 10, 'branch_id'].astype('int64'))
+
+    # The appended rows were checked, so a rerun neither recomputes nor folds anything again
+    rerun = daily.run(pd.Timestamp('2019-10-03').date(), loads.append)
+    assert_matches_reference(rerun, expected)
+
+def test_daily_recomputes_months_of_changed_employees(daily, tmp_path, monkeypatch, reference, assert_matches_reference):
+    loads = []
+
+    daily.run(pd.Timestamp('2019-10-01').date(), loads.append)
+
+    # Raise the salary of an employee of branch 2 working in September and October
+    employees = pd.read_csv(daily.employee_pathfile, dtype=str, keep_default_na=False)
+    employees.loc[employees['employe_id'] == '66', 'salary'] = '12000000'
+    employee_pathfile = os.path.join(tmp_path, 'employees.csv')
+    employees.to_csv(employee_pathfile, index=False)
+    monkeypatch.setattr(daily, 'employee_pathfile', employee_pathfile)
+
+    result = daily.run(pd.Timestamp('2019-10-02').date(), loads.append)
+
+    stale = result.loc[result['branch_id'].astype('int64') == 2, ['year', 'month']].astype('int64')
+    assert {tuple(row) for row in stale.itertuples(index=False)} >= {(2019, 9), (2019, 10)}
+    assert loads[-1].startswith('DELETE')
+    assert_matches_reference(result, reference('2019-10-02', employee_pathfile))
+
+    # The employee snapshot is saved, so the next run only folds its date
+    result = daily.run(pd.Timestamp('2019-10-03').date(), loads.append)
+    assert set(result['month']) == {10}
+    assert_matches_reference(result, reference('2019-10-03', employee_pathfile))
+
+def test_recompute_then_daily_matches_reference(daily, recompute, reference, assert_matches_reference):
+    loads = []
+
+    assert recompute.run(loads.append) is None
+    daily.run(pd.Timestamp('2019-10-01').date(), loads.append)
+    daily.run(pd.Timestamp('2019-10-08').date(), loads.append)
+    recomputed = recompute.run(loads.append)
+
+    # A second recompute without changes has nothing to load
+    count = len(loads)
+    assert len(recompute.run(loads.append)) == 0
+    assert len(loads) == count
+
+    # Dates after the last folded date are left to the daily run, so they are not folded twice
+    result = daily.run(pd.Timestamp('2019-10-09').date(), loads.append)
+    assert_matches_reference(recomputed, reference('2019-10-08'))
+    assert_matches_reference(result, reference('2019-10-09'))
+
+def test_recompute_rewrites_only_changed_partitions(daily, recompute, tmp_path, monkeypatch, reference, assert_matches_reference):
+    loads = []
+
+    daily.run(pd.Timestamp('2019-10-08').date(), loads.append)
+    recompute.run(loads.append)
+
+    # Correct the checkout of the first timesheet of August
+    timesheets = pd.read_csv(recompute.timesheet_pathfile, dtype=str, keep_default_na=False)
+    employees = pd.read_csv(recompute.employee_pathfile, dtype=str, keep_default_na=False)
+    row = timesheets.index[timesheets['date'].str.startswith('2019-08')][0]
+    branch_id = int(employees.loc[employees['employe_id'] == timesheets.loc[row, 'employee_id'], 'branch_id'].iloc[0])
+    timesheets.loc[row, 'checkout'] = '23:00:00'
+    timesheet_pathfile = os.path.join(tmp_path, 'timesheets.csv')
+    timesheets.to_csv(timesheet_pathfile, index=False)
+    monkeypatch.setattr(recompute, 'timesheet_pathfile', timesheet_pathfile)
+
+    result = recompute.run(loads.append)
+
+    keys = result[['year', 'month', 'branch_id']].astype('int64')
+    assert {tuple(row) for row in keys.itertuples(index=False)} == {(2019, 8, branch_id)}
+    assert_matches_reference(result, reference('2019-10-08', timesheet_pathfile=timesheet_pathfile))
+
+def test_daily_does_not_load_a_day_without_timesheets(daily, read_state):
+    loads = []
+
+    daily.run(pd.Timestamp('2020-12-30').date(), loads.append)
+    result = daily.run(pd.Timestamp('2020-12-31').date(), loads.append)
+
+    assert len(result) == 0
+    assert len(loads) == 1
+
+    # The empty date is recorded as loaded, so the next run does not catch it up again
+    assert read_state(daily.month_state_pathfile)['month_state_loads']['fold_key'].iloc[-1] == '2020-12-31'
+    assert daily.unloaded_dates(daily.month_state_pathfile, pd.Timestamp('2021-01-01').date()) == [pd.Timestamp('2021-01-01')]
+
+def test_backfill_matches_reference(backfill, reference, assert_matches_reference):
+    loads = []
+
+    result = backfill.run('2019-08', '2019-09', workers=2, load=loads.append)
+
+    assert len(loads) == 1
+    assert set(result['month']) == {8, 9}
+    assert_matches_reference(result, reference('2019-09-30'))
@@ -0,0 +1,191 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import salary_processor
+from salary_processor import COPY_STATS, EMPLOYEE_SCHEMA, TIMESHEET_SCHEMA, TimesheetEmployeeProcessor
+
+DATA_DIRPATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+def test_compact_dtypes_keeps_values_and_reports_saved_bytes():
+    processor = TimesheetEmployeeProcessor().load_data_from_csv(os.path.join(DATA_DIRPATH, 'timesheets.csv'), schema=TIMESHEET_SCHEMA)
+    data = processor.get_data().copy()
+    compacted = processor.compact_dtypes().get_data()
+
+    assert compacted.dtypes.astype(str).to_dict() == {
+        'timesheet_id': 'int32', 'employee_id': 'int32', 'date': 'datetime64[ns]', 'checkin': 'Int32', 'checkout': 'Int32',
+    }
+    pd.testing.assert_frame_equal(compacted, data, check_dtype=False)
+
+    report = processor.get_memory_report().set_index('column')
+    assert report.loc['timesheet_id', 'bytes_saved'] == len(data) * 4
+    assert (report['bytes_saved'] >= 0).all()
+
+def test_compact_dtypes_keeps_ids_not_fitting_int32():
+    data = pd.DataFrame({'employe_id': [1, 2**31], 'branch_id': [1, 2], 'salary': [7500000, 9000000]})
+
+    compacted = TimesheetEmployeeProcessor(data).compact_dtypes().get_data()
+
+    assert compacted['employe_id'].dtype == 'int64'
+    assert isinstance(compacted['branch_id'].dtype, pd.CategoricalDtype)
+
+def test_streaming_memory_report_sums_chunks_and_keeps_categories():
+    pathfile = os.path.join(DATA_DIRPATH, 'employees.csv')
+    whole = TimesheetEmployeeProcessor().load_data_from_csv(pathfile, schema=EMPLOYEE_SCHEMA).compact_dtypes()
+    streamed = TimesheetEmployeeProcessor().load_data_from_csv(pathfile, schema=EMPLOYEE_SCHEMA, chunksize=20).compact_dtypes()
+    data = streamed.get_data()
+
+    assert isinstance(data['branch_id'].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(data, whole.get_data(), check_categorical=False)
+    report = streamed.get_memory_report().set_index('column')
+    pd.testing.assert_series_equal(report['bytes_before'], whole.get_memory_report().set_index('column')['bytes_before'])
+
+def test_typed_column_registry_skips_converted_columns(monkeypatch):
+    conversions = []
+    for kind, convert in list(salary_processor.CANONICAL_CONVERTERS.items()):
+        monkeypatch.setitem(salary_processor.CANONICAL_CONVERTERS, kind, lambda values, convert=convert: conversions.append(values.name) or convert(values))
+
+    timesheets = TimesheetEmployeeProcessor().load_data_from_csv(os.path.join(DATA_DIRPATH, 'timesheets.csv'), schema=TIMESHEET_SCHEMA).get_data()
+    employees = pd.DataFrame({'employe_id': [1, 2], 'branch_id': [1, 1], 'salary': [7500000, 9000000], 'resign_date': ['2020-01-01', None]})
+
+    # The registry of the loading stage carries over with the data, only the untyped resign_date is converted
+    assert TimesheetEmployeeProcessor(timesheets).typed_columns == {'date': 'date', 'checkin': 'time', 'checkout': 'time'}
+    data = TimesheetEmployeeProcessor(pd.merge(timesheets, employees, left_on='employee_id', right_on='employe_id'))\
+        .filter_valid_data()\
+        .calculate_work_hour()\
+        .get_data()
+    assert conversions == ['resign_date']
+    assert data.attrs['typed_columns']['resign_date'] == 'date'
+
+    # A registered column replaced by untyped values is converted again
+    data['date'] = data['date'].dt.strftime('%Y-%m-%d')
+    TimesheetEmployeeProcessor(data).filter_valid_data().get_data()
+    assert conversions == ['resign_date', 'date']
+
+def test_zero_copy_construction_shares_memory_until_modified():
+    data = pd.DataFrame({'employee_id': np.arange(1000), 'salary': np.full(1000, 7500000)})
+
+    processor = TimesheetEmployeeProcessor(data, copy=False)
+    assert np.shares_memory(processor.get_data()['salary'].to_numpy(), data['salary'].to_numpy())
+
+    processor.get_data().loc[0, 'salary'] = 0
+    assert data.loc[0, 'salary'] == 7500000
+
+def test_copy_stats_count_bytes_copied_per_stage():
+    data = pd.DataFrame({'employee_id': np.arange(1000), 'salary': np.full(1000, 7500000)})
+    COPY_STATS.clear()
+
+    TimesheetEmployeeProcessor(data, track_copies=True)
+    assert COPY_STATS['__init__'] == 16000
+
+    # Selecting fields of a shared dataframe copies nothing, and untracked processors are not counted
+    TimesheetEmployeeProcessor(data, copy=False, track_copies=True).select_fields(['salary']).get_data()
+    TimesheetEmployeeProcessor(data).select_fields(['salary']).get_data()
+    assert COPY_STATS == {'__init__': 16000, 'select_fields': 0}
+
+def employee_timesheet_data(lazy: bool, date) -> pd.DataFrame:
+    employee_processor = TimesheetEmployeeProcessor(lazy=lazy)\
+        .load_data_from_csv(os.path.join(DATA_DIRPATH, 'employees.csv'), schema=EMPLOYEE_SCHEMA)\
+        .compact_dtypes()\
+        .remove_duplicate_data(partitioning_keys=['employe_id', 'branch_id'], ordering_key='salary', ascending_order=False)
+    return TimesheetEmployeeProcessor(lazy=lazy)\
+        .load_data_from_csv(os.path.join(DATA_DIRPATH, 'timesheets.csv'), schema=TIMESHEET_SCHEMA)\
+        .compact_dtypes()\
+        .remove_duplicate_data(partitioning_keys=['employee_id', 'date'], ordering_key='timesheet_id')\
+        .merge_data(employee_processor if lazy else employee_processor.get_data(), left_on='employee_id', right_on='employe_id')\
+        .filter_timesheets_by_date(date)\
+        .filter_valid_data()\
+        .select_fields(['timesheet_id', 'employee_id', 'branch_id', 'salary', 'date', 'checkin', 'checkout'])
+
+def test_lazy_plan_matches_eager_run():
+    expected = employee_timesheet_data(False, '2019-10-01').get_data()
+    result = employee_timesheet_data(True, '2019-10-01').get_data()
+
+    pd.testing.assert_frame_equal(
+        result.sort_values('timesheet_id', ignore_index=True),
+        expected.sort_values('timesheet_id', ignore_index=True),
+        check_categorical=False,
+    )
+
+def test_lazy_plan_pushes_date_filter_into_the_loader():
+    plan = employee_timesheet_data(True, '2019-10-01').explain().splitlines()
+
+    assert plan[0].startswith('load_data_from_csv(') and "date='2019-10-01'" in plan[0]
+    assert not any(line.startswith('filter_timesheets_by_date') for line in plan)
+
+def test_merged_processor_plan_is_not_optimized_in_place():
+    employee_processor = TimesheetEmployeeProcessor(lazy=True)\
+        .load_data_from_csv(os.path.join(DATA_DIRPATH, 'employees.csv'), schema=EMPLOYEE_SCHEMA)\
+        .remove_duplicate_data(partitioning_keys=['employe_id', 'branch_id'], ordering_key='salary', ascending_order=False)
+    plan = [(method, dict(arguments)) for method, arguments in employee_processor.plan]
+
+    TimesheetEmployeeProcessor(lazy=True)\
+        .load_data_from_csv(os.path.join(DATA_DIRPATH, 'timesheets.csv'), schema=TIMESHEET_SCHEMA)\
+        .merge_data(employee_processor, left_on='employee_id', right_on='employe_id')\
+        .filter_valid_data()\
+        .select_fields(['employee_id', 'branch_id', 'salary'])\
+        .get_data()
+
+    assert employee_processor.plan == plan
+    assert list(employee_processor.get_data().columns) == list(EMPLOYEE_SCHEMA)
+
+def test_lookup_join_matches_merge():
+    timesheets = pd.DataFrame({'employee_id': [3, 1, 9, 3, 5, 0], 'value': [1, 2, 3, 4, 5, 6]})
+    employees = pd.DataFrame({'employe_id': [5, 1, 3, 2], 'value': ['e', 'a', 'c', 'b']})
+    arguments = dict(left_on='employee_id', right_on='employe_id')
+
+    # Orphan timesheets are dropped and the common column gets the merge suffixes
+    result = TimesheetEmployeeProcessor(timesheets).merge_data(employees, engine='lookup', **arguments).get_data()
+
+    pd.testing.assert_frame_equal(result, pd.merge(timesheets, employees, **arguments))
+
+def test_lookup_join_falls_back_to_merge_for_sparse_or_duplicate_keys():
+    assert salary_processor.build_dimension_index(pd.Series([1, 1 << 40])) is None
+    assert salary_processor.build_dimension_index(pd.Series([1, 2, 2])) is None
+    assert salary_processor.build_dimension_index(pd.Series(['1', '2'])) is None
+
+    timesheets = pd.DataFrame({'employee_id': [2, 1 << 40, 2]})
+    employees = pd.DataFrame({'employee_id': [1 << 40, 2], 'salary': [10, 20]})
+    result = TimesheetEmployeeProcessor(timesheets).merge_data(employees, on='employee_id', engine='lookup').get_data()
+
+    pd.testing.assert_frame_equal(result, pd.merge(timesheets, employees, on='employee_id'))
+
+def test_lookup_join_matches_merge_on_csv_data():
+    employees = TimesheetEmployeeProcessor()\
+        .load_data_from_csv(os.path.join(DATA_DIRPATH, 'employees.csv'), schema=EMPLOYEE_SCHEMA)\
+        .remove_duplicate_data(partitioning_keys=['employe_id', 'branch_id'], ordering_key='salary', ascending_order=False)\
+        .get_data()
+    arguments = dict(left_on='employee_id', right_on='employe_id')
+    processor = TimesheetEmployeeProcessor()\
+        .load_data_from_csv(os.path.join(DATA_DIRPATH, 'timesheets.csv'), schema=TIMESHEET_SCHEMA, chunksize=5000)\
+        .merge_data(employees, engine='lookup', **arguments)
+    expected = pd.merge(TimesheetEmployeeProcessor().load_data_from_csv(os.path.join(DATA_DIRPATH, 'timesheets.csv'), schema=TIMESHEET_SCHEMA).get_data(), employees, **arguments)
+
+    pd.testing.assert_frame_equal(processor.get_data().reset_index(drop=True), expected)
+
+def sort_rows(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values(list(df.columns), ignore_index=True)
+
+def test_grace_join_matches_merge_with_nested_spills(tmp_path):
+    timesheets = TimesheetEmployeeProcessor().load_data_from_csv(os.path.join(DATA_DIRPATH, 'timesheets.csv'), schema=TIMESHEET_SCHEMA).get_data()
+    employees = TimesheetEmployeeProcessor().load_data_from_csv(os.path.join(DATA_DIRPATH, 'employees.csv'), schema=EMPLOYEE_SCHEMA).get_data()
+    arguments = dict(left_on='employee_id', right_on='employe_id')
+    expected = sort_rows(pd.merge(timesheets, employees, **arguments))
+
+    # Duplicate employe_id rows are joined like pd.merge, and a 100 B budget splits every right bucket again
+    for memory_budget in (None, 100):
+        employee_processor = TimesheetEmployeeProcessor().load_data_from_csv(os.path.join(DATA_DIRPATH, 'employees.csv'), schema=EMPLOYEE_SCHEMA, chunksize=50)
+        processor = TimesheetEmployeeProcessor()\
+            .load_data_from_csv(os.path.join(DATA_DIRPATH, 'timesheets.csv'), schema=TIMESHEET_SCHEMA, chunksize=5000)\
+            .merge_data(employee_processor, engine='grace', memory_budget=memory_budget, spill_dir=str(tmp_path), **arguments)
+
+        assert processor.is_streaming()
+        pd.testing.assert_frame_equal(sort_rows(processor.get_data()), expected)
+
+    assert os.listdir(tmp_path) == []
+
+def test_grace_join_rejects_outer_joins():
+    with pytest.raises(ValueError, match="only supports inner join"):
+        TimesheetEmployeeProcessor(pd.DataFrame({'key': [1]})).merge_data(pd.DataFrame({'key': [1]}), on='key', how='left', engine='grace')
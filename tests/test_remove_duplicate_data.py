@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import salary_processor
+from salary_processor import EMPLOYEE_SCHEMA, TIMESHEET_SCHEMA, TimesheetEmployeeProcessor
+
+DATA_DIRPATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+def deduplicate(df: pd.DataFrame, **kwargs) -> pd.DataFrame:
+    result = TimesheetEmployeeProcessor(df).remove_duplicate_data(**kwargs).get_data()
+    return result.sort_values(list(result.columns), ignore_index=True)
+
+@pytest.mark.parametrize('ascending_order', [True, False])
+def test_sort_engine_matches_groupby_with_ties_and_missing_values(ascending_order):
+    df = pd.DataFrame({
+        'key1': [1, 1, 1, 2, 2, None, None, 3, 3],
+        'key2': ['a', 'a', 'b', 'a', 'a', 'x', 'x', None, 'c'],
+        'rank': [3, np.nan, 2, 5, 5, 1, 2, np.nan, 4],
+        'value': range(9),
+    })
+    arguments = dict(partitioning_keys=['key1', 'key2'], ordering_key='rank', ascending_order=ascending_order)
+
+    pd.testing.assert_frame_equal(deduplicate(df, engine='sort', **arguments), deduplicate(df, engine='groupby', **arguments))
+
+@pytest.mark.parametrize('pathfile, schema, arguments', [
+    ('timesheets.csv', TIMESHEET_SCHEMA, dict(partitioning_keys=['employee_id', 'date'], ordering_key='timesheet_id')),
+    ('employees.csv', EMPLOYEE_SCHEMA, dict(partitioning_keys=['employe_id', 'branch_id'], ordering_key='salary', ascending_order=False)),
+])
+def test_sort_engine_matches_groupby_on_csv_data(pathfile, schema, arguments):
+    df = TimesheetEmployeeProcessor().load_data_from_csv(os.path.join(DATA_DIRPATH, pathfile), schema=schema).compact_dtypes().get_data()
+
+    pd.testing.assert_frame_equal(deduplicate(df, engine='sort', **arguments), deduplicate(df, engine='groupby', **arguments))
+
+@pytest.mark.parametrize('engine', ['sort', 'groupby'])
+def test_streaming_and_out_of_core_match_in_memory(tmp_path, engine):
+    pathfile = os.path.join(DATA_DIRPATH, 'timesheets.csv')
+    arguments = dict(partitioning_keys=['employee_id', 'date'], ordering_key='timesheet_id', engine=engine)
+    expected = deduplicate(TimesheetEmployeeProcessor().load_data_from_csv(pathfile, schema=TIMESHEET_SCHEMA).get_data(), **arguments)
+
+    for options in (dict(), dict(memory_budget=1 << 18, spill_dir=str(tmp_path))):
+        processor = TimesheetEmployeeProcessor()\
+            .load_data_from_csv(pathfile, schema=TIMESHEET_SCHEMA, chunksize=5000)\
+            .remove_duplicate_data(**arguments, **options)
+        result = processor.get_data()
+        pd.testing.assert_frame_equal(result.sort_values(list(result.columns), ignore_index=True), expected)
+
+    # Spill files are removed once their chunks are consumed
+    assert os.listdir(tmp_path) == []
+
+def test_buckets_over_budget_are_spilled_again(tmp_path, monkeypatch):
+    levels = []
+    spill_buckets = salary_processor._spill_buckets
+    monkeypatch.setattr(salary_processor, '_spill_buckets', lambda *args: levels.append(args[-1]) or spill_buckets(*args))
+    monkeypatch.setattr(salary_processor, 'SPILL_FANOUT', 4)
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'key': np.tile(np.arange(8000), 2), 'rank': rng.permutation(16000)})
+    arguments = dict(partitioning_keys='key', ordering_key='rank')
+
+    # Buckets of the first spill hold about 32 KB, so a budget of 16 KB spills every one of them again
+    result = TimesheetEmployeeProcessor(df).remove_duplicate_data(memory_budget=1 << 14, spill_dir=str(tmp_path), **arguments).get_data()
+
+    assert max(levels) == 1
+    pd.testing.assert_frame_equal(result.sort_values('key', ignore_index=True), deduplicate(df, **arguments))
+
+def test_unknown_engine_is_rejected():
+    with pytest.raises(ValueError, match='Unknown deduplication engine'):
+        TimesheetEmployeeProcessor(pd.DataFrame({'key': [1], 'rank': [1]})).remove_duplicate_data('key', 'rank', engine='hash')
+
+def test_dedup_index_flags_rows_superseded_by_earlier_runs(tmp_path):
+    index_pathfile = os.path.join(tmp_path, 'dedup.sqlite')
+    arguments = dict(partitioning_keys=['employee_id', 'date'], ordering_key='timesheet_id', dedup_index=index_pathfile, on_superseded='flag')
+    first = pd.DataFrame({'timesheet_id': [10, 20], 'employee_id': [1, 2], 'date': pd.to_datetime(['2019-10-01', '2019-10-01'])})
+    late = pd.DataFrame({'timesheet_id': [30, 5], 'employee_id': [1, 2], 'date': pd.to_datetime(['2019-10-01', '2019-10-01'])})
+
+    assert not TimesheetEmployeeProcessor(first).remove_duplicate_data(**arguments).get_data()['is_superseded'].any()
+    assert list(TimesheetEmployeeProcessor(late).remove_duplicate_data(**arguments).get_data()['is_superseded']) == [True, False]
+
+    # The winners of the late rows are saved, so a rerun of the first rows is superseded by them
+    assert list(TimesheetEmployeeProcessor(first).remove_duplicate_data(**arguments).get_data()['is_superseded']) == [False, True]
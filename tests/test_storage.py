@@ -0,0 +1,234 @@
+import os
+import shutil
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from salary_processor import (
+    EMPLOYEE_SCHEMA, TIMESHEET_SCHEMA, TimesheetEmployeeProcessor,
+    build_date_index, build_partition_store, parse_dates, parse_time_seconds,
+    read_appended_csv, read_csv, read_csv_by_date, read_csv_parallel,
+)
+
+DATA_DIRPATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+TIMESHEET_ROWS = [
+    '"timesheet_id","employee_id","date","checkin","checkout"\n',
+    '1,1,2019-10-01,"08:00:00","16:00:00"\n',
+    '2,2,2019-10-01,"09:00:00",\n',
+    '3,1,2019-10-02,"08:00:00","17:00:00"\n',
+]
+
+def write(pathfile, text: str, mode: str = 'w') -> None:
+    with open(pathfile, mode, newline='') as file:
+        file.write(text)
+
+def test_schema_types_dates_and_times(tmp_path):
+    pathfile = os.path.join(tmp_path, 'timesheets.csv')
+    write(pathfile, ''.join(TIMESHEET_ROWS))
+
+    data = TimesheetEmployeeProcessor().load_data_from_csv(pathfile, schema=TIMESHEET_SCHEMA).get_data()
+
+    assert pd.api.types.is_datetime64_any_dtype(data['date'])
+    assert data['checkin'].tolist() == [28800, 32400, 28800]
+    assert data['checkout'].isna().tolist() == [False, True, False]
+
+def test_filter_by_date_accepts_date_on_typed_and_untyped_columns(tmp_path):
+    pathfile = os.path.join(tmp_path, 'timesheets.csv')
+    write(pathfile, ''.join(TIMESHEET_ROWS))
+
+    for schema in (TIMESHEET_SCHEMA, None):
+        data = TimesheetEmployeeProcessor()\
+            .load_data_from_csv(pathfile, schema=schema)\
+            .filter_timesheets_by_date(date(2019, 10, 2))\
+            .get_data()
+        assert data['timesheet_id'].tolist() == [3]
+
+def test_streaming_matches_whole_file():
+    pathfile = os.path.join(DATA_DIRPATH, 'timesheets.csv')
+
+    def load(**options) -> pd.DataFrame:
+        return TimesheetEmployeeProcessor()\
+            .load_data_from_csv(pathfile, schema=TIMESHEET_SCHEMA, **options)\
+            .filter_timesheets_by_date('2019-10-01')\
+            .remove_duplicate_data(partitioning_keys=['employee_id', 'date'], ordering_key='timesheet_id')\
+            .get_data()\
+            .sort_values('timesheet_id', ignore_index=True)
+
+    pd.testing.assert_frame_equal(load(chunksize=5000), load())
+
+def test_columnar_cache_is_reused_until_the_csv_changes(tmp_path):
+    pathfile = os.path.join(tmp_path, 'timesheets.csv')
+    cache_dirpath = os.path.join(tmp_path, 'cache')
+    cache_pathfile = os.path.join(cache_dirpath, 'timesheets.parquet')
+    write(pathfile, ''.join(TIMESHEET_ROWS))
+
+    def load() -> pd.DataFrame:
+        return TimesheetEmployeeProcessor().load_data_from_csv(pathfile, schema=TIMESHEET_SCHEMA, cache_dir=cache_dirpath).get_data()
+
+    pd.testing.assert_frame_equal(load(), read_csv(pathfile, schema=TIMESHEET_SCHEMA))
+    built = os.stat(cache_pathfile).st_mtime_ns
+
+    # Touching the CSV changes its mtime only, the content hash keeps the cache
+    os.utime(pathfile, ns=(built + 10**9, built + 10**9))
+    load()
+    assert os.stat(cache_pathfile).st_mtime_ns == built
+
+    write(pathfile, '4,2,2019-10-02,"08:30:00","17:30:00"\n', 'a')
+    assert load()['timesheet_id'].tolist() == [1, 2, 3, 4]
+
+def test_partition_store_reads_only_the_partition_of_the_date(tmp_path):
+    pathfile = os.path.join(DATA_DIRPATH, 'timesheets.csv')
+    store_dirpath = os.path.join(tmp_path, 'timesheets')
+    build_partition_store(pathfile, store_dirpath)
+    partition_dirpath = os.path.join(store_dirpath, 'year=2019', 'month=10', 'date=2019-10-01')
+    assert os.listdir(partition_dirpath)
+
+    expected = TimesheetEmployeeProcessor()\
+        .load_data_from_csv(pathfile, schema=TIMESHEET_SCHEMA)\
+        .filter_timesheets_by_date('2019-10-01')\
+        .get_data()
+    for chunksize in (None, 20):
+        data = TimesheetEmployeeProcessor().load_data_from_partitions(store_dirpath, date='2019-10-01', chunksize=chunksize).get_data()
+        pd.testing.assert_frame_equal(data.sort_values('timesheet_id', ignore_index=True), expected.sort_values('timesheet_id', ignore_index=True))
+
+    # A date without partition gives typed empty data, and an unchanged CSV does not rebuild the store
+    data = TimesheetEmployeeProcessor().load_data_from_partitions(store_dirpath, date='2030-01-01').get_data()
+    assert len(data) == 0 and list(data.columns) == list(expected.columns)
+    built = os.stat(partition_dirpath).st_mtime_ns
+    build_partition_store(pathfile, store_dirpath)
+    assert os.stat(partition_dirpath).st_mtime_ns == built
+
+def test_date_index_seeks_the_rows_of_the_date(tmp_path):
+    pathfile = os.path.join(tmp_path, 'timesheets.csv')
+    shutil.copyfile(os.path.join(DATA_DIRPATH, 'timesheets.csv'), pathfile)
+
+    expected = TimesheetEmployeeProcessor()\
+        .load_data_from_csv(pathfile, schema=TIMESHEET_SCHEMA)\
+        .filter_timesheets_by_date('2019-10-01')\
+        .get_data()\
+        .reset_index(drop=True)
+    data = TimesheetEmployeeProcessor().load_data_from_csv(pathfile, schema=TIMESHEET_SCHEMA, date='2019-10-01').get_data()
+    pd.testing.assert_frame_equal(data.reset_index(drop=True), expected)
+
+    # Appended rows only extend the saved index, a rewritten file rebuilds it
+    offset = build_date_index(pathfile)['offset']
+    write(pathfile, '999999,1,2019-10-01,"08:00:00","16:00:00"\n', 'a')
+    index = build_date_index(pathfile)
+    assert index['offset'] > offset
+    assert read_csv_by_date(pathfile, '2019-10-01', schema=TIMESHEET_SCHEMA)['timesheet_id'].tolist()[-1] == 999999
+
+    write(pathfile, ''.join(TIMESHEET_ROWS))
+    assert sorted(build_date_index(pathfile)['dates']) == ['2019-10-01', '2019-10-02']
+    assert read_csv_by_date(pathfile, '2019-10-01', schema=TIMESHEET_SCHEMA)['timesheet_id'].tolist() == [1, 2]
+
+def test_last_row_without_line_break_is_read(tmp_path):
+    pathfile = os.path.join(tmp_path, 'timesheets.csv')
+    write(pathfile, ''.join(TIMESHEET_ROWS) + '4,2,2019-10-02,"08:30:00","17:30:00"')
+
+    data, checkpoint = read_appended_csv(pathfile, schema=TIMESHEET_SCHEMA)
+    assert data['timesheet_id'].tolist() == [1, 2, 3, 4]
+    assert checkpoint['rows'] == 4
+    assert read_csv_by_date(pathfile, '2019-10-02', schema=TIMESHEET_SCHEMA)['timesheet_id'].tolist() == [3, 4]
+
+    # Once the row gets its line break, only the appended rows are read
+    write(pathfile, '\n5,1,2019-10-03,"08:00:00","16:00:00"\n', 'a')
+    data, checkpoint = read_appended_csv(pathfile, checkpoint, schema=TIMESHEET_SCHEMA)
+    assert data['timesheet_id'].tolist() == [5]
+    assert checkpoint['rows'] == 5
+    assert read_csv_by_date(pathfile, '2019-10-02', schema=TIMESHEET_SCHEMA)['timesheet_id'].tolist() == [3, 4]
+    assert read_csv_by_date(pathfile, '2019-10-03', schema=TIMESHEET_SCHEMA)['timesheet_id'].tolist() == [5]
+
+def test_appended_rows_are_streamed_in_chunks(tmp_path):
+    pathfile = os.path.join(tmp_path, 'timesheets.csv')
+    write(pathfile, ''.join(TIMESHEET_ROWS))
+
+    chunks, checkpoint = read_appended_csv(pathfile, schema=TIMESHEET_SCHEMA, chunksize=2)
+    assert [chunk['timesheet_id'].tolist() for chunk in chunks] == [[1, 2], [3]]
+    assert checkpoint['rows'] == 3
+
+def test_appended_rows_are_loaded_from_the_saved_checkpoint(tmp_path):
+    pathfile = os.path.join(tmp_path, 'timesheets.csv')
+    checkpoint_pathfile = os.path.join(tmp_path, 'timesheets.checkpoint.json')
+    write(pathfile, ''.join(TIMESHEET_ROWS))
+
+    def load() -> TimesheetEmployeeProcessor:
+        return TimesheetEmployeeProcessor().load_appended_data_from_csv(pathfile, checkpoint_pathfile, schema=TIMESHEET_SCHEMA)
+
+    processor = load()
+    assert processor.checkpoint['full_rescan']
+    write(pathfile, '4,2,2019-10-02,"08:30:00","17:30:00"\n', 'a')
+
+    # Rows are read again until their checkpoint is saved
+    assert load().get_data()['timesheet_id'].tolist() == [1, 2, 3, 4]
+    processor.save_checkpoint()
+    processor = load()
+    assert processor.get_data()['timesheet_id'].tolist() == [4]
+    assert not processor.checkpoint['full_rescan']
+
+    # A rewritten file is loaded again from the beginning
+    processor.save_checkpoint()
+    write(pathfile, ''.join(TIMESHEET_ROWS[:2]) + '9,1,2019-10-02,"08:00:00","17:00:00"\n')
+    processor = load()
+    assert processor.get_data()['timesheet_id'].tolist() == [1, 9]
+    assert processor.checkpoint['full_rescan']
+
+def test_partition_store_adds_appended_rows(tmp_path):
+    pathfile = os.path.join(tmp_path, 'timesheets.csv')
+    store_dirpath = os.path.join(tmp_path, 'timesheets')
+    write(pathfile, ''.join(TIMESHEET_ROWS))
+    build_partition_store(pathfile, store_dirpath)
+    write(pathfile, '4,2,2019-10-02,"08:30:00","17:30:00"\n5,1,2019-10-03,"08:00:00","16:00:00"\n', 'a')
+    build_partition_store(pathfile, store_dirpath)
+
+    def timesheet_ids(date) -> list:
+        data = TimesheetEmployeeProcessor().load_data_from_partitions(store_dirpath, date=date).get_data()
+        return sorted(data['timesheet_id'].tolist())
+
+    assert timesheet_ids('2019-10-01') == [1, 2]
+    assert timesheet_ids('2019-10-02') == [3, 4]
+    assert timesheet_ids('2019-10-03') == [5]
+
+@pytest.mark.parametrize('schema', [None, TIMESHEET_SCHEMA])
+def test_read_csv_parallel_matches_read_csv(schema):
+    pathfile = os.path.join(DATA_DIRPATH, 'timesheets.csv')
+    data = TimesheetEmployeeProcessor().load_data_from_csv(pathfile, schema=schema, workers=3).get_data()
+
+    pd.testing.assert_frame_equal(data, read_csv(pathfile, schema=schema))
+
+def test_read_csv_parallel_reconciles_types_inferred_by_ranges(tmp_path):
+    # Values of the first rows fit in integers and missing dates, later rows have a decimal salary and a resign_date
+    pathfile = os.path.join(tmp_path, 'employees.csv')
+    rows = [f'{employee_id},1,7500000,2019-01-01,\n' for employee_id in range(1, 20001)]
+    rows[-1] = '20000,1,7500000,2019-01-01,2020-01-01\n'
+    write(pathfile, '"employe_id","branch_id","salary","join_date","resign_date"\n' + ''.join(rows))
+
+    for schema in (None, EMPLOYEE_SCHEMA):
+        pd.testing.assert_frame_equal(read_csv_parallel(pathfile, schema=schema, workers=4), read_csv(pathfile, schema=schema))
+
+    write(pathfile, '"employe_id","branch_id","salary","join_date","resign_date"\n' + ''.join(rows[:-1]) + '20000,1,7500000.5,2019-01-01,\n')
+    pd.testing.assert_frame_equal(read_csv_parallel(pathfile, workers=4), read_csv(pathfile))
+
+def test_parse_time_seconds_matches_to_timedelta():
+    values = pd.Series(['08:00:00', '23:59:59', '00:00:00', None, '', '8:05:00', '08:60:00', '08:00', '24:00:00', 'late', '08:00:00'])
+
+    expected = pd.to_timedelta(values, errors='coerce').dt.total_seconds().astype('Int32')
+    pd.testing.assert_series_equal(parse_time_seconds(values), expected)
+
+def test_parse_dates_matches_to_datetime():
+    values = pd.Series(['2019-10-01', '2020-02-29', '2019-02-29', '2019-13-01', '2019-00-10', None, '', '2019/10/01', '20191001', '2019-10-01'])
+
+    expected = pd.Series([pd.to_datetime(value, errors='coerce') for value in values], dtype='datetime64[ns]')
+    pd.testing.assert_series_equal(parse_dates(values), expected)
+
+def test_parse_dates_rejects_years_outside_datetime64_range():
+    # Years outside 1678-2261 are not built from their digits, where they would wrap around
+    values = pd.Series(['9999-12-31', '2300-01-01', '0000-01-01', '1677-01-01', '2262-04-11', '1678-01-01', '2261-12-31'])
+
+    dates = parse_dates(values)
+
+    assert dates.isna().tolist() == [True, True, True, True, False, False, False]
+    assert dates.dt.year.dropna().astype(int).tolist() == [2262, 1678, 2261]
+    assert dates.dtype == np.dtype('datetime64[ns]')
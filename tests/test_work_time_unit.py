@@ -0,0 +1,86 @@
+import os
+
+import pandas as pd
+import pytest
+
+from salary_processor import EMPLOYEE_SCHEMA, TIMESHEET_SCHEMA, TimesheetEmployeeProcessor, apply_schema
+
+DATA_DIRPATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+@pytest.fixture
+def employee_timesheet_data():
+    """Joined timesheets of one employee working 8 hours on 2 days, with a monthly salary of 38,400."""
+    timesheets = apply_schema(pd.DataFrame({
+        'timesheet_id': [1, 2],
+        'employee_id': [1, 1],
+        'date': ['2019-10-01', '2019-10-02'],
+        'checkin': ['08:00:00', '09:30:00'],
+        'checkout': ['16:00:00', '17:30:00'],
+    }), TIMESHEET_SCHEMA)
+    employees = pd.DataFrame({'employe_id': [1], 'branch_id': [1], 'salary': [38400], 'join_date': ['2019-01-01'], 'resign_date': [None]})
+    return pd.merge(timesheets, employees, left_on='employee_id', right_on='employe_id')
+
+def salary_per_hour_in_steps(df: pd.DataFrame, work_time_unit: str) -> pd.DataFrame:
+    # Work hour and salary of every branch month are joined by pd.merge, as the baseline script did
+    work_hour_data = TimesheetEmployeeProcessor(df, work_time_unit=work_time_unit)\
+        .calculate_work_hour()\
+        .sum_work_hour()\
+        .get_data()
+    salary_data = TimesheetEmployeeProcessor(df)\
+        .get_salary_per_employee()\
+        .sum_salary_per_branch()\
+        .get_data()
+    joined_work_hour_salary_data = pd.merge(work_hour_data, salary_data, on=['year', 'month', 'branch_id'])
+    return TimesheetEmployeeProcessor(joined_work_hour_salary_data, work_time_unit=work_time_unit)\
+        .calculate_salary_per_hour()\
+        .get_data()
+
+@pytest.mark.parametrize('work_time_unit, total_work_hour', [('hour', 16.0), ('second', 57600)])
+def test_work_time_unit_survives_merge(employee_timesheet_data, work_time_unit, total_work_hour):
+    result = salary_per_hour_in_steps(employee_timesheet_data, work_time_unit)
+
+    assert result['total_work_hour'].tolist() == [total_work_hour]
+    assert result['salary_per_hour'].tolist() == [2400.0]
+
+@pytest.mark.parametrize('work_time_unit', ['hour', 'second'])
+def test_aggregate_matches_steps(employee_timesheet_data, work_time_unit):
+    result = TimesheetEmployeeProcessor(employee_timesheet_data, work_time_unit=work_time_unit)\
+        .aggregate_salary_per_hour()\
+        .get_data()
+
+    assert result['salary_per_hour'].tolist() == salary_per_hour_in_steps(employee_timesheet_data, work_time_unit)['salary_per_hour'].tolist()
+
+def test_work_time_units_give_same_salary_per_hour():
+    employees = TimesheetEmployeeProcessor()\
+        .load_data_from_csv(os.path.join(DATA_DIRPATH, 'employees.csv'), schema=EMPLOYEE_SCHEMA)\
+        .remove_duplicate_data(partitioning_keys=['employe_id', 'branch_id'], ordering_key='salary', ascending_order=False)\
+        .get_data()
+    results = {}
+    for work_time_unit in ('hour', 'second'):
+        results[work_time_unit] = TimesheetEmployeeProcessor(work_time_unit=work_time_unit)\
+            .load_data_from_csv(os.path.join(DATA_DIRPATH, 'timesheets.csv'), schema=TIMESHEET_SCHEMA)\
+            .remove_duplicate_data(partitioning_keys=['employee_id', 'date'], ordering_key='timesheet_id')\
+            .merge_data(employees, left_on='employee_id', right_on='employe_id')\
+            .filter_valid_data()\
+            .aggregate_salary_per_hour()\
+            .select_fields(['year', 'month', 'branch_id', 'salary_per_hour'])\
+            .get_data()
+
+    pd.testing.assert_frame_equal(results['hour'], results['second'], check_exact=False, atol=0.01)
+
+def test_second_unit_does_not_depend_on_chunking():
+    employees = TimesheetEmployeeProcessor()\
+        .load_data_from_csv(os.path.join(DATA_DIRPATH, 'employees.csv'), schema=EMPLOYEE_SCHEMA)\
+        .remove_duplicate_data(partitioning_keys=['employe_id', 'branch_id'], ordering_key='salary', ascending_order=False)\
+        .get_data()
+    results = []
+    for chunksize in (None, 1000):
+        result = TimesheetEmployeeProcessor(work_time_unit='second')\
+            .load_data_from_csv(os.path.join(DATA_DIRPATH, 'timesheets.csv'), schema=TIMESHEET_SCHEMA, chunksize=chunksize)\
+            .merge_data(employees, left_on='employee_id', right_on='employe_id')\
+            .filter_valid_data()\
+            .aggregate_salary_per_hour()\
+            .get_data()
+        results.append(result.reset_index(drop=True))
+
+    pd.testing.assert_frame_equal(results[0], results[1])